@@ -31,6 +31,12 @@ input_modality = dict(
     use_external=False,
 )
 file_client_args = dict(backend='disk')
+# 训练时的点云缓存, 关键帧与每一帧作为sweep的读取共用, 默认关闭. 例如
+# dict(max_bytes=8 << 30, scope='shared') 为所有worker共享的8GiB /dev/shm 缓存,
+# dict(max_bytes=2 << 30, scope='worker') 为每个worker各2GiB的进程内缓存.
+# 进程内缓存只有在 data 中设置 persistent_workers=True 时才能跨epoch保留,
+# 否则每个epoch重建worker, 只有同一epoch内作为sweep重复读取的帧能够命中
+points_cache = None
 
 db_sampler = dict(
     data_root=data_root,
@@ -75,19 +81,21 @@ db_sampler = dict(
 
 train_pipeline = [
     dict(
-        type='LoadPointsFromFile',
+        type='LoadPointsFromFileExtension',
         coord_type='LIDAR',
         load_dim=5,
         use_dim=5,
         file_client_args=file_client_args,
+        cache=points_cache,
     ),
     dict(
-        type='LoadPointsFromMultiSweeps',
+        type='LoadPointsFromMultiSweepsExtension',
         sweeps_num=9,
         use_dim=[0, 1, 2, 3, 4],
         file_client_args=file_client_args,
         pad_empty_sweeps=True,
         remove_close=True,
+        cache=points_cache,
     ),
     dict(type='LoadAnnotations3D', with_bbox_3d=True, with_label_3d=True),
     dict(type='ObjectSample', db_sampler=db_sampler),
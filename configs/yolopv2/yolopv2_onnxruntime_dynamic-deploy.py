@@ -0,0 +1,65 @@
+# Copyright (c) windzu. All rights reserved.
+"""
+Deploy Settings
+---------------
+tools/deploy.py 将YOLOPV2导出为一个onnx, 包含检测、可行驶区域与车道线三个输出:
+    1. dets (batch, K, 5) 与 labels (batch, K), 图中已经做了NMS, 填充部分的label为-1
+    2. drivable, lane (batch, H, W) uint8 label map, 尺寸为pad后的输入尺寸
+
+输出由模型的 test_cfg 决定:
+    - test_cfg.tasks 中未启用的任务不会导出, output_names 需要对应删除
+    - test_cfg.with_nms=False 时, 检测输出为 bboxes (batch, num_priors, 4) 与
+      scores (batch, num_priors, num_classes), output_names 需要改为
+      ['bboxes', 'scores', 'drivable', 'lane']
+"""
+onnx_config = dict(
+    type='onnx',
+    export_params=True,
+    keep_initializers_as_inputs=False,
+    opset_version=11,
+    save_file='end2end.onnx',
+    input_names=['input'],
+    output_names=['dets', 'labels', 'drivable', 'lane'],
+    input_shape=None,
+    optimize=True,
+    # batch维度是动态的
+    dynamic_axes=dict(
+        input={
+            0: 'batch',
+            2: 'height',
+            3: 'width'
+        },
+        dets={
+            0: 'batch',
+        },
+        labels={
+            0: 'batch',
+        },
+        drivable={
+            0: 'batch',
+            1: 'height',
+            2: 'width'
+        },
+        lane={
+            0: 'batch',
+            1: 'height',
+            2: 'width'
+        },
+    ),
+)
+# NMS的参数在模型的 test_cfg 中, 这里只是为了兼容mmdeploy
+codebase_config = dict(
+    type='mmdet',
+    task='ObjectDetection',
+    model_type='end2end',
+    post_processing=dict(
+        score_threshold=0.01,
+        confidence_threshold=0.005,
+        iou_threshold=0.65,
+        max_output_boxes_per_class=100,
+        pre_top_k=-1,
+        keep_top_k=100,
+        background_label_id=-1,
+    ),
+)
+backend_config = dict(type='onnxruntime')
@@ -142,7 +142,18 @@ model = dict(
     train_cfg=dict(assigner=dict(type='SimOTAAssigner', center_radius=2.5)),
     # In order to align the source code, the threshold of the val phase is
     # 0.01, and the threshold of the test phase is 0.001.
-    test_cfg=dict(score_thr=0.01, nms=dict(type='nms', iou_threshold=0.65)),
+    # tasks: 测试时输出的任务, 未启用的head不会被计算
+    # with_nms, max_per_img: 导出onnx时是否在图中做NMS, 以及每张图像输出的框数
+    # seg_output: full 为原图尺寸的label map; native_label, native_logit 为head
+    #   原始stride的label map或logits, 由使用方按需插值, 见 LowResSegMap
+    test_cfg=dict(
+        score_thr=0.01,
+        nms=dict(type='nms', iou_threshold=0.65),
+        tasks=('bbox', 'drivable', 'lane'),
+        with_nms=True,
+        max_per_img=100,
+        seg_output='full',
+    ),
 )
 """
 Schedules Settings
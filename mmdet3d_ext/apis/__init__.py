@@ -1,6 +1,7 @@
 # Copyright (c) windzu. All rights reserved.
-from .inference import inference_detector
+from .inference import Detector3DInferencer, inference_detector
 
 __all__ = [
+    'Detector3DInferencer',
     'inference_detector',
 ]
@@ -1,5 +1,6 @@
 # Copyright (c) windzu. All rights reserved.
 
+from collections import deque
 from copy import deepcopy
 
 import numpy as np
@@ -25,53 +26,202 @@ def convert_SyncBN(config):
                 convert_SyncBN(config[item])
 
 
+class Detector3DInferencer:
+    """Stateful point cloud inferencer for the ros node.
+
+    ``inference_detector`` rebuilds the test pipeline and the box types for
+    every frame. This class builds them, the device placement and the static
+    part of the input dict only once, so that ``__call__`` only has to run
+    the pipeline and the model.
+
+    Args:
+        model (nn.Module): The loaded detector. Its ``cfg.data.test.pipeline``
+            should already load points from ``results['pc']``, e.g. use
+            ``LoadPointsFromPointCloud2``.
+        cfg (mmcv.Config, optional): Model config, defaults to ``model.cfg``.
+        device (torch.device, optional): Device of the model inputs, defaults
+            to the device of the model parameters. Both are needed for
+            backend models which have neither ``cfg`` nor parameters.
+    """
+
+    # fields which the pipeline may append to, so they must be fresh per call
+    _LIST_FIELDS = (
+        'sweeps',
+        'img_fields',
+        'bbox3d_fields',
+        'pts_mask_fields',
+        'pts_seg_fields',
+        'bbox_fields',
+        'mask_fields',
+        'seg_fields',
+    )
+
+    def __init__(self, model, cfg=None, device=None):
+        self.model = model
+        cfg = model.cfg if cfg is None else cfg
+        if device is None:
+            device = next(model.parameters()).device
+        self.device = torch.device(device)
+        self.is_cuda = self.device.type == 'cuda'
+
+        # build the data pipeline
+        self.test_pipeline = Compose(deepcopy(cfg.data.test.pipeline))
+        self.box_type_3d, self.box_mode_3d = get_box_type(
+            cfg.data.test.box_type_3d)
+
+        self._data_template = dict(
+            pts_filename='none',
+            box_type_3d=self.box_type_3d,
+            box_mode_3d=self.box_mode_3d,
+        )
+        # for ScanNet demo we need axis_align_matrix
+        self._axis_align_matrix = np.eye(4)
+
+    def prepare_data(self, pc, pose=None):
+        """Build the pipeline input dict of a single frame.
+
+        Args:
+            pc (PointCloud2): ros pointcloud.
+            pose (np.ndarray, optional): 4x4 transform from the lidar to a
+                fixed frame at the time of ``pc``, used for the ego-motion
+                compensation of multi-sweep inputs. Defaults to None.
+
+        Returns:
+            dict: Input dict of the test pipeline.
+        """
+        data = self._data_template.copy()
+        for key in self._LIST_FIELDS:
+            data[key] = []
+        data['pc'] = pc
+        data['ann_info'] = dict(axis_align_matrix=self._axis_align_matrix)
+        # set timestamp = 0
+        data['timestamp'] = [0]
+        if pose is not None:
+            data['pose'] = pose
+        return data
+
+    def collate(self, data):
+        """Collate a pipeline output and move it to the model device.
+
+        Args:
+            data (dict): Output of the test pipeline.
+
+        Returns:
+            dict: Model inputs.
+        """
+        data = collate([data], samples_per_gpu=1)
+        if self.is_cuda:
+            # scatter to specified GPU
+            data = scatter(data, [self.device.index])[0]
+        else:
+            # this is a workaround to avoid the bug of MMDataParallel
+            data['img_metas'] = data['img_metas'][0].data
+            data['points'] = data['points'][0].data
+        return data
+
+    def preprocess(self, pc, pose=None, stats=None):
+        """Run the test pipeline and collate a single frame.
+
+        Args:
+            pc (PointCloud2): ros pointcloud.
+            pose (np.ndarray, optional): 4x4 lidar pose of ``pc``.
+                Defaults to None.
+            stats (dict, optional): If given, updated with the
+                ``num_discarded_points`` of ``pc`` reported by the loading
+                transform, which is dropped by ``Collect3D``.
+                Defaults to None.
+
+        Returns:
+            dict: Model inputs.
+        """
+        data = self.prepare_data(pc, pose)
+        # the loading transform adds its outputs to ``data`` in place
+        inputs = self.collate(self.test_pipeline(data))
+        if stats is not None and 'num_discarded_points' in data:
+            stats['num_discarded_points'] = data['num_discarded_points']
+        return inputs
+
+    def reset(self):
+        """Clear the state kept by the pipeline between frames, e.g. the
+        buffered sweeps of ``LoadPointsFromPointCloud2MultiSweeps``."""
+        for transform in self.test_pipeline.transforms:
+            if hasattr(transform, 'reset'):
+                transform.reset()
+
+    def _sweep_transforms(self):
+        return [
+            transform for transform in self.test_pipeline.transforms
+            if isinstance(getattr(transform, 'sweeps', None), deque)
+        ]
+
+    def new_sweeps(self):
+        """Empty sweep buffers for another point cloud stream.
+
+        Returns:
+            list[deque]: One buffer per multi-sweep transform, to be passed
+                to :meth:`swap_sweeps`.
+        """
+        return [
+            deque(maxlen=transform.sweeps.maxlen)
+            for transform in self._sweep_transforms()
+        ]
+
+    def swap_sweeps(self, sweeps):
+        """Install the sweep buffers of a stream, so that frames of several
+        streams served by one inferencer are never mixed.
+
+        Args:
+            sweeps (list[deque]): Buffers returned by :meth:`new_sweeps`.
+
+        Returns:
+            list[deque]: The buffers installed before.
+        """
+        transforms = self._sweep_transforms()
+        previous = [transform.sweeps for transform in transforms]
+        for transform, buffer in zip(transforms, sweeps):
+            transform.sweeps = buffer
+        return previous
+
+    def forward(self, data):
+        """Run the model on collated inputs.
+
+        Args:
+            data (dict): Model inputs returned by :meth:`collate`.
+
+        Returns:
+            list[dict]: Predicted results.
+        """
+        with torch.no_grad():
+            return self.model(return_loss=False, rescale=True, **data)
+
+    def __call__(self, pc, pose=None):
+        """Inference point cloud with the detector.
+
+        Args:
+            pc (PointCloud2): ros pointcloud.
+            pose (np.ndarray, optional): 4x4 lidar pose of ``pc``.
+                Defaults to None.
+
+        Returns:
+            tuple: Predicted results and data from pipeline.
+        """
+        data = self.preprocess(pc, pose)
+        result = self.forward(data)
+        return result, data
+
+
 def inference_detector(model, pc):
     """Inference point cloud with the detector.
 
+    Note:
+        The pipeline is rebuilt on every call, use
+        :class:`Detector3DInferencer` to run a stream of frames.
+
     Args:
         model (nn.Module): The loaded detector.
-        pcd (str): ros pointcloud.
+        pc (PointCloud2): ros pointcloud.
 
     Returns:
         tuple: Predicted results and data from pipeline.
     """
-    cfg = model.cfg
-    device = next(model.parameters()).device  # model device
-
-    # build the data pipeline
-    test_pipeline = deepcopy(cfg.data.test.pipeline)
-    test_pipeline = Compose(test_pipeline)
-    box_type_3d, box_mode_3d = get_box_type(cfg.data.test.box_type_3d)
-
-    data = dict(
-        pts_filename='none',
-        pc=pc,
-        box_type_3d=box_type_3d,
-        box_mode_3d=box_mode_3d,
-        # for ScanNet demo we need axis_align_matrix
-        ann_info=dict(axis_align_matrix=np.eye(4)),
-        sweeps=[],
-        # set timestamp = 0
-        timestamp=[0],
-        img_fields=[],
-        bbox3d_fields=[],
-        pts_mask_fields=[],
-        pts_seg_fields=[],
-        bbox_fields=[],
-        mask_fields=[],
-        seg_fields=[],
-    )
-
-    data = test_pipeline(data)
-    data = collate([data], samples_per_gpu=1)
-    if next(model.parameters()).is_cuda:
-        # scatter to specified GPU
-        data = scatter(data, [device.index])[0]
-    else:
-        # this is a workaround to avoid the bug of MMDataParallel
-        data['img_metas'] = data['img_metas'][0].data
-        data['points'] = data['points'][0].data
-    # forward the model
-    with torch.no_grad():
-        result = model(return_loss=False, rescale=True, **data)
-    return result, data
+    return Detector3DInferencer(model)(pc)
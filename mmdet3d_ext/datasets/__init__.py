@@ -1,9 +1,18 @@
 # Copyright (c) windzu. All rights reserved.
-from .pipelines import LoadPointsFromFileExtension, LoadPointsFromPointCloud2
+from .pipelines import (LoadPointsFromFileExtension,
+                        LoadPointsFromMultiSweepsExtension,
+                        LoadPointsFromPointCloud2,
+                        LoadPointsFromPointCloud2MultiSweeps,
+                        LoadPointsFromShard)
+from .usd_columnar import USDColumnarAnnotations
 from .usd_dataset import USDDataset
 
 __all__ = [
     'USDDataset',
+    'USDColumnarAnnotations',
     'LoadPointsFromPointCloud2',
+    'LoadPointsFromPointCloud2MultiSweeps',
     'LoadPointsFromFileExtension',
+    'LoadPointsFromShard',
+    'LoadPointsFromMultiSweepsExtension',
 ]
@@ -1,8 +1,21 @@
 # Copyright (c) windzu. All rights reserved.
 
-from .loading import LoadPointsFromFileExtension, LoadPointsFromPointCloud2
+from .loading import (LoadPointsFromFileExtension,
+                      LoadPointsFromMultiSweepsExtension,
+                      LoadPointsFromPointCloud2,
+                      LoadPointsFromPointCloud2MultiSweeps,
+                      LoadPointsFromShard)
+from .points_cache import (LRUPointsCache, PointsCache, SharedPointsCache,
+                           build_points_cache)
 
 __all__ = [
     'LoadPointsFromPointCloud2',
+    'LoadPointsFromPointCloud2MultiSweeps',
     'LoadPointsFromFileExtension',
+    'LoadPointsFromShard',
+    'LoadPointsFromMultiSweepsExtension',
+    'PointsCache',
+    'LRUPointsCache',
+    'SharedPointsCache',
+    'build_points_cache',
 ]
@@ -1,9 +1,143 @@
 # Copyright (c) windzu. All rights reserved.
+import os
+from collections import deque
+
 import mmcv
 import numpy as np
+import torch
 from mmdet3d.core.points import get_points_type
 from mmdet3d.datasets.builder import PIPELINES
-from wadda.pypcd import pypcd
+from mmdet3d.datasets.pipelines import LoadPointsFromMultiSweeps
+
+from ..usd_shards import ShardReader
+from .points_cache import build_points_cache
+
+# sensor_msgs/PointField datatype -> numpy dtype
+POINT_FIELD_DTYPES = {
+    1: np.int8,
+    2: np.uint8,
+    3: np.int16,
+    4: np.uint16,
+    5: np.int32,
+    6: np.uint32,
+    7: np.float32,
+    8: np.float64,
+}
+
+
+def pointcloud2_to_structured(msg):
+    """Build a structured array view over the data of a PointCloud2 msg.
+
+    The view shares memory with ``msg.data``, no point is copied, unless the
+    rows are padded (``row_step > width * point_step``) and ``height > 1``,
+    in which case the rows are flattened into a copy. Fields with
+    ``count > 1`` are exposed by their first element, fields with an
+    unknown datatype are skipped.
+
+    Args:
+        msg (PointCloud2): ros1 sensor_msgs/PointCloud2 msg.
+
+    Returns:
+        np.ndarray: Structured array with shape (N, ).
+    """
+    byte_order = '>' if msg.is_bigendian else '<'
+    names, formats, offsets = [], [], []
+    for field in msg.fields:
+        if field.datatype not in POINT_FIELD_DTYPES:
+            continue
+        names.append(field.name)
+        formats.append(
+            np.dtype(POINT_FIELD_DTYPES[field.datatype]).newbyteorder(
+                byte_order))
+        offsets.append(field.offset)
+    dtype = np.dtype(
+        dict(
+            names=names,
+            formats=formats,
+            offsets=offsets,
+            itemsize=msg.point_step))
+    # row_step may contain padding, so address rows by their own stride
+    view = np.ndarray(
+        shape=(msg.height, msg.width),
+        dtype=dtype,
+        buffer=msg.data,
+        strides=(msg.row_step, msg.point_step))
+    return view.reshape(-1)
+
+
+def gather_point_dims(points, use_dim, out=None):
+    """将 ``points`` 中 ``use_dim`` 的维度写入一块float32内存.
+
+    超出 ``points`` 维度的 ``use_dim`` 视为虚拟维度, 填充为0, 范围由调用方
+    检查, 见 :class:`LoadPointsFromFileExtension`. 连续的维度作为一个切片
+    一次拷贝, 不产生中间数组.
+
+    Args:
+        points (np.ndarray): (N, load_dim) 点云, 可以是 ``np.memmap``
+        use_dim (list[int]): 需要的维度
+        out (np.ndarray, optional): (N, len(use_dim)) float32 的输出,
+            默认新分配一块. Defaults to None.
+
+    Returns:
+        np.ndarray: (N, len(use_dim)) float32 的点云
+    """
+    num_points, load_dim = points.shape
+    if out is None:
+        out = np.empty((num_points, len(use_dim)), dtype=np.float32)
+    i = 0
+    while i < len(use_dim):
+        # 找到 use_dim[i:j] 为连续的维度的最长的一段
+        j = i + 1
+        while j < len(use_dim) and use_dim[j] == use_dim[j - 1] + 1 and \
+                (use_dim[j] < load_dim) == (use_dim[i] < load_dim):
+            j += 1
+        if use_dim[i] < load_dim:
+            out[:, i:j] = points[:, use_dim[i]:use_dim[j - 1] + 1]
+        else:
+            out[:, i:j] = 0
+        i = j
+    return out
+
+
+def mmap_points(pts_filename, dtype=np.float32):
+    """以只读的方式映射本地的点云文件, 不读入内存.
+
+    Args:
+        pts_filename (str): .bin 或 .npy 文件
+        dtype (np.dtype, optional): .bin 文件中点的类型.
+            Defaults to np.float32.
+
+    Returns:
+        np.ndarray: .bin 文件为一维数组, .npy 文件为保存时的shape
+    """
+    if pts_filename.endswith('.npy'):
+        return np.load(pts_filename, mmap_mode='r')
+    # 空文件无法映射
+    if os.path.getsize(pts_filename) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(pts_filename, dtype=dtype, mode='r')
+
+
+def voxel_keys(coords):
+    """将 (N, 3) 的voxel坐标编码为一维的int64 key, 相同voxel的key相同.
+
+    坐标减去最小值后按各维的范围展开为一个整数, 去重时只需要对一维的key
+    排序, 不需要按行比较. 范围超出int64时退化为 ``np.unique(axis=0)``
+    返回的行号.
+
+    Args:
+        coords (np.ndarray): (N, 3) int64 voxel坐标
+
+    Returns:
+        np.ndarray: (N, ) int64 key
+    """
+    coords = coords - coords.min(axis=0)
+    extents = coords.max(axis=0) + 1
+    if np.prod(extents.astype(np.float64)) >= np.iinfo(np.int64).max:
+        _, keys = np.unique(coords, axis=0, return_inverse=True)
+        return keys.reshape(-1).astype(np.int64)
+    return (coords[:, 0] * extents[1] + coords[:, 1]) * extents[2] + \
+        coords[:, 2]
 
 
 @PIPELINES.register_module()
@@ -29,8 +163,23 @@ class LoadPointsFromPointCloud2:
             refer to
             https://github.com/open-mmlab/mmcv/blob/master/mmcv/fileio/file_client.py
             for more details. Defaults to dict(backend='disk').
+        point_cloud_range (list[float], optional): Point cloud range
+            [x_min, y_min, z_min, x_max, y_max, z_max], points out of it are
+            discarded while decoding. Defaults to None.
+        filter_nan (bool, optional): Whether to discard points with NaN or
+            inf coordinates while decoding. Defaults to False.
+        voxel_size (list[float], optional): If set, keep only the first point
+            of each voxel. Points with NaN or inf coordinates are always
+            discarded in this case. Defaults to None.
+        max_points (int, optional): If set, randomly keep at most
+            ``max_points`` points. Defaults to None.
+        seed (int, optional): Seed of the random downsampling.
+            Defaults to None.
     """
 
+    # 点云各维度对应的 PointCloud2 field 名, 超出部分及msg中缺失的field填充为0
+    FIELD_NAMES = ('x', 'y', 'z', 'intensity', 'ring')
+
     def __init__(
             self,
             coord_type,
@@ -39,6 +188,11 @@ class LoadPointsFromPointCloud2:
             shift_height=False,
             use_color=False,
             file_client_args=dict(backend='disk'),
+            point_cloud_range=None,
+            filter_nan=False,
+            voxel_size=None,
+            max_points=None,
+            seed=None,
     ):
         self.shift_height = shift_height
         self.use_color = use_color
@@ -55,6 +209,59 @@ class LoadPointsFromPointCloud2:
         self.file_client_args = file_client_args.copy()
         self.file_client = None
 
+        # 解码时的过滤与降采样
+        self.point_cloud_range = point_cloud_range
+        self.filter_nan = filter_nan
+        self.voxel_size = voxel_size
+        self.max_points = max_points
+        self.rng = np.random.default_rng(seed)
+
+    def _select_points(self, pc_data):
+        """在解码前计算需要保留的点的索引, 被丢弃的点不会被拷贝.
+
+        Args:
+            pc_data (np.ndarray): PointCloud2 的结构化视图
+
+        Returns:
+            tuple[np.ndarray | None, dict]: 需要保留的点的索引(None表示保留全部),
+                以及每一步丢弃的点数
+        """
+        num_discarded = dict(nan=0, range=0, downsample=0)
+        if self.point_cloud_range is None and not self.filter_nan and \
+                self.voxel_size is None and self.max_points is None:
+            return None, num_discarded
+
+        x, y, z = pc_data['x'], pc_data['y'], pc_data['z']
+        mask = None
+        # NaN无法计算voxel坐标, 设置了 voxel_size 时总是丢弃
+        if self.filter_nan or self.voxel_size is not None:
+            mask = np.isfinite(x) & np.isfinite(y) & np.isfinite(z)
+            num_discarded['nan'] = int(mask.size - np.count_nonzero(mask))
+        if self.point_cloud_range is not None:
+            # 与 PointsRangeFilter 保持一致, 边界上的点被丢弃
+            r = self.point_cloud_range
+            in_range = ((x > r[0]) & (y > r[1]) & (z > r[2]) & (x < r[3])
+                        & (y < r[4]) & (z < r[5]))
+            num_kept = mask.size if mask is None else np.count_nonzero(mask)
+            mask = in_range if mask is None else mask & in_range
+            num_discarded['range'] = int(num_kept - np.count_nonzero(mask))
+        inds = np.arange(x.shape[0]) if mask is None else np.flatnonzero(mask)
+
+        num_kept = inds.shape[0]
+        if self.voxel_size is not None and num_kept > 0:
+            coords = np.stack([x[inds], y[inds], z[inds]], axis=1)
+            coords = np.floor(coords / np.asarray(self.voxel_size)).astype(
+                np.int64)
+            # 每个voxel只保留第一个点
+            _, first = np.unique(voxel_keys(coords), return_index=True)
+            inds = inds[np.sort(first)]
+        if self.max_points is not None and inds.shape[0] > self.max_points:
+            inds = np.sort(
+                self.rng.choice(inds, self.max_points, replace=False))
+        num_discarded['downsample'] = int(num_kept - inds.shape[0])
+
+        return inds, num_discarded
+
     def _pc_format_converter(self, input_data):
         """将输入的点云数据转换为符合mmdetection3d中模型输入需要的点云格式。
         并且点云目标检测模型因为训练时候所采用的数据集的不同，对输入点云的维度需求不同。
@@ -64,27 +271,33 @@ class LoadPointsFromPointCloud2:
         waymo数据集的原始点云是[x, y, z, intensity,ring,未知]6维,
         那么采用waymo数据集的配置文件所实例化的模型就需要提供6维的点云(尽管最后只是使用了其中的前4维参与了训练)
 
+        维度按 ``FIELD_NAMES`` 的顺序排列, 直接在 ``msg.data`` 上构建结构化视图,
+        只将 ``use_dim`` 中的维度写入一块float32内存, 缺失的维度填充为0.
+        范围过滤、NaN过滤与降采样在写入前完成, 被丢弃的点不会被拷贝.
+
         Args:
             input_data (PointCloud2): 输入的点云数据,来自ros1订阅,为ros1 sensor_msgs 的
         PointCloud2类型的点云数据
+
+        Returns:
+            tuple[np.ndarray, dict]: (N, len(use_dim)) float32 的点云,
+                以及每一步丢弃的点数
         """
-        pc = pypcd.PointCloud.from_msg(input_data)
-        # 所有点云至少包含xyz这三个维度
-        x = pc.pc_data['x'].flatten()
-        y = pc.pc_data['y'].flatten()
-        z = pc.pc_data['z'].flatten()
-        intensity = pc.pc_data['intensity'].flatten()
-        ring = pc.pc_data['ring'].flatten()
-
-        # 首先将输入的点云数据转换为6维的点云，原始点云中不存在的维度设置为0，然后根据需求转换为需要的维度
-        pc_array_6d = np.zeros((x.shape[0], 6))
-        pc_array_6d[:, 0] = x
-        pc_array_6d[:, 1] = y
-        pc_array_6d[:, 2] = z
-        pc_array_6d[:, 3] = intensity
-        pc_array_6d[:, 4] = ring
-
-        return pc_array_6d
+        pc_data = pointcloud2_to_structured(input_data)
+        field_names = pc_data.dtype.names
+        inds, num_discarded = self._select_points(pc_data)
+        num_points = pc_data.shape[0] if inds is None else inds.shape[0]
+
+        points = np.empty((num_points, len(self.use_dim)), dtype=np.float32)
+        for i, dim in enumerate(self.use_dim):
+            if dim < len(self.FIELD_NAMES) and \
+                    self.FIELD_NAMES[dim] in field_names:
+                field = pc_data[self.FIELD_NAMES[dim]]
+                points[:, i] = field if inds is None else field[inds]
+            else:
+                points[:, i] = 0
+
+        return points, num_discarded
 
     def _load_pointcloud2(self, pointcloud2):
         """Private function to load point clouds data.
@@ -93,12 +306,14 @@ class LoadPointsFromPointCloud2:
             pointcloud2 (pointcloud2): pointcloud2 format point clouds data.
 
         Returns:
-            np.ndarray: An array containing point clouds data.
+            tuple[np.ndarray, dict]: An array containing the ``use_dim``
+                dimensions of point clouds data, and the number of points
+                discarded by each filter.
         """
 
-        points = self._pc_format_converter(pointcloud2)
+        points, num_discarded = self._pc_format_converter(pointcloud2)
 
-        return points
+        return points, num_discarded
 
     def __call__(self, results):
         """Call function to load points data from pointcloud2.
@@ -111,10 +326,12 @@ class LoadPointsFromPointCloud2:
                 Added key and value are described below.
 
                 - points (:obj:`BasePoints`): Point clouds data.
+                - num_discarded_points (dict): Number of points discarded by
+                    the nan, range and downsample filters while decoding.
         """
 
-        points = self._load_pointcloud2(results['pc'])
-        points = points[:, self.use_dim]
+        points, num_discarded = self._load_pointcloud2(results['pc'])
+        results['num_discarded_points'] = num_discarded
         attribute_dims = None
 
         if self.shift_height:
@@ -150,10 +367,165 @@ class LoadPointsFromPointCloud2:
         repr_str += f'use_color={self.use_color}, '
         repr_str += f'file_client_args={self.file_client_args}, '
         repr_str += f'load_dim={self.load_dim}, '
-        repr_str += f'use_dim={self.use_dim})'
+        repr_str += f'use_dim={self.use_dim}, '
+        repr_str += f'point_cloud_range={self.point_cloud_range}, '
+        repr_str += f'filter_nan={self.filter_nan}, '
+        repr_str += f'voxel_size={self.voxel_size}, '
+        repr_str += f'max_points={self.max_points})'
         return repr_str
 
 
+@PIPELINES.register_module()
+class LoadPointsFromPointCloud2MultiSweeps:
+    """Load multi-sweep points from a stream of PointCloud2 msgs.
+
+    在线版本的 LoadPointsFromMultiSweeps, 参数与其保持一致, 以便直接替换配置文件中的
+    ``LoadPointsFromMultiSweeps``. 该transform是有状态的, 内部使用一个环形缓冲区保存最近
+    ``sweeps_num`` 帧已经解码的点云, 当前帧与缓冲区中的历史帧会被直接拼接到一块一次性分配的
+    内存中, 每一帧历史点云只需要一次拷贝, 而不需要重新读取与解码.
+
+    如果 ``results`` 中包含 ``pose`` (4x4, 当前帧lidar到固定坐标系的变换), 历史帧会被
+    补偿到当前帧的lidar坐标系下. ``time_dim`` 维写入历史帧相对当前帧的时间差, 单位为秒.
+
+    Args:
+        sweeps_num (int, optional): Number of sweeps. Defaults to 10.
+        load_dim (int, optional): The dimension of the current frame
+            ``points``, i.e. ``len(use_dim)`` of the preceding
+            ``LoadPointsFromPointCloud2``. Defaults to 5.
+        use_dim (list[int], optional): Which dimension to use.
+            Defaults to [0, 1, 2, 4].
+        time_dim (int, optional): Which dimension to write the time lag to.
+            The column is overwritten, so it must be a spare column after
+            x, y, z and intensity, e.g. the ring of nuScenes-like points.
+            Defaults to 4.
+        file_client_args (dict, optional): Unused, kept for config
+            compatibility. Defaults to dict(backend='disk').
+        pad_empty_sweeps (bool, optional): Whether to repeat keyframe when
+            sweeps is empty. Defaults to False.
+        remove_close (bool, optional): Whether to remove close points.
+            Defaults to False.
+        test_mode (bool, optional): Unused, sweeps are always the latest
+            frames. Defaults to False.
+    """
+
+    def __init__(
+            self,
+            sweeps_num=10,
+            load_dim=5,
+            use_dim=[0, 1, 2, 4],
+            time_dim=4,
+            file_client_args=dict(backend='disk'),
+            pad_empty_sweeps=False,
+            remove_close=False,
+            test_mode=False,
+    ):
+        # 时间差写入 time_dim 维, 不能覆盖 x, y, z 与 intensity
+        assert 3 < time_dim < load_dim, \
+            f'Expect 3 < time_dim < load_dim ({load_dim}), got {time_dim}'
+        assert max(use_dim) < load_dim, \
+            f'Expect all used dimensions < {load_dim}, got {use_dim}'
+        self.sweeps_num = sweeps_num
+        self.load_dim = load_dim
+        self.use_dim = use_dim
+        self.time_dim = time_dim
+        self.file_client_args = file_client_args.copy()
+        self.pad_empty_sweeps = pad_empty_sweeps
+        self.remove_close = remove_close
+        self.test_mode = test_mode
+        # (points, timestamp, pose), 最新的一帧在最后
+        self.sweeps = deque(maxlen=sweeps_num)
+
+    @staticmethod
+    def _remove_close(points, radius=1.0):
+        """Removes point too close within a certain radius from origin.
+
+        Args:
+            points (np.ndarray): Sweep points.
+            radius (float, optional): Radius below which points are removed.
+                Defaults to 1.0.
+
+        Returns:
+            np.ndarray: Points after removing.
+        """
+        not_close = np.logical_or(
+            np.abs(points[:, 0]) >= radius,
+            np.abs(points[:, 1]) >= radius)
+        return points[not_close]
+
+    def reset(self):
+        """Clear the buffered sweeps."""
+        self.sweeps.clear()
+
+    def __call__(self, results):
+        """Call function to load multi-sweep point clouds.
+
+        Args:
+            results (dict): Result dict containing the current frame
+                ``points`` and the PointCloud2 msg ``pc``, and optionally its
+                ``pose``.
+
+        Returns:
+            dict: The result dict containing the multi-sweep points data.
+                Added key and value are described below.
+
+                - points (np.ndarray | :obj:`BasePoints`): Multi-sweep point
+                    cloud arrays.
+        """
+        points = results['points']
+        cur_points = points.tensor.numpy()
+        assert cur_points.shape[1] == self.load_dim, \
+            f'Expect points with load_dim={self.load_dim} dims, got ' \
+            f'{cur_points.shape[1]}'
+        timestamp = results['pc'].header.stamp.to_sec()
+        pose = results.get('pose', None)
+
+        # 时间戳回退(例如bag重新播放)时, 历史帧已经失效
+        if len(self.sweeps) > 0 and timestamp < self.sweeps[-1][1]:
+            self.reset()
+
+        if self.remove_close:
+            sweep_points = self._remove_close(cur_points)
+        else:
+            sweep_points = cur_points
+
+        sweeps = list(reversed(self.sweeps))
+        if len(sweeps) == 0 and self.pad_empty_sweeps:
+            sweeps = [(sweep_points, timestamp, pose)] * self.sweeps_num
+
+        num_points = cur_points.shape[0] + sum(
+            sweep[0].shape[0] for sweep in sweeps)
+        multi_sweep_points = np.empty((num_points, cur_points.shape[1]),
+                                      dtype=np.float32)
+        multi_sweep_points[:cur_points.shape[0]] = cur_points
+        multi_sweep_points[:cur_points.shape[0], self.time_dim] = 0
+
+        start = cur_points.shape[0]
+        inv_pose = None if pose is None else np.linalg.inv(pose)
+        for points_sweep, timestamp_sweep, pose_sweep in sweeps:
+            end = start + points_sweep.shape[0]
+            block = multi_sweep_points[start:end]
+            block[:] = points_sweep
+            if inv_pose is not None and pose_sweep is not None:
+                # sweep lidar -> fixed frame -> current lidar
+                transform = inv_pose @ pose_sweep
+                block[:, :3] = points_sweep[:, :3] @ transform[:3, :3].T
+                block[:, :3] += transform[:3, 3]
+            block[:, self.time_dim] = timestamp - timestamp_sweep
+            start = end
+
+        self.sweeps.append((sweep_points, timestamp, pose))
+
+        points = points.new_point(torch.from_numpy(multi_sweep_points))
+        if list(self.use_dim) != list(range(points.points_dim)):
+            points = points[:, self.use_dim]
+        results['points'] = points
+        return results
+
+    def __repr__(self):
+        """str: Return a string that describes the module."""
+        return f'{self.__class__.__name__}(sweeps_num={self.sweeps_num})'
+
+
 @PIPELINES.register_module()
 class LoadPointsFromFileExtension:
     """修改自 LoadPointsFromFile , 解决加载数据维度问题 nuscenes数据集的原始点云是[x, y, z,
@@ -172,6 +544,8 @@ class LoadPointsFromFileExtension:
         use_dim (list[int], optional): Which dimensions of the points to use.
             Defaults to [0, 1, 2]. For KITTI dataset, set use_dim=4
             or use_dim=[0, 1, 2, 3] to use the intensity dimension.
+            ``load_dim`` 小于 ``len(use_dim)`` 时, ``load_dim`` 及之后的维度
+            为填充0的虚拟维度, 所有维度需要小于 ``max(load_dim, len(use_dim))``.
         shift_height (bool, optional): Whether to use shifted height.
             Defaults to False.
         use_color (bool, optional): Whether to use color features.
@@ -180,6 +554,13 @@ class LoadPointsFromFileExtension:
             refer to
             https://github.com/open-mmlab/mmcv/blob/master/mmcv/fileio/file_client.py
             for more details. Defaults to dict(backend='disk').
+        use_mmap (bool, optional): 是否以mmap的方式读取本地的点云文件, 只从
+            page cache 中拷贝 ``use_dim`` 的维度, 不再将整个文件读为bytes.
+            仅支持 ``backend='disk'``. Defaults to False.
+        cache (dict, optional): 点云缓存的配置, 见 :func:`build_points_cache`.
+            文件的原始数据按路径缓存, 跨epoch以及与
+            :class:`LoadPointsFromMultiSweepsExtension` 之间复用.
+            Defaults to None.
     """
 
     def __init__(
@@ -190,35 +571,56 @@ class LoadPointsFromFileExtension:
             shift_height=False,
             use_color=False,
             file_client_args=dict(backend='disk'),
+            use_mmap=False,
+            cache=None,
     ):
         self.shift_height = shift_height
         self.use_color = use_color
         if isinstance(use_dim, int):
             use_dim = list(range(use_dim))
+        # load_dim 小于 len(use_dim) 时补0到 len(use_dim) 维, 与修改前的
+        # 实现一致, 超出该范围的维度报错而不是填充为0
+        num_dims = max(load_dim, len(use_dim))
+        assert max(use_dim) < num_dims, \
+            f'Expect all used dimensions < {num_dims}, got {use_dim}'
         assert coord_type in ['CAMERA', 'LIDAR', 'DEPTH']
+        assert not use_mmap or file_client_args.get('backend') == 'disk', \
+            'use_mmap only supports the disk backend'
 
         self.coord_type = coord_type
         self.load_dim = load_dim
         self.use_dim = use_dim
         self.file_client_args = file_client_args.copy()
         self.file_client = None
+        self.use_mmap = use_mmap
+        self.points_cache = build_points_cache(cache)
 
-        # judeg load dims and use dims
-        self.dim_diff = 0
-        self.dim_diff_flag = False
-        if self.load_dim < len(self.use_dim):
-            self.dim_diff = len(self.use_dim) - self.load_dim
-            self.dim_diff_flag = True
+    def _read_points(self, pts_filename):
+        """读取点云文件的原始数据, 设置了 ``cache`` 时优先从缓存中读取.
 
-    def _load_points(self, pts_filename):
-        """Private function to load point clouds data.
+        Args:
+            pts_filename (str): Filename of point clouds data.
+
+        Returns:
+            np.ndarray: 文件中的点云数据, 来自缓存时只读
+        """
+        if self.points_cache is None:
+            return self._read_file(pts_filename)
+        return self.points_cache.load(pts_filename,
+                                      lambda: self._read_file(pts_filename))
+
+    def _read_file(self, pts_filename):
+        """读取点云文件, 返回文件中的原始数据, 不做拷贝.
 
         Args:
             pts_filename (str): Filename of point clouds data.
 
         Returns:
-            np.ndarray: An array containing point clouds data.
+            np.ndarray: 文件中的点云数据, ``use_mmap`` 时为 ``np.memmap``
         """
+        if self.use_mmap:
+            mmcv.check_file_exist(pts_filename)
+            return mmap_points(pts_filename)
         if self.file_client is None:
             self.file_client = mmcv.FileClient(**self.file_client_args)
         try:
@@ -233,6 +635,22 @@ class LoadPointsFromFileExtension:
 
         return points
 
+    def _load_points(self, pts_filename):
+        """Private function to load point clouds data.
+
+        ``use_dim`` 的维度直接写入一块float32内存, 超出 ``load_dim`` 的维度
+        填充为0, 不会产生拼接与索引的中间数组, 也不会提升为float64.
+
+        Args:
+            pts_filename (str): Filename of point clouds data.
+
+        Returns:
+            np.ndarray: (N, len(use_dim)) float32 的点云
+        """
+        points = self._read_points(pts_filename)
+        return gather_point_dims(
+            points.reshape(-1, self.load_dim), self.use_dim)
+
     def __call__(self, results):
         """Call function to load points data from file.
 
@@ -247,15 +665,19 @@ class LoadPointsFromFileExtension:
         """
         pts_filename = results['pts_filename']
         points = self._load_points(pts_filename)
+        results['points'] = self._to_points(points)
 
-        points = points.reshape(-1, self.load_dim)
+        return results
 
-        if self.dim_diff_flag:
-            points = np.concatenate(
-                [points, np.zeros((points.shape[0], self.dim_diff))], axis=1)
+    def _to_points(self, points):
+        """将 ``_load_points`` 的结果转换为 ``coord_type`` 的 BasePoints.
 
-        points = points[:, self.use_dim]
+        Args:
+            points (np.ndarray): (N, len(use_dim)) 的点云
 
+        Returns:
+            :obj:`BasePoints`: Point clouds data.
+        """
         attribute_dims = None
 
         if self.shift_height:
@@ -278,11 +700,8 @@ class LoadPointsFromFileExtension:
                 ]))
 
         points_class = get_points_type(self.coord_type)
-        points = points_class(
+        return points_class(
             points, points_dim=points.shape[-1], attribute_dims=attribute_dims)
-        results['points'] = points
-
-        return results
 
     def __repr__(self):
         """str: Return a string that describes the module."""
@@ -291,5 +710,121 @@ class LoadPointsFromFileExtension:
         repr_str += f'use_color={self.use_color}, '
         repr_str += f'file_client_args={self.file_client_args}, '
         repr_str += f'load_dim={self.load_dim}, '
-        repr_str += f'use_dim={self.use_dim})'
+        repr_str += f'use_dim={self.use_dim}, '
+        repr_str += f'use_mmap={self.use_mmap}, '
+        repr_str += f'points_cache={self.points_cache})'
         return repr_str
+
+
+@PIPELINES.register_module()
+class LoadPointsFromShard(LoadPointsFromFileExtension):
+    """从 tools/create_data.py usd_pack 打包的shard中加载点云.
+
+    USDDataset 设置了 ``points_shards`` 时, ``results['pts_shard']`` 为
+    ``(shard文件, offset, length)``, 每一帧只需要一次pread(或一次mmap的
+    切片), 不再为每一帧open/stat一个小文件. 没有 ``pts_shard`` 时与
+    :class:`LoadPointsFromFileExtension` 相同, 从 ``pts_filename`` 加载.
+
+    参数与 :class:`LoadPointsFromFileExtension` 相同, ``use_mmap`` 时映射
+    shard中对应的一段, 否则用pread读取. shard只支持本地文件.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.shard_reader = ShardReader()
+
+    def _load_shard_points(self, shard_file, offset, length):
+        """读取shard中的一帧点云.
+
+        Args:
+            shard_file (str): shard文件的路径
+            offset (int): 该帧在shard中的起始字节
+            length (int): 该帧的字节数
+
+        Returns:
+            np.ndarray: (N, len(use_dim)) float32 的点云
+        """
+        if self.points_cache is None:
+            points = self._read_shard(shard_file, offset, length)
+        else:
+            points = self.points_cache.load(
+                (shard_file, offset),
+                lambda: self._read_shard(shard_file, offset, length))
+        return gather_point_dims(
+            points.reshape(-1, self.load_dim), self.use_dim)
+
+    def _read_shard(self, shard_file, offset, length):
+        """读取shard中一帧的原始数据, 不做拷贝."""
+        num_floats = length // np.dtype(np.float32).itemsize
+        if num_floats == 0:
+            points = np.zeros(0, dtype=np.float32)
+        elif self.use_mmap:
+            points = np.memmap(
+                shard_file,
+                dtype=np.float32,
+                mode='r',
+                offset=offset,
+                shape=(num_floats, ))
+        else:
+            points = np.frombuffer(
+                self.shard_reader.read(shard_file, offset, length),
+                dtype=np.float32)
+        return points
+
+    def __call__(self, results):
+        """Call function to load points data from shard.
+
+        Args:
+            results (dict): Result dict containing point clouds data.
+
+        Returns:
+            dict: The result dict containing the point clouds data.
+                Added key and value are described below.
+
+                - points (:obj:`BasePoints`): Point clouds data.
+        """
+        pts_shard = results.get('pts_shard')
+        if pts_shard is None:
+            return super().__call__(results)
+        points = self._load_shard_points(*pts_shard)
+        results['points'] = self._to_points(points)
+        return results
+
+
+@PIPELINES.register_module()
+class LoadPointsFromMultiSweepsExtension(LoadPointsFromMultiSweeps):
+    """在 LoadPointsFromMultiSweeps 的基础上增加点云缓存.
+
+    多帧的配置中每一帧都会作为相邻关键帧的sweep被重复读取, 与
+    :class:`LoadPointsFromFileExtension` 使用同名的 ``cache`` 时, 关键帧与
+    sweep共用一份缓存.
+
+    Args:
+        cache (dict, optional): 点云缓存的配置, 见 :func:`build_points_cache`.
+            Defaults to None.
+        其余参数与 LoadPointsFromMultiSweeps 相同.
+    """
+
+    def __init__(self, *args, cache=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.points_cache = build_points_cache(cache)
+
+    def _load_points(self, pts_filename):
+        """Private function to load point clouds data.
+
+        Args:
+            pts_filename (str): Filename of point clouds data.
+
+        Returns:
+            np.ndarray: An array containing point clouds data, 来自缓存时只读.
+        """
+        load_points = super()._load_points
+        if self.points_cache is None:
+            return load_points(pts_filename)
+        return self.points_cache.load(pts_filename,
+                                      lambda: load_points(pts_filename))
+
+    def __repr__(self):
+        """str: Return a string that describes the module."""
+        return super().__repr__()[:-1] + \
+            f', points_cache={self.points_cache})'
@@ -0,0 +1,292 @@
+# Copyright (c) windzu. All rights reserved.
+import hashlib
+import os
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from os import path as osp
+
+import numpy as np
+from mmcv.utils import print_log
+
+# 同一个进程中同名的cache共用一个实例, 关键帧与sweep的加载共享缓存
+_POINTS_CACHES = {}
+
+
+class PointsCache(metaclass=ABCMeta):
+    """解码后点云的缓存基类, 记录命中与未命中的统计.
+
+    缓存的是文件中的原始数据(reshape之前的一维数组), 返回的数组只读,
+    使用者需要拷贝后再修改.
+
+    Args:
+        max_bytes (int): 缓存的字节数上限
+        log_interval (int, optional): 每查询多少次打印一次统计, 0表示不打印.
+            Defaults to 0.
+    """
+
+    def __init__(self, max_bytes, log_interval=0):
+        self.max_bytes = int(max_bytes)
+        self.log_interval = log_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """查找 ``key``, 未命中时返回None."""
+        points = self._get(key)
+        if points is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        if self.log_interval > 0 and \
+                (self.hits + self.misses) % self.log_interval == 0:
+            print_log(f'{self.__class__.__name__} (pid {os.getpid()}): '
+                      f'{self.stats()}')
+        return points
+
+    def put(self, key, points):
+        """缓存 ``points``, 返回只读的缓存数组(超出上限时为 ``points``)."""
+        if points.nbytes > self.max_bytes:
+            return points
+        return self._put(key, points)
+
+    def load(self, key, load_func):
+        """命中时直接返回, 否则调用 ``load_func()`` 加载后缓存."""
+        points = self.get(key)
+        if points is None:
+            points = self.put(key, load_func())
+        return points
+
+    def stats(self):
+        """dict: 命中次数、未命中次数、命中率、淘汰次数与当前占用的字节数."""
+        num_lookups = self.hits + self.misses
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / num_lookups if num_lookups else 0.0,
+            evictions=self.evictions,
+            nbytes=self.nbytes)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(max_bytes={self.max_bytes})'
+
+    @property
+    @abstractmethod
+    def nbytes(self):
+        """int: 当前占用的字节数."""
+
+    @abstractmethod
+    def _get(self, key):
+        """查找 ``key``, 未命中时返回None, 不更新统计."""
+
+    @abstractmethod
+    def _put(self, key, points):
+        """缓存 ``points``, 返回只读的缓存数组."""
+
+
+class LRUPointsCache(PointsCache):
+    """进程内的LRU缓存, DataLoader 的每个worker各有一份.
+
+    worker 只在 ``persistent_workers=True`` 时跨epoch保留, 否则每个epoch
+    重新创建, 只有同一个epoch内作为sweep重复读取的帧能够命中.
+    """
+
+    def __init__(self, max_bytes, log_interval=0):
+        super().__init__(max_bytes, log_interval=log_interval)
+        self._entries = OrderedDict()
+        self._nbytes = 0
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def _get(self, key):
+        points = self._entries.get(key)
+        if points is not None:
+            self._entries.move_to_end(key)
+        return points
+
+    def _put(self, key, points):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._nbytes -= old.nbytes
+        while self._entries and self._nbytes + points.nbytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._nbytes -= evicted.nbytes
+            self.evictions += 1
+        # np.memmap 需要拷贝到内存中, 否则缓存的只是文件的映射
+        if isinstance(points, np.memmap):
+            points = np.array(points)
+        points.setflags(write=False)
+        self._entries[key] = points
+        self._nbytes += points.nbytes
+        return points
+
+
+class SharedPointsCache(PointsCache):
+    """所有worker共享的缓存, 每个点云保存为 ``cache_dir`` 下的一个 .npy 文件.
+
+    ``cache_dir`` 默认位于 /dev/shm (tmpfs), 命中时以mmap的方式映射, 各个
+    worker共享同一份内存, 且worker重建后依然有效. 用文件的mtime近似LRU,
+    每写入 ``max_bytes / 16`` 字节扫描一次目录, 删除最久未使用的文件直到
+    不超过 ``max_bytes``, 因此占用可能短暂地超出上限. 写了一半的临时文件
+    同样计入占用并参与淘汰, 初始化时删除已经退出的进程留下的临时文件.
+
+    key 为点云文件的路径, 或shard中一帧的 (shard文件路径, offset). 缓存文件
+    名由文件的真实路径、大小与mtime生成, 不同数据集中相同的相对路径不会互相
+    命中, 重新生成的点云也不会读到旧的缓存, 旧的缓存文件随LRU淘汰. 无法
+    ``os.stat`` 的文件(例如非本地的存储)不缓存.
+
+    Args:
+        max_bytes (int): 所有进程共用的字节数上限
+        cache_dir (str, optional): 缓存目录.
+            Defaults to '/dev/shm/admlops_points_cache'.
+        log_interval (int, optional): 每查询多少次打印一次统计, 0表示不打印.
+            Defaults to 0.
+    """
+
+    def __init__(self,
+                 max_bytes,
+                 cache_dir='/dev/shm/admlops_points_cache',
+                 log_interval=0):
+        super().__init__(max_bytes, log_interval=log_interval)
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._written = 0
+        self._remove_orphan_tmp_files()
+
+    def _remove_orphan_tmp_files(self):
+        """删除写入过程中退出的进程留下的 ``<name>.npy.<pid>.tmp``."""
+        for path, _, _ in self._scan():
+            if not path.endswith('.tmp'):
+                continue
+            try:
+                pid = int(path.rsplit('.', 2)[-2])
+                # 只检查进程是否存在, 不发送信号
+                os.kill(pid, 0)
+            except ValueError:
+                pass
+            except ProcessLookupError:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            except PermissionError:
+                # 其他用户的进程依然存在
+                pass
+
+    def _path(self, key):
+        """返回 ``key`` 的缓存文件路径, 源文件无法访问时返回None."""
+        filename, offset = key if isinstance(key, tuple) else (key, None)
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        identity = f'{osp.realpath(filename)}:{offset}:' \
+            f'{stat.st_size}:{stat.st_mtime_ns}'
+        name = hashlib.sha1(identity.encode('utf-8')).hexdigest()
+        return osp.join(self.cache_dir, f'{name}.npy')
+
+    @property
+    def nbytes(self):
+        return sum(size for _, size, _ in self._scan())
+
+    def _scan(self):
+        """返回缓存目录中的 (路径, 字节数, mtime), 包括临时文件."""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(('.npy', '.tmp')):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _get(self, key):
+        path = self._path(key)
+        if path is None:
+            return None
+        try:
+            points = np.load(path, mmap_mode='r')
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            # 更新mtime, 作为最近使用的时间
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return points
+
+    def _put(self, key, points):
+        path = self._path(key)
+        if path is None:
+            return points
+        # 先写入临时文件再重命名, 其他进程不会读到写了一半的文件
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.ascontiguousarray(points))
+            os.replace(tmp_path, path)
+            # 先映射再淘汰, 文件被删除后映射依然有效
+            cached = np.load(path, mmap_mode='r')
+        except FileNotFoundError:
+            # 文件被其他进程淘汰, 本次不缓存
+            return points
+        points = cached
+        self._written += points.nbytes
+        if self._written * 16 >= self.max_bytes:
+            self._written = 0
+            self._evict()
+        return points
+
+    def _evict(self):
+        entries = sorted(self._scan(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            self.evictions += 1
+
+
+def build_points_cache(cfg):
+    """由配置构建点云缓存, 同一个进程中 ``name`` 相同的配置返回同一个实例.
+
+    Args:
+        cfg (dict | None): 缓存的配置, 包含
+
+            - max_bytes (int): 字节数上限, ``scope='worker'`` 时为每个worker
+              的上限
+            - scope (str, optional): 'worker' 为每个worker一份的进程内LRU,
+              'shared' 为所有worker共享的 /dev/shm 缓存. Defaults to 'worker'.
+            - name (str, optional): 缓存的名字. Defaults to 'points'.
+            - 其余参数传给 :class:`LRUPointsCache` 或
+              :class:`SharedPointsCache`
+
+    Returns:
+        PointsCache | None: 点云缓存, ``cfg`` 为None时返回None
+    """
+    if cfg is None:
+        return None
+    cfg = cfg.copy()
+    scope = cfg.pop('scope', 'worker')
+    name = cfg.pop('name', 'points')
+    cache = _POINTS_CACHES.get(name)
+    if cache is not None:
+        return cache
+    if scope == 'worker':
+        cache = LRUPointsCache(**cfg)
+    elif scope == 'shared':
+        cache = SharedPointsCache(**cfg)
+    else:
+        raise ValueError(f'Unsupported points cache scope {scope}, '
+                         "expect 'worker' or 'shared'")
+    _POINTS_CACHES[name] = cache
+    return cache
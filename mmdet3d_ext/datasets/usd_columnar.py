@@ -0,0 +1,184 @@
+# Copyright (c) windzu. All rights reserved.
+import json
+import os
+from collections.abc import Sequence
+from os import path as osp
+
+import numpy as np
+
+COLUMNAR_VERSION = 1
+
+
+def is_columnar_annotations(path):
+    """``path`` 是否为 ``USDColumnarAnnotations.dump`` 保存的目录."""
+    return osp.isdir(path) and osp.exists(osp.join(path, 'meta.json'))
+
+
+class USDColumnarAnnotations(Sequence):
+    """按列存储的USD标注, 用来代替 usd_infos_xxx.pkl 的 list[dict].
+
+    pkl 中每一帧都是嵌套的dict与若干小数组, DataLoader 的每个worker访问时
+    都会修改这些python对象的引用计数, 触发copy-on-write, 内存随worker数成倍
+    增长. 这里每个字段在所有帧上拼接为一个连续的数组, 保存为目录下的一个
+    ``.npy`` 文件, 加载时用 ``np.load(mmap_mode='r')`` 映射, 所有worker共享
+    同一份page cache.
+
+    只保存 ``point_clouds`` 中 ``sensor`` 的信息, images 与 calib 不保存.
+
+    Attributes:
+        box_offsets (np.ndarray): (num_frames + 1, ) 第i帧的框为
+            ``[box_offsets[i], box_offsets[i + 1])``
+        scene_names, seqs, file_names, box_types (np.ndarray):
+            (num_frames, ) 每一帧的字段
+        shapes (np.ndarray): (num_frames, 2) 每一帧点云的shape
+        class_names, track_ids, bbox2d, bbox3d, truncated, occluded,
+            num_points_in_gt (np.ndarray): (num_boxes, ...) 所有帧的框拼接
+    """
+
+    FRAME_FIELDS = ('scene_names', 'seqs', 'file_names', 'shapes',
+                    'box_types')
+    BOX_FIELDS = ('class_names', 'track_ids', 'bbox2d', 'bbox3d', 'truncated',
+                  'occluded', 'num_points_in_gt')
+    _EMPTY_BOX_FIELDS = dict(
+        class_names=((0, ), str),
+        track_ids=((0, ), str),
+        bbox2d=((0, 4), np.int32),
+        bbox3d=((0, 9), np.float32),
+        truncated=((0, ), np.int32),
+        occluded=((0, ), np.int32),
+        num_points_in_gt=((0, ), np.int32))
+
+    def __init__(self, box_offsets, sensor='LIDAR', **fields):
+        self.box_offsets = box_offsets
+        self.sensor = sensor
+        for name in self.FRAME_FIELDS + self.BOX_FIELDS:
+            setattr(self, name, fields[name])
+
+    def __len__(self):
+        return len(self.box_offsets) - 1
+
+    def get_annos(self, index):
+        """返回第 ``index`` 帧的 annos, 各字段为数组的视图."""
+        start, end = self.box_offsets[index], self.box_offsets[index + 1]
+        annos = {
+            name: getattr(self, name)[start:end]
+            for name in self.BOX_FIELDS
+        }
+        annos['box_type_3d'] = str(self.box_types[index])
+        return annos
+
+    def __getitem__(self, index):
+        """返回与 pkl 格式相同的第 ``index`` 帧, 只包含 ``point_clouds``."""
+        if not 0 <= index < len(self):
+            if -len(self) <= index < 0:
+                index += len(self)
+            else:
+                raise IndexError(f'index {index} out of range')
+        return {
+            'scene_name': str(self.scene_names[index]),
+            'seq': str(self.seqs[index]),
+            'images': None,
+            'point_clouds': {
+                self.sensor: {
+                    'frame_id': self.sensor,
+                    'file_name': str(self.file_names[index]),
+                    'shape': np.array(self.shapes[index]),
+                    'annos': self.get_annos(index),
+                }
+            },
+            'calib': None,
+        }
+
+    @classmethod
+    def from_infos(cls, data_infos, sensor='LIDAR'):
+        """由 usd_infos_xxx.pkl 的内容构建.
+
+        Args:
+            data_infos (list[dict]): usd_infos_xxx.pkl 的内容
+            sensor (str, optional): 保存的点云. Defaults to 'LIDAR'.
+
+        Returns:
+            USDColumnarAnnotations: 按列存储的标注
+        """
+        frames = {name: [] for name in cls.FRAME_FIELDS}
+        boxes = {name: [] for name in cls.BOX_FIELDS}
+        counts = []
+        for info in data_infos:
+            pts_info = info['point_clouds'][sensor]
+            annos = pts_info['annos']
+            frames['scene_names'].append(info['scene_name'])
+            frames['seqs'].append(info['seq'])
+            frames['file_names'].append(pts_info['file_name'])
+            frames['shapes'].append(
+                np.asarray(pts_info['shape'], dtype=np.int64).reshape(2))
+            frames['box_types'].append(annos['box_type_3d'])
+            num_boxes = len(annos['class_names'])
+            counts.append(num_boxes)
+            for name in cls.BOX_FIELDS:
+                value = np.asarray(annos[name])
+                boxes[name].append(value.reshape(num_boxes, *value.shape[1:]))
+
+        box_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=box_offsets[1:])
+        fields = {
+            'scene_names': np.array(frames['scene_names'], dtype=str),
+            'seqs': np.array(frames['seqs'], dtype=str),
+            'file_names': np.array(frames['file_names'], dtype=str),
+            'shapes': np.array(frames['shapes'],
+                               dtype=np.int64).reshape(-1, 2),
+            'box_types': np.array(frames['box_types'], dtype=str),
+        }
+        for name in cls.BOX_FIELDS:
+            values = [v for v in boxes[name] if v.size]
+            # 没有框的帧不参与拼接, 避免空数组的dtype影响拼接后的dtype
+            if len(values):
+                fields[name] = np.concatenate(values)
+            else:
+                shape, dtype = cls._EMPTY_BOX_FIELDS[name]
+                # 所有帧都没有框时, 保留标注中的列数(例如7维的bbox3d)
+                if boxes[name] and boxes[name][0].ndim == len(shape):
+                    shape = boxes[name][0].shape
+                fields[name] = np.zeros(shape, dtype=dtype)
+        return cls(box_offsets, sensor=sensor, **fields)
+
+    def dump(self, out_dir):
+        """每个字段保存为 ``out_dir`` 下的一个 ``.npy`` 文件."""
+        os.makedirs(out_dir, exist_ok=True)
+        meta_file = osp.join(out_dir, 'meta.json')
+        if osp.exists(meta_file):
+            os.remove(meta_file)
+        for name in ('box_offsets', ) + self.FRAME_FIELDS + self.BOX_FIELDS:
+            np.save(osp.join(out_dir, f'{name}.npy'), getattr(self, name))
+        # meta.json 最后写入, 作为目录完整的标志
+        with open(meta_file, 'w') as f:
+            json.dump(
+                dict(
+                    version=COLUMNAR_VERSION,
+                    sensor=self.sensor,
+                    num_frames=len(self),
+                    num_boxes=int(self.box_offsets[-1])), f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """加载 ``dump`` 保存的目录.
+
+        Args:
+            path (str): 保存的目录
+            mmap (bool, optional): 是否以只读的方式映射各个字段, 否则读入
+                内存. Defaults to True.
+
+        Returns:
+            USDColumnarAnnotations: 按列存储的标注
+        """
+        with open(osp.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['version'] != COLUMNAR_VERSION:
+            raise ValueError(f'Unsupported columnar annotations version '
+                             f'{meta["version"]} in {path}, please convert '
+                             'the pkl again.')
+        mmap_mode = 'r' if mmap else None
+        fields = {
+            name: np.load(osp.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+            for name in ('box_offsets', ) + cls.FRAME_FIELDS + cls.BOX_FIELDS
+        }
+        return cls(sensor=meta['sensor'], **fields)
@@ -11,6 +11,10 @@ from mmdet3d.datasets.pipelines import Compose
 from mmdet3d.datasets.utils import extract_result_dict, get_loading_pipeline
 from torch.utils.data import Dataset
 
+from .usd_columnar import USDColumnarAnnotations, is_columnar_annotations
+from .usd_index import USDSampleIndex, index_meta
+from .usd_shards import ShardedFiles
+
 
 @DATASETS.register_module()
 class USDDataset(Dataset):
@@ -66,7 +70,10 @@ class USDDataset(Dataset):
 
     Args:
         data_root (str): Path of dataset root.
-        ann_file (str): Path of annotation file.
+        ann_file (str): Path of annotation file. 可以是 usd_infos_xxx.pkl,
+            也可以是由 pkl 转换得到的按列存储的标注目录
+            (见 :class:`USDColumnarAnnotations`), 后者以mmap的方式加载,
+            由所有的 DataLoader worker 共享.
         pipeline (list[dict], optional): Pipeline used for data processing.
             Defaults to None.
         classes (tuple[str], optional): Classes used in the dataset.
@@ -85,6 +92,13 @@ class USDDataset(Dataset):
             Defaults to True.
         test_mode (bool, optional): Whether the dataset is in test mode.
             Defaults to False.
+        cache_index (bool, optional): 是否将样本索引保存在 ``ann_file`` 旁边,
+            之后的运行直接加载, ``ann_file`` 或类别等变化时会重新构建,
+            点云文件的增删不会触发重新构建. Defaults to False.
+        points_shards (str, optional): tools/create_data.py usd_pack 打包的
+            点云shard目录. 设置时每个样本的 ``pts_shard`` 为该帧在shard中的
+            (文件, offset, length), 由 ``LoadPointsFromShard`` 读取, 初始化时
+            也不再stat每个点云文件. Defaults to None.
     """
 
     def __init__(
@@ -98,6 +112,8 @@ class USDDataset(Dataset):
             filter_empty_gt=True,
             test_mode=False,
             file_client_args=dict(backend='disk'),
+            cache_index=False,
+            points_shards=None,
     ):
         super().__init__()
         self.data_root = data_root
@@ -111,17 +127,21 @@ class USDDataset(Dataset):
         self.file_client = mmcv.FileClient(**file_client_args)
         self.cat2id = {name: i for i, name in enumerate(self.CLASSES)}
 
-        # load annotations
-        if hasattr(self.file_client, 'get_local_path'):
-            with self.file_client.get_local_path(self.ann_file) as local_path:
-                self.data_infos = self.load_annotations(open(local_path, 'rb'))
-        else:
-            warnings.warn(
-                'The used MMCV version does not have get_local_path. '
-                f'We treat the {self.ann_file} as local paths and it '
-                'might cause errors if the path is not a local path. '
-                'Please use MMCV>= 1.3.16 if you meet errors.')
-            self.data_infos = self.load_annotations(self.ann_file)
+        # 点云路径、标注框等在初始化时整理为数组, get_data_info 只需要切片
+        # 加载了保存的索引时不再需要读取 ann_file, data_infos 在用到时才加载
+        self._data_infos = None
+        self.cache_index = cache_index
+        self.points_shards = None
+        if points_shards is not None:
+            self.points_shards = ShardedFiles(points_shards)
+        self.index = self._load_index()
+        if self.points_shards is not None:
+            # shard中的key为相对于data_root的点云路径
+            prefix_len = len(osp.join(self.data_root, ''))
+            self.pts_shard_rows = self.points_shards.lookup([
+                filename[prefix_len:]
+                for filename in self.index.pts_filenames.tolist()
+            ])
 
         # process pipeline
         if pipeline is not None:
@@ -131,6 +151,27 @@ class USDDataset(Dataset):
         if not self.test_mode:
             self._set_group_flag()
 
+    @property
+    def data_infos(self):
+        """list[dict] | USDColumnarAnnotations: ann_file 的内容, 第一次访问时
+        加载."""
+        if self._data_infos is None:
+            self._data_infos = self._load_data_infos()
+        return self._data_infos
+
+    def _load_data_infos(self):
+        if is_columnar_annotations(self.ann_file):
+            return USDColumnarAnnotations.load(self.ann_file)
+        if hasattr(self.file_client, 'get_local_path'):
+            with self.file_client.get_local_path(self.ann_file) as local_path:
+                return self.load_annotations(open(local_path, 'rb'))
+        warnings.warn(
+            'The used MMCV version does not have get_local_path. '
+            f'We treat the {self.ann_file} as local paths and it '
+            'might cause errors if the path is not a local path. '
+            'Please use MMCV>= 1.3.16 if you meet errors.')
+        return self.load_annotations(self.ann_file)
+
     def load_annotations(self, ann_file):
         """Load annotations from ann_file.
 
@@ -156,60 +197,57 @@ class USDDataset(Dataset):
             # NOTE : 以下字段仅为pipeline中的 LoadPointsFromMultiSweeps 需要
             "timestamp": 0.0, # 如果点云是5维且最后一维包含的是时间戳,则返回时间戳,否则返回0.0
             "sweeps":[] # 如果包含多帧点云,则返回多帧点云的路径，否则返回空列表
+            # NOTE : 仅在设置了 points_shards 时返回, 由 LoadPointsFromShard 读取
+            "pts_shard": ("path/shard_00000.bin", 0, 19584),
         }
         """
-        raw_info = self.data_infos[index]
-
-        # - parse images_info
-        # TODO : 解析图像的相关信息， 但是现在用不到，暂且搁置
-        # images_info = raw_info["images"]
-
-        # - parse point_clouds_info
-        # TODO: support multi-lidar，暂时只使用一个默认的lidar
-        # -- lidar是否应该只有一个呢？如果有多个，那么应该如何处理呢？
-        point_clouds_info = raw_info['point_clouds']
-        pts_filename = osp.join(self.data_root, raw_info['scene_name'],
-                                'LIDAR',
-                                point_clouds_info['LIDAR']['file_name'])
         # 如果点云文件不存在，直接返回None,会跳过并进行下一个数据的选择
-        if not osp.exists(pts_filename):
+        if self.points_shards is not None:
+            if self.pts_shard_rows[index] < 0:
+                return None
+        elif not self.index.exists[index]:
             return None
 
-        # - parse annotations_info
-        # TODO : 解析图像的标注信息
-        raw_gt_bboxes_3d = point_clouds_info['LIDAR']['annos']['bbox3d']
-        raw_gt_names_3d = point_clouds_info['LIDAR']['annos']['class_names']
-        gt_labels_3d = []
-        for cat in raw_gt_names_3d:
-            if cat in self.CLASSES:
-                gt_labels_3d.append(self.CLASSES.index(cat))
-            else:
-                gt_labels_3d.append(-1)
-        gt_labels_3d = np.array(gt_labels_3d)
-        # 对3d bbox 进行转换
-        ori_box_type_3d = point_clouds_info['LIDAR']['annos'][
-            'box_type_3d']  # default: LiDAR
-        ori_box_type_3d, _ = get_box_type(ori_box_type_3d)
-        # turn original box type to target box type
-
-        gt_bboxes_3d = ori_box_type_3d(
-            raw_gt_bboxes_3d,
-            box_dim=raw_gt_bboxes_3d.shape[-1],
-            origin=(0.5, 0.5, 0.5)).convert_to(self.box_mode_3d)
+        # 索引中的框已经转换到 self.box_mode_3d, 拷贝一份避免pipeline修改索引
+        boxes, labels = self.index.get_boxes(index)
+        gt_bboxes_3d = self.box_type_3d(
+            boxes.copy(), box_dim=boxes.shape[-1])
         ann_info = {
             'gt_bboxes_3d': gt_bboxes_3d,
-            'gt_labels_3d': gt_labels_3d,
+            'gt_labels_3d': labels.copy(),
         }
 
         result = {
-            'seq': raw_info['seq'],
-            'pts_filename': pts_filename,
+            'seq': str(self.index.seqs[index]),
+            'pts_filename': str(self.index.pts_filenames[index]),
             'ann_info': ann_info,
             'timestamp': 0.0,
             'sweeps': [],
         }
+        if self.points_shards is not None:
+            result['pts_shard'] = self.points_shards.location(
+                self.pts_shard_rows[index])
         return result
 
+    def _load_index(self):
+        """构建样本索引, ``cache_index`` 时优先加载保存在 ann_file 旁边的索引."""
+        # 点云从shard读取时, 是否存在由shard的索引决定
+        check_exists = self.points_shards is None
+        if not self.cache_index:
+            return USDSampleIndex.build(self.data_infos, self.data_root,
+                                        self.CLASSES, self.box_mode_3d,
+                                        check_exists)
+        index_file = osp.splitext(self.ann_file.rstrip('/'))[0] + '_index.npz'
+        meta = index_meta(self.ann_file, self.data_root, self.CLASSES,
+                          self.box_mode_3d, check_exists)
+        index = USDSampleIndex.load(index_file, meta)
+        if index is None:
+            index = USDSampleIndex.build(self.data_infos, self.data_root,
+                                         self.CLASSES, self.box_mode_3d,
+                                         check_exists)
+            index.save(index_file, meta)
+        return index
+
     def pre_pipeline(self, results):
         """Initialization before data preparation.
 
@@ -324,7 +362,7 @@ class USDDataset(Dataset):
 
         # - 输入输出检查，其长度应该相同
         assert len(dt_annos) == len(
-            self.data_infos), 'invalid list length of network outputs'
+            self), 'invalid list length of network outputs'
 
         # - 将网络的在test模式下的输出结果转换为eval所需的格式
         # TODO ： 针对eval任务的不同，需要做一些修改，目前仅仅针对的是3d检测的任务
@@ -408,7 +446,7 @@ class USDDataset(Dataset):
         """
         # - 输入输出检查，其长度应该相同
         assert len(gt_annos) == len(
-            self.data_infos), 'invalid list length of network outputs'
+            self), 'invalid list length of network outputs'
 
         # - 将网络的在test模式下的输出结果转换为eval所需的格式
         # TODO ： 针对eval任务的不同，需要做一些修改，目前仅仅针对的是3d检测的任务
@@ -487,14 +525,14 @@ class USDDataset(Dataset):
         Returns:
             dict: Evaluation results.
         """
-        gt_annos = [
-            self.get_data_info(i)['ann_info']
-            for i in range(len(self.data_infos))
-        ]
+        gt_annos = []
+        for i in range(len(self)):
+            boxes, labels = self.index.get_boxes(i)
+            gt_annos.append(dict(gt_bboxes_3d=boxes, gt_labels_3d=labels))
 
         dt_annos_after_format = self.format_dt_annos(results)
         gt_annos_after_format = self.format_gt_annos(gt_annos)
-        from mmdet3d_extension.core.evaluation import usd_eval
+        from mmdet3d_ext.core.evaluation import usd_eval
 
         ap_result_str, ap_dict = usd_eval(
             gt_annos=gt_annos_after_format,
@@ -573,7 +611,7 @@ class USDDataset(Dataset):
         Returns:
             int: Length of data infos.
         """
-        return len(self.data_infos)
+        return len(self.index)
 
     def _rand_another(self, idx):
         """Randomly get another item with the same flag.
@@ -0,0 +1,166 @@
+# Copyright (c) windzu. All rights reserved.
+import json
+import os
+from os import path as osp
+
+import numpy as np
+from mmdet3d.core.bbox import get_box_type
+
+from .usd_columnar import USDColumnarAnnotations, is_columnar_annotations
+
+
+def names_to_labels(names, classes):
+    """将类别名转换为类别id, 不在 ``classes`` 中的为-1.
+
+    只对不重复的类别名做一次查找, 再通过索引数组映射到每个框.
+
+    Args:
+        names (np.ndarray): (N, ) 类别名
+        classes (Sequence[str]): 类别名列表
+
+    Returns:
+        np.ndarray: (N, ) int64 类别id
+    """
+    cat2id = {name: i for i, name in enumerate(classes)}
+    unique_names, inverse = np.unique(names, return_inverse=True)
+    lut = np.array([cat2id.get(name, -1) for name in unique_names],
+                   dtype=np.int64)
+    return lut[inverse.reshape(-1)]
+
+
+class USDSampleIndex:
+    """USDDataset 的样本索引, 由 data_infos 构建一次, 可以保存到磁盘.
+
+    每个样本的点云路径、点云是否存在、标注框与类别id都保存为连续的数组,
+    ``get_data_info`` 只需要对数组切片.
+
+    Attributes:
+        seqs (np.ndarray): (num_samples, ) 每个样本在scene中的序列号
+        pts_filenames (np.ndarray): (num_samples, ) 点云文件路径
+        exists (np.ndarray): (num_samples, ) 点云文件是否存在
+        box_offsets (np.ndarray): (num_samples + 1, ) 第i个样本的框为
+            ``boxes[box_offsets[i]:box_offsets[i + 1]]``
+        boxes (np.ndarray): (num_boxes, box_dim) float32, 已经转换到目标的
+            box mode, 底面中心为原点
+        labels (np.ndarray): (num_boxes, ) int64 类别id, 不在CLASSES中的为-1
+    """
+
+    FIELDS = ('seqs', 'pts_filenames', 'exists', 'box_offsets', 'boxes',
+              'labels')
+
+    def __init__(self, seqs, pts_filenames, exists, box_offsets, boxes,
+                 labels):
+        self.seqs = seqs
+        self.pts_filenames = pts_filenames
+        self.exists = exists
+        self.box_offsets = box_offsets
+        self.boxes = boxes
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.pts_filenames)
+
+    def get_boxes(self, index):
+        """返回第 ``index`` 个样本的 (boxes, labels) 视图, 不做拷贝."""
+        start, end = self.box_offsets[index], self.box_offsets[index + 1]
+        return self.boxes[start:end], self.labels[start:end]
+
+    @classmethod
+    def build(cls,
+              data_infos,
+              data_root,
+              classes,
+              box_mode_3d,
+              check_exists=True):
+        """由 data_infos 构建索引.
+
+        Args:
+            data_infos (list[dict] | USDColumnarAnnotations): usd_infos_xxx.pkl
+                的内容, 或转换后的按列存储的标注
+            data_root (str): 数据集的根目录
+            classes (Sequence[str]): 类别名列表
+            box_mode_3d (Box3DMode): 目标的box mode
+            check_exists (bool, optional): 是否检查每个点云文件是否存在,
+                否则视为全部存在. 点云从shard读取时不需要检查.
+                Defaults to True.
+
+        Returns:
+            USDSampleIndex: 构建的索引
+        """
+        if isinstance(data_infos, USDColumnarAnnotations):
+            annotations = data_infos
+        else:
+            annotations = USDColumnarAnnotations.from_infos(data_infos)
+
+        pts_filenames = [
+            osp.join(data_root, scene_name, annotations.sensor, file_name)
+            for scene_name, file_name in zip(
+                annotations.scene_names.tolist(),
+                annotations.file_names.tolist())
+        ]
+        box_offsets = np.array(annotations.box_offsets, dtype=np.int64)
+        raw_boxes = np.asarray(annotations.bbox3d, dtype=np.float32)
+        box_dim = raw_boxes.shape[-1]
+
+        # 每种原始box type的框一起转换到目标的box mode
+        boxes = np.empty_like(raw_boxes)
+        row_box_types = np.repeat(
+            np.asarray(annotations.box_types), np.diff(box_offsets))
+        for box_type in np.unique(row_box_types):
+            mask = row_box_types == box_type
+            ori_box_type_3d, _ = get_box_type(str(box_type))
+            boxes[mask] = ori_box_type_3d(
+                raw_boxes[mask], box_dim=box_dim,
+                origin=(0.5, 0.5, 0.5)).convert_to(box_mode_3d).tensor.numpy()
+
+        if check_exists:
+            exists = np.array([osp.exists(f) for f in pts_filenames],
+                              dtype=bool)
+        else:
+            exists = np.ones(len(pts_filenames), dtype=bool)
+
+        return cls(
+            seqs=np.array(annotations.seqs, dtype=str),
+            pts_filenames=np.array(pts_filenames, dtype=str),
+            exists=exists,
+            box_offsets=box_offsets,
+            boxes=boxes,
+            labels=names_to_labels(annotations.class_names, classes))
+
+    def save(self, path, meta):
+        """保存为npz, ``meta`` 用于在加载时判断索引是否过期."""
+        np.savez(
+            path,
+            meta=np.array(json.dumps(meta)),
+            **{name: getattr(self, name)
+               for name in self.FIELDS})
+
+    @classmethod
+    def load(cls, path, meta):
+        """加载 ``save`` 保存的索引, 文件不存在或 ``meta`` 不一致时返回None."""
+        if not osp.exists(path):
+            return None
+        with np.load(path) as data:
+            if json.loads(str(data['meta'])) != meta:
+                return None
+            return cls(**{name: data[name] for name in cls.FIELDS})
+
+
+def index_meta(ann_file,
+               data_root,
+               classes,
+               box_mode_3d,
+               check_exists=True):
+    """索引依赖的信息, 任何一项变化都需要重新构建索引."""
+    if is_columnar_annotations(ann_file):
+        stat = os.stat(osp.join(ann_file, 'meta.json'))
+    else:
+        stat = os.stat(ann_file)
+    return dict(
+        ann_file=osp.abspath(ann_file),
+        ann_file_size=stat.st_size,
+        ann_file_mtime=stat.st_mtime,
+        data_root=data_root,
+        classes=list(classes),
+        box_mode_3d=str(box_mode_3d),
+        check_exists=check_exists)
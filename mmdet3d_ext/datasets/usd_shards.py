@@ -0,0 +1,213 @@
+# Copyright (c) windzu. All rights reserved.
+import json
+import os
+from os import path as osp
+
+import numpy as np
+
+SHARD_VERSION = 1
+
+
+def pread_exact(fd, length, offset):
+    """从 ``fd`` 的 ``offset`` 处读取 ``length`` 字节, 不改变文件的偏移."""
+    data = os.pread(fd, length, offset)
+    if len(data) == length:
+        return data
+    # 普通文件只有在读到文件末尾时才会少读
+    chunks = [data]
+    read = len(data)
+    while read < length:
+        chunk = os.pread(fd, length - read, offset + read)
+        if not chunk:
+            raise IOError(f'expect {length} bytes at offset {offset}, '
+                          f'got {read}')
+        chunks.append(chunk)
+        read += len(chunk)
+    return b''.join(chunks)
+
+
+class ShardReader:
+    """按 (shard文件, offset, length) 读取shard中的一个文件.
+
+    每个shard文件只打开一次, 之后都用 ``os.pread`` 读取, 多个线程或fork出的
+    进程共用同一个fd也不会互相影响. 序列化时不保存打开的fd.
+    """
+
+    def __init__(self):
+        self._fds = {}
+
+    def read(self, shard_file, offset, length):
+        fd = self._fds.get(shard_file)
+        if fd is None:
+            fd = os.open(shard_file, os.O_RDONLY)
+            self._fds[shard_file] = fd
+        return pread_exact(fd, length, offset)
+
+    def close(self):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds = {}
+
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self._fds = {}
+
+
+class ShardWriter:
+    """将大量的小文件依次写入若干个大的shard文件.
+
+    每个文件以 ``key`` (相对于数据集根目录的路径) 标识, 起始位置按
+    ``align`` 对齐, 写入结束后在 ``out_dir`` 下保存 ``index.npz`` 与
+    ``meta.json``, 由 :class:`ShardedFiles` 读取.
+
+    Args:
+        out_dir (str): 保存的目录
+        shard_size (int, optional): 每个shard的字节数上限, 单个文件超过时
+            独占一个shard. Defaults to 4 GiB.
+        align (int, optional): 每个文件起始位置的对齐字节数.
+            Defaults to 4096.
+    """
+
+    def __init__(self, out_dir, shard_size=4 << 30, align=4096):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.align = align
+        os.makedirs(out_dir, exist_ok=True)
+        meta_file = osp.join(out_dir, 'meta.json')
+        if osp.exists(meta_file):
+            os.remove(meta_file)
+
+        self.shard_files = []
+        self.keys, self.shard_ids, self.offsets, self.lengths = [], [], [], []
+        self.shapes, self.ndims = [], []
+        self._file = None
+        self._pos = 0
+
+    def _next_shard(self):
+        if self._file is not None:
+            self._file.close()
+        shard_file = f'shard_{len(self.shard_files):05d}.bin'
+        self.shard_files.append(shard_file)
+        self._file = open(osp.join(self.out_dir, shard_file), 'wb')
+        self._pos = 0
+
+    def add(self, key, data, shape=()):
+        """写入一个文件.
+
+        Args:
+            key (str): 文件的标识, 通常为相对于数据集根目录的路径
+            data (bytes): 文件的内容
+            shape (tuple[int], optional): 文件中数据的shape, 最多3维, 只做
+                记录. Defaults to ().
+        """
+        assert len(shape) <= 3, f'expect at most 3 dims, got {shape}'
+        pad = -self._pos % self.align
+        if self._file is None or \
+                self._pos > 0 and \
+                self._pos + pad + len(data) > self.shard_size:
+            self._next_shard()
+            pad = 0
+        if pad:
+            self._file.write(b'\0' * pad)
+            self._pos += pad
+        self._file.write(data)
+
+        self.keys.append(key)
+        self.shard_ids.append(len(self.shard_files) - 1)
+        self.offsets.append(self._pos)
+        self.lengths.append(len(data))
+        self.shapes.append(tuple(shape) + (1, ) * (3 - len(shape)))
+        self.ndims.append(len(shape))
+        self._pos += len(data)
+
+    def close(self):
+        """保存索引, ``meta.json`` 最后写入, 作为目录完整的标志."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        keys = np.array(self.keys, dtype=str)
+        shapes = np.array(self.shapes, dtype=np.int64).reshape(-1, 3)
+        # 按key排序, 读取时用二分查找
+        order = np.argsort(keys, kind='stable')
+        assert len(keys) == 0 or \
+            not (keys[order][1:] == keys[order][:-1]).any(), \
+            'duplicated keys'
+        np.savez(
+            osp.join(self.out_dir, 'index.npz'),
+            keys=keys[order],
+            shard_ids=np.array(self.shard_ids, dtype=np.int32)[order],
+            offsets=np.array(self.offsets, dtype=np.int64)[order],
+            lengths=np.array(self.lengths, dtype=np.int64)[order],
+            shapes=shapes[order],
+            ndims=np.array(self.ndims, dtype=np.int8)[order])
+        with open(osp.join(self.out_dir, 'meta.json'), 'w') as f:
+            json.dump(
+                dict(
+                    version=SHARD_VERSION,
+                    shard_files=self.shard_files,
+                    num_files=len(keys)), f)
+
+
+class ShardedFiles:
+    """读取 :class:`ShardWriter` 写入的shard.
+
+    索引为按key排序的若干数组, 查找时二分, 不构建python的dict, 各个
+    DataLoader worker 不会因为引用计数触发copy-on-write.
+
+    Args:
+        path (str): :class:`ShardWriter` 的 ``out_dir``
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(osp.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['version'] != SHARD_VERSION:
+            raise ValueError(f'Unsupported shard version {meta["version"]} '
+                             f'in {path}, please pack the data again.')
+        self.shard_files = [osp.join(path, f) for f in meta['shard_files']]
+        with np.load(osp.join(path, 'index.npz')) as index:
+            self.keys = index['keys']
+            self.shard_ids = index['shard_ids']
+            self.offsets = index['offsets']
+            self.lengths = index['lengths']
+            self.shapes = index['shapes']
+            self.ndims = index['ndims']
+        self._reader = ShardReader()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, keys):
+        """查找 ``keys`` 在索引中的行号.
+
+        Args:
+            keys (Sequence[str]): 需要查找的key
+
+        Returns:
+            np.ndarray: (len(keys), ) int64 行号, 不存在的为-1
+        """
+        keys = np.asarray(keys, dtype=str)
+        if len(self.keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        rows = np.searchsorted(self.keys, keys)
+        rows = np.minimum(rows, len(self.keys) - 1)
+        return np.where(self.keys[rows] == keys, rows, -1).astype(np.int64)
+
+    def location(self, row):
+        """返回第 ``row`` 行的 (shard文件路径, offset, length)."""
+        return (self.shard_files[self.shard_ids[row]], int(self.offsets[row]),
+                int(self.lengths[row]))
+
+    def shape(self, row):
+        """返回第 ``row`` 行写入时记录的shape."""
+        return tuple(int(x) for x in self.shapes[row, :self.ndims[row]])
+
+    def read(self, row):
+        """用一次pread读取第 ``row`` 行的内容."""
+        return self._reader.read(*self.location(row))
+
+    def close(self):
+        self._reader.close()
@@ -0,0 +1,4 @@
+# Copyright (c) windzu. All rights reserved.
+from .bbox import *  # noqa: F401, F403
+from .export import *  # noqa: F401, F403
+from .seg import *  # noqa: F401, F403
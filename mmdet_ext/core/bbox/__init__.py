@@ -0,0 +1,7 @@
+# Copyright (c) windzu. All rights reserved.
+from .transforms import build_label_map, result2arrays
+
+__all__ = [
+    'build_label_map',
+    'result2arrays',
+]
@@ -0,0 +1,65 @@
+# Copyright (c) windzu. All rights reserved.
+import numpy as np
+
+
+def build_label_map(src_classes, dst_classes, name_map=None):
+    """Build an index array which maps the labels of ``src_classes`` to the
+    labels of ``dst_classes``.
+
+    Args:
+        src_classes (Sequence[str]): Class names of the model.
+        dst_classes (Sequence[str]): Target class names.
+        name_map (dict, optional): Mapping from source to target class names.
+            Classes not in it are mapped by their own name. Defaults to None.
+
+    Returns:
+        np.ndarray: Array of shape (len(src_classes), ), the target label of
+            each source label, -1 for classes which are not kept.
+    """
+    dst_index = {name: i for i, name in enumerate(dst_classes)}
+    if name_map is None:
+        name_map = {}
+    return np.array(
+        [dst_index.get(name_map.get(name, name), -1) for name in src_classes],
+        dtype=np.int64)
+
+
+def result2arrays(result, score_thr=0.0, label_map=None):
+    """Convert an mmdet detection result to flat arrays.
+
+    This is the inverse of ``mmdet.core.bbox2result``, the labels are built
+    with a single ``np.repeat`` and the score filter and class remapping are
+    applied with index arrays, without any per box python loop.
+
+    Args:
+        result (list[np.ndarray] | tuple): Detection result of one image,
+            bboxes of shape (n, 5) per class, optionally with mask results.
+        score_thr (float): Keep bboxes with score larger than it.
+            Defaults to 0.
+        label_map (np.ndarray, optional): Target label of each class, as
+            returned by :func:`build_label_map`. Bboxes of classes mapped to
+            -1 are dropped. Defaults to None.
+
+    Returns:
+        tuple[np.ndarray]: bboxes of shape (n, 4), scores of shape (n, ) and
+            labels of shape (n, ).
+    """
+    bbox_result = result[0] if isinstance(result, tuple) else result
+    num_dets = [len(bbox) for bbox in bbox_result]
+    if sum(num_dets) == 0:
+        return (np.zeros((0, 4), dtype=np.float32),
+                np.zeros((0, ), dtype=np.float32),
+                np.zeros((0, ), dtype=np.int64))
+    bboxes = np.concatenate(bbox_result)
+    labels = np.repeat(np.arange(len(bbox_result)), num_dets)
+    scores = bboxes[:, 4]
+
+    keep = None
+    if score_thr > 0:
+        keep = scores > score_thr
+    if label_map is not None:
+        labels = label_map[labels]
+        keep = labels >= 0 if keep is None else keep & (labels >= 0)
+    if keep is not None:
+        bboxes, scores, labels = bboxes[keep], scores[keep], labels[keep]
+    return bboxes[:, :4], scores, labels
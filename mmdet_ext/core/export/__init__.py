@@ -0,0 +1,6 @@
+# Copyright (c) windzu. All rights reserved.
+from .onnx_helper import onnx_batched_nms
+
+__all__ = [
+    'onnx_batched_nms',
+]
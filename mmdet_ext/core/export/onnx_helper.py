@@ -0,0 +1,107 @@
+# Copyright (c) windzu. All rights reserved.
+import torch
+
+
+class ONNXNMSop(torch.autograd.Function):
+    """ONNX ``NonMaxSuppression``.
+
+    Unlike ``DymmyONNXNMSop`` of mmdet, the forward runs a real NMS, so the
+    PyTorch model gives the same outputs as the exported graph and the two
+    can be compared.
+
+    Returns:
+        Tensor: Selected indices of shape (num_selected, 3), each row is
+            (batch_index, class_index, box_index).
+    """
+
+    @staticmethod
+    def forward(ctx, boxes, scores, max_output_boxes_per_class,
+                iou_threshold, score_threshold):
+        from mmcv.ops import nms
+
+        max_num = int(max_output_boxes_per_class)
+        iou_threshold = float(iou_threshold)
+        score_threshold = float(score_threshold)
+        batch_size, num_classes = scores.shape[:2]
+        selected = []
+        for batch_id in range(batch_size):
+            for cls_id in range(num_classes):
+                cls_scores = scores[batch_id, cls_id]
+                inds = (cls_scores > score_threshold).nonzero(
+                    as_tuple=False).squeeze(1)
+                if inds.numel() == 0:
+                    continue
+                _, keep = nms(boxes[batch_id, inds], cls_scores[inds],
+                              iou_threshold)
+                keep = inds[keep[:max_num]]
+                selected.append(
+                    torch.stack([
+                        torch.full_like(keep, batch_id),
+                        torch.full_like(keep, cls_id), keep
+                    ],
+                                dim=1))
+        if len(selected) == 0:
+            return boxes.new_zeros((0, 3), dtype=torch.long)
+        return torch.cat(selected)
+
+    @staticmethod
+    def symbolic(g, boxes, scores, max_output_boxes_per_class, iou_threshold,
+                 score_threshold):
+        return g.op(
+            'NonMaxSuppression',
+            boxes,
+            scores,
+            max_output_boxes_per_class,
+            iou_threshold,
+            score_threshold,
+            outputs=1)
+
+
+def onnx_batched_nms(boxes, scores, labels, iou_threshold, score_threshold,
+                     max_per_img):
+    """Class aware NMS of a batch of images, exported as a single ONNX
+    ``NonMaxSuppression``.
+
+    Boxes of different classes are shifted apart as ``mmcv.ops.batched_nms``
+    does, so one NMS over all classes never suppresses boxes across classes.
+    The outputs are padded to a fixed number of boxes per image, which keeps
+    the batch dimension of the exported graph dynamic.
+
+    Args:
+        boxes (Tensor): Boxes of shape (B, N, 4).
+        scores (Tensor): Scores of shape (B, N).
+        labels (Tensor): Labels of shape (B, N).
+        iou_threshold (float): IoU threshold of NMS.
+        score_threshold (float): Boxes with score not larger than it are
+            dropped before NMS.
+        max_per_img (int): Number of outputs per image, N must not be
+            smaller than it.
+
+    Returns:
+        tuple[Tensor]: dets of shape (B, max_per_img, 5) and labels of shape
+            (B, max_per_img), sorted by score. Padded entries have score 0
+            and label -1.
+    """
+    batch_size, num_boxes = scores.shape
+    offsets = labels.to(boxes) * (boxes.max() + 1)
+    boxes_for_nms = boxes + offsets[..., None]
+    selected = ONNXNMSop.apply(
+        boxes_for_nms, scores.unsqueeze(1), torch.LongTensor([max_per_img]),
+        torch.tensor([iou_threshold], dtype=torch.float32),
+        torch.tensor([score_threshold], dtype=torch.float32))
+    pos_inds = selected[:, 0] * num_boxes + selected[:, 2]
+    mask = scores.new_zeros((batch_size * num_boxes, 1))
+    # Avoid onnx2tensorrt issue in https://github.com/NVIDIA/TensorRT/issues/1134  # noqa: E501
+    mask[pos_inds, :] += 1
+    mask = mask.view(batch_size, num_boxes)
+    scores = scores * mask
+    # zero the padded boxes as well, so they do not depend on the ordering
+    # of the NMS implementation
+    boxes = boxes * mask.unsqueeze(2)
+
+    scores, topk_inds = scores.topk(max_per_img, dim=1)
+    boxes = boxes.gather(1, topk_inds.unsqueeze(2).expand(-1, -1, 4))
+    labels = labels.gather(1, topk_inds)
+    labels = torch.where(scores > 0, labels, torch.full_like(labels, -1))
+    dets = torch.cat([boxes, scores.unsqueeze(2)], dim=2)
+    return dets, labels
@@ -0,0 +1,7 @@
+# Copyright (c) windzu. All rights reserved.
+from .seg_map import LowResSegMap, seg_logits_to_labels
+
+__all__ = [
+    'LowResSegMap',
+    'seg_logits_to_labels',
+]
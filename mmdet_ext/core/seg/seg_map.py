@@ -0,0 +1,129 @@
+# Copyright (c) windzu. All rights reserved.
+import math
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+
+def seg_logits_to_labels(seg_logits):
+    """Convert segmentation logits to uint8 label maps.
+
+    Args:
+        seg_logits (Tensor): Logits of shape (N, C, H, W). Single class
+            logits are binarized with sigmoid > 0.5.
+
+    Returns:
+        Tensor: Label maps of shape (N, H, W).
+    """
+    if seg_logits.size(1) == 1:
+        seg_labels = seg_logits[:, 0] > 0
+    else:
+        seg_labels = seg_logits.argmax(dim=1)
+    return seg_labels.to(torch.uint8)
+
+
+class LowResSegMap:
+    """Segmentation output of one image at the native stride of its head.
+
+    The map covers the padded network input. Nothing is interpolated or
+    copied to the host until :meth:`labels` or :meth:`upsample` is called,
+    and :meth:`upsample` can be restricted to a region of interest.
+
+    Args:
+        data (Tensor | np.ndarray): Logits of shape (C, h, w), which may stay
+            on the device, or a label map of shape (h, w).
+        input_shape (tuple[int]): (H, W) of the padded network input.
+        img_shape (tuple[int]): (H, W) of the network input without padding.
+        ori_shape (tuple[int]): (H, W) of the output coordinate frame,
+            usually the original image.
+    """
+
+    def __init__(self, data, input_shape, img_shape, ori_shape):
+        self.data = data
+        self.input_shape = tuple(input_shape[:2])
+        self.img_shape = tuple(img_shape[:2])
+        self.ori_shape = tuple(ori_shape[:2])
+
+    @property
+    def is_logits(self):
+        """bool: Whether the data are logits instead of a label map."""
+        return isinstance(self.data, torch.Tensor)
+
+    @property
+    def native_shape(self):
+        """tuple[int]: (h, w) of the whole map, including the padding."""
+        return tuple(self.data.shape[-2:])
+
+    @property
+    def stride(self):
+        """tuple[float]: Stride of the map relative to the network input."""
+        h, w = self.native_shape
+        return self.input_shape[0] / h, self.input_shape[1] / w
+
+    def labels(self):
+        """Label map at the native stride, with the padding cropped.
+
+        Returns:
+            np.ndarray: uint8 label map of shape (ceil(H / stride),
+                ceil(W / stride)), where (H, W) is ``img_shape``.
+        """
+        stride_h, stride_w = self.stride
+        h = math.ceil(self.img_shape[0] / stride_h)
+        w = math.ceil(self.img_shape[1] / stride_w)
+        if self.is_logits:
+            return seg_logits_to_labels(
+                self.data[None, :, :h, :w])[0].cpu().numpy()
+        return np.asarray(self.data[:h, :w], dtype=np.uint8)
+
+    def upsample(self, shape=None, roi=None):
+        """Label map in the output coordinate frame, computed on demand.
+
+        Logits are sampled bilinearly, in one step from the native stride,
+        and label maps are sampled with nearest neighbour. Only the pixels
+        inside ``roi`` are computed.
+
+        Args:
+            shape (tuple[int], optional): (H, W) of the whole output map.
+                Defaults to ``ori_shape``.
+            roi (tuple[int], optional): (x1, y1, x2, y2) region of the output
+                map to compute. Defaults to the whole map.
+
+        Returns:
+            np.ndarray: uint8 label map of the region, of shape
+                (y2 - y1, x2 - x1).
+        """
+        out_h, out_w = self.ori_shape if shape is None else shape[:2]
+        if roi is None:
+            roi = (0, 0, out_w, out_h)
+        x1, y1 = max(int(roi[0]), 0), max(int(roi[1]), 0)
+        x2, y2 = min(int(roi[2]), out_w), min(int(roi[3]), out_h)
+        x2, y2 = max(x2, x1), max(y2, y1)
+
+        # pixel centers of the output map, in pixels of the native map
+        stride_h, stride_w = self.stride
+        ys = (np.arange(y1, y2) + 0.5) * (self.img_shape[0] / out_h / stride_h)
+        xs = (np.arange(x1, x2) + 0.5) * (self.img_shape[1] / out_w / stride_w)
+        h, w = self.native_shape
+        if not self.is_logits:
+            rows = np.clip(ys.astype(np.int64), 0, h - 1)
+            cols = np.clip(xs.astype(np.int64), 0, w - 1)
+            return np.asarray(self.data, dtype=np.uint8)[np.ix_(rows, cols)]
+        if len(ys) == 0 or len(xs) == 0:
+            return np.zeros((len(ys), len(xs)), dtype=np.uint8)
+
+        # normalized coordinates of grid_sample with align_corners=False
+        grid_y = self.data.new_tensor(ys * 2 / h - 1)
+        grid_x = self.data.new_tensor(xs * 2 / w - 1)
+        grid = torch.stack([
+            grid_x[None, :].expand(len(ys), -1),
+            grid_y[:, None].expand(-1, len(xs))
+        ],
+                           dim=-1)
+        seg_logits = F.grid_sample(
+            self.data[None],
+            grid[None],
+            mode='bilinear',
+            padding_mode='border',
+            align_corners=False)
+        return seg_logits_to_labels(seg_logits)[0].cpu().numpy()
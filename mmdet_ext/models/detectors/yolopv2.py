@@ -1,9 +1,15 @@
 # Copyright (c) windzu. All rights reserved.
 
+import numpy as np
 import torch
+import torch.nn.functional as F
 # local
+from mmdet.core import bbox2result
 from mmdet.models import DETECTORS, YOLOX, build_head
 
+from mmdet_ext.core import (LowResSegMap, onnx_batched_nms,
+                            seg_logits_to_labels)
+
 
 @DETECTORS.register_module()
 class YOLOPV2(YOLOX):
@@ -15,8 +21,14 @@ class YOLOPV2(YOLOX):
 
     需要做的工作如下:
     1. 修改YOLOX的forward_train,使其支持多个head
+
+    测试时backbone与neck只运行一次, 由 ``test_cfg.tasks`` 指定需要输出的任务
+    (``bbox``, ``drivable``, ``lane``), 未启用的head不会被计算.
     """
 
+    TASKS = ('bbox', 'drivable', 'lane')
+    SEG_OUTPUTS = ('full', 'native_label', 'native_logit')
+
     def __init__(
             self,
             backbone,
@@ -40,12 +52,28 @@ class YOLOPV2(YOLOX):
             train_cfg,
             test_cfg,
             pretrained,
-            init_cfg,
+            input_size=input_size,
+            size_multiplier=size_multiplier,
+            random_size_range=random_size_range,
+            random_size_interval=random_size_interval,
+            init_cfg=init_cfg,
         )
 
         # new head init
-        self.drivable_head = build_head(drivable_head)
-        self.lane_head = build_head(lane_head)
+        self.drivable_head = build_head(drivable_head) \
+            if drivable_head is not None else None
+        self.lane_head = build_head(lane_head) \
+            if lane_head is not None else None
+
+        # 测试时需要输出的任务
+        tasks = self.TASKS if test_cfg is None else test_cfg.get(
+            'tasks', self.TASKS)
+        self.test_tasks = set(tasks)
+        # 分割结果的输出形式, 见 _seg_simple_test
+        self.seg_output = 'full' if test_cfg is None else test_cfg.get(
+            'seg_output', 'full')
+        assert self.seg_output in self.SEG_OUTPUTS, \
+            f'seg_output should be one of {self.SEG_OUTPUTS}'
 
     @property
     def with_neck(self):
@@ -74,17 +102,12 @@ class YOLOPV2(YOLOX):
 
         See `mmdetection/tools/analysis_tools/get_flops.py`
         """
-        outs = ()
-        # backbone
         x = self.extract_feat(img)
-        # rpn
-        if self.with_rpn:
-            rpn_outs = self.rpn_head(x)
-            outs = outs + (rpn_outs, )
-        proposals = torch.randn(1000, 4).to(img.device)
-        # roi_head
-        roi_outs = self.roi_head.forward_dummy(x, proposals)
-        outs = outs + (roi_outs, )
+        outs = (self.bbox_head(x), )
+        if self.with_drivable_head:
+            outs = outs + (self.drivable_head(x[0]), )
+        if self.with_lane_head:
+            outs = outs + (self.lane_head(x[0]), )
         return outs
 
     def forward_train(
@@ -170,36 +193,185 @@ class YOLOPV2(YOLOX):
             x, img_meta, rescale=rescale)
 
     def simple_test(self, img, img_metas, proposals=None, rescale=False):
-        """Test without augmentation."""
+        """Test without augmentation.
 
-        assert self.with_bbox, 'Bbox head must be implemented.'
+        Args:
+            img (Tensor): Input images of shape (N, C, H, W).
+            img_metas (list[dict]): List of image information.
+            rescale (bool): Whether to rescale the results to the original
+                image. Defaults to False.
+
+        Returns:
+            list: 只启用 ``bbox`` 时与YOLOX相同, 每张图像为每个类别的bbox列表;
+                否则每张图像为 (bbox_result, drivable_mask, lane_mask),
+                mask 为 (H, W) 的 uint8 label map, ``seg_output`` 不为
+                ``full`` 时为 LowResSegMap, 未启用的任务为None.
+        """
+        # mmdeploy 导出时调用的是simple_test
+        if torch.onnx.is_in_onnx_export():
+            return self.onnx_export(
+                img, img_metas, with_nms=self.test_cfg.get('with_nms', True))
+
+        # backbone与neck只运行一次, 所有head共享特征
         x = self.extract_feat(img)
 
-        return self.bbox_head.simple_test(x, img_metas, rescale=rescale)
+        if 'bbox' in self.test_tasks:
+            results_list = self.bbox_head.simple_test(
+                x, img_metas, rescale=rescale)
+            bbox_results = [
+                bbox2result(det_bboxes, det_labels,
+                            self.bbox_head.num_classes)
+                for det_bboxes, det_labels in results_list
+            ]
+        else:
+            bbox_results = [[
+                np.zeros((0, 5), dtype=np.float32)
+                for _ in range(self.bbox_head.num_classes)
+            ] for _ in img_metas]
+        if self.test_tasks == {'bbox'}:
+            return bbox_results
+
+        num_imgs = len(img_metas)
+        drivable_results = [None] * num_imgs
+        if self.with_drivable_head and 'drivable' in self.test_tasks:
+            drivable_results = self._seg_simple_test(self.drivable_head, x,
+                                                     img_metas, rescale)
+        lane_results = [None] * num_imgs
+        if self.with_lane_head and 'lane' in self.test_tasks:
+            lane_results = self._seg_simple_test(self.lane_head, x,
+                                                 img_metas, rescale)
+        return list(zip(bbox_results, drivable_results, lane_results))
+
+    def _seg_simple_test(self, head, x, img_metas, rescale=False):
+        """Predict the label maps of a segmentation head.
+
+        The head runs on the finest feature map of the neck. ``seg_output``
+        决定输出形式:
+
+        - ``full``: 插值到输入尺寸(``rescale`` 时为原图尺寸)的label map
+        - ``native_label``: head原始stride的label map, 只拷贝小尺寸的
+          label map到cpu
+        - ``native_logit``: head原始stride的logits, 留在模型所在的设备上
+
+        后两者不做全图的插值与argmax, 需要时再调用 LowResSegMap.upsample.
+
+        Returns:
+            list[np.ndarray | LowResSegMap]: 每张图像的结果.
+        """
+        seg_logits = head(x[0])
+        if self.seg_output != 'full':
+            if self.seg_output == 'native_label':
+                seg_logits = seg_logits_to_labels(seg_logits).cpu().numpy()
+            return [
+                LowResSegMap(
+                    seg_logits[img_id], img_meta['batch_input_shape'],
+                    img_meta['img_shape'],
+                    img_meta['ori_shape'] if rescale else
+                    img_meta['img_shape'])
+                for img_id, img_meta in enumerate(img_metas)
+            ]
+
+        seg_logits = F.interpolate(
+            seg_logits,
+            size=img_metas[0]['batch_input_shape'],
+            mode='bilinear',
+            align_corners=False)
+        results = []
+        for img_id, img_meta in enumerate(img_metas):
+            # 去掉pad的部分
+            h, w = img_meta['img_shape'][:2]
+            seg_logit = seg_logits[img_id:img_id + 1, :, :h, :w]
+            if rescale:
+                seg_logit = F.interpolate(
+                    seg_logit,
+                    size=img_meta['ori_shape'][:2],
+                    mode='bilinear',
+                    align_corners=False)
+            results.append(seg_logits_to_labels(seg_logit)[0].cpu().numpy())
+        return results
 
     def aug_test(self, imgs, img_metas, rescale=False):
-        """Test with augmentations.
+        """Test with augmentations, only the bbox head is supported."""
+        return super().aug_test(imgs, img_metas, rescale=rescale)
 
-        If rescale is False, then returned bboxes and masks will fit the scale
-        of imgs[0].
-        """
-        x = self.extract_feats(imgs)
-        proposal_list = self.rpn_head.aug_test_rpn(x, img_metas)
-        return self.roi_head.aug_test(
-            x, proposal_list, img_metas, rescale=rescale)
+    def onnx_export(self, img, img_metas, with_nms=True):
+        """导出为一个包含所有启用任务的计算图.
 
-    def onnx_export(self, img, img_metas):
+        Args:
+            img (Tensor): Input images of shape (N, C, H, W).
+            img_metas (list[dict]): List of image information.
+            with_nms (bool): 是否在图中做NMS, 不支持NMS的后端可以关闭,
+                由调用方完成NMS. Defaults to True.
 
-        img_shape = torch._shape_as_tensor(img)[2:]
-        img_metas[0]['img_shape_for_onnx'] = img_shape
+        Returns:
+            tuple[Tensor]: 按照 ``bbox``, ``drivable``, ``lane`` 的顺序,
+                依次为启用的任务的输出:
+
+                - bbox: ``with_nms`` 时为 dets (N, K, 5) 与 labels (N, K),
+                  K 为 ``test_cfg.max_per_img``, 填充部分的label为-1;
+                  否则为 bboxes (N, num_priors, 4) 与
+                  scores (N, num_priors, num_classes).
+                - drivable, lane: (N, H, W) 的uint8 label map,
+                  尺寸为pad后的输入尺寸.
+        """
         x = self.extract_feat(img)
-        proposals = self.rpn_head.onnx_export(x, img_metas)
-        if hasattr(self.roi_head, 'onnx_export'):
-            return self.roi_head.onnx_export(x, proposals, img_metas)
-        else:
-            raise NotImplementedError(
-                f'{self.__class__.__name__} can not '
-                f'be exported to ONNX. Please refer to the '
-                f'list of supported models,'
-                f'https://mmdetection.readthedocs.io/en/latest/tutorials/pytorch2onnx.html#list-of-supported-models-exportable-to-onnx'  # noqa E501
-            )
+        outs = ()
+        if 'bbox' in self.test_tasks:
+            outs = outs + self._bbox_onnx_export(x, with_nms)
+        if self.with_drivable_head and 'drivable' in self.test_tasks:
+            outs = outs + (self._seg_onnx_export(self.drivable_head, x,
+                                                 img), )
+        if self.with_lane_head and 'lane' in self.test_tasks:
+            outs = outs + (self._seg_onnx_export(self.lane_head, x, img), )
+        return outs
+
+    def _bbox_onnx_export(self, x, with_nms=True):
+        """与 ``YOLOXHead.get_bboxes`` 相同的解码, 整个batch一起计算."""
+        head = self.bbox_head
+        cls_scores, bbox_preds, objectnesses = head(x)
+        num_imgs = cls_scores[0].size(0)
+        featmap_sizes = [cls_score.shape[2:] for cls_score in cls_scores]
+        mlvl_priors = head.prior_generator.grid_priors(
+            featmap_sizes,
+            dtype=cls_scores[0].dtype,
+            device=cls_scores[0].device,
+            with_stride=True)
+
+        flatten_cls_scores = torch.cat([
+            cls_score.permute(0, 2, 3, 1).reshape(num_imgs, -1,
+                                                  head.cls_out_channels)
+            for cls_score in cls_scores
+        ],
+                                       dim=1).sigmoid()
+        flatten_bbox_preds = torch.cat([
+            bbox_pred.permute(0, 2, 3, 1).reshape(num_imgs, -1, 4)
+            for bbox_pred in bbox_preds
+        ],
+                                       dim=1)
+        flatten_objectness = torch.cat([
+            objectness.permute(0, 2, 3, 1).reshape(num_imgs, -1)
+            for objectness in objectnesses
+        ],
+                                       dim=1).sigmoid()
+        bboxes = head._bbox_decode(
+            torch.cat(mlvl_priors), flatten_bbox_preds)
+        if not with_nms:
+            return bboxes, flatten_cls_scores * flatten_objectness[..., None]
+
+        # 与 YOLOXHead._bboxes_nms 相同, 每个框只保留得分最高的类别
+        max_scores, labels = flatten_cls_scores.max(dim=2)
+        scores = max_scores * flatten_objectness
+        cfg = self.test_cfg
+        return onnx_batched_nms(bboxes, scores, labels,
+                                cfg.nms.iou_threshold, cfg.score_thr,
+                                cfg.get('max_per_img', 100))
+
+    def _seg_onnx_export(self, head, x, img):
+        """Label map of a segmentation head at the padded input size."""
+        seg_logits = head(x[0])
+        seg_logits = F.interpolate(
+            seg_logits,
+            size=img.shape[2:],
+            mode='bilinear',
+            align_corners=False)
+        return seg_logits_to_labels(seg_logits)
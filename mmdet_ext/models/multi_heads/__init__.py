@@ -0,0 +1,4 @@
+# Copyright (c) windzu. All rights reserved.
+from .base_multi_head import BaseMultiHead
+
+__all__ = ['BaseMultiHead']
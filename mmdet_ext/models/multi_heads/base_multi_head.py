@@ -88,6 +88,22 @@ class BaseMultiHead(BaseModule, metaclass=ABCMeta):
             dtype=cls_scores[0].dtype,
             device=cls_scores[0].device)
 
+        # The batched path gives the same results as the per-image one, it
+        # is skipped when subclasses customize the per-image post-processing
+        # and when the NMS would mix the images, i.e. class agnostic NMS
+        # ignoring the (image, class) groups or ``max_num`` over the batch
+        test_cfg = self.test_cfg if cfg is None else cfg
+        if with_nms and not kwargs and \
+                not test_cfg.nms.get('class_agnostic', False) and \
+                test_cfg.nms.get('max_num', -1) <= 0 and \
+                type(self)._get_bboxes_single is \
+                BaseMultiHead._get_bboxes_single and \
+                type(self)._bbox_post_process is \
+                BaseMultiHead._bbox_post_process:
+            return self._get_bboxes_batched(cls_scores, bbox_preds,
+                                            score_factors, mlvl_priors,
+                                            img_metas, cfg, rescale)
+
         result_list = []
 
         for img_id in range(len(img_metas)):
@@ -106,6 +122,154 @@ class BaseMultiHead(BaseModule, metaclass=ABCMeta):
             result_list.append(results)
         return result_list
 
+    def _get_bboxes_batched(self,
+                            cls_scores,
+                            bbox_preds,
+                            score_factors,
+                            mlvl_priors,
+                            img_metas,
+                            cfg,
+                            rescale=False):
+        """Transform outputs of a batch into bbox predictions at once.
+
+        This is the batched counterpart of :meth:`_get_bboxes_single` followed
+        by :meth:`_bbox_post_process` with ``with_nms=True``. Instead of
+        looping over images and levels, all levels of all images are decoded
+        as one tensor, the ``nms_pre`` top-k of every (image, level) is taken
+        with a single sort, and NMS runs once over (image, class) groups.
+
+        The selected boxes, their order and the NMS inputs are the same as
+        the per-image path. Like ``batched_nms`` across classes, the offsets
+        separating the (image, class) groups may change the rounding of the
+        IoU of boxes in groups with large offsets. ``split_thr`` is raised
+        above the number of boxes, so that the offset NMS runs once instead
+        of once per (image, class) group for large batches. Class agnostic
+        NMS and ``max_num`` are not supported, as they would mix the images.
+
+        Args:
+            cls_scores (list[Tensor]): Classification scores for all
+                scale levels, each has shape
+                (batch_size, num_priors * num_classes, H, W).
+            bbox_preds (list[Tensor]): Box energies / deltas for all
+                scale levels, each has shape (batch_size, num_priors * 4, H, W).
+            score_factors (list[Tensor] | None): Score factor for all scale
+                levels, each has shape (batch_size, num_priors * 1, H, W).
+            mlvl_priors (list[Tensor]): Priors of each level.
+            img_metas (list[dict]): Image meta info.
+            cfg (mmcv.Config): Test / postprocessing configuration,
+                if None, test_cfg would be used.
+            rescale (bool): If True, return boxes in original image space.
+                Default: False.
+
+        Returns:
+            list[tuple[Tensor, Tensor]]: det_bboxes of shape (n, 5) and
+                det_labels of shape (n, ) of each image.
+        """
+        cfg = self.test_cfg if cfg is None else cfg
+        nms_pre = cfg.get('nms_pre', -1)
+        num_imgs = len(img_metas)
+        device = cls_scores[0].device
+
+        scores = torch.cat([
+            cls_score.permute(0, 2, 3, 1).reshape(num_imgs, -1,
+                                                  self.cls_out_channels)
+            for cls_score in cls_scores
+        ],
+                           dim=1)
+        if self.use_sigmoid_cls:
+            scores = scores.sigmoid()
+        else:
+            # remind that we set FG labels to [0, num_class-1]
+            # since mmdet v2.0
+            # BG cat_id: num_class
+            scores = scores.softmax(-1)[..., :-1]
+        num_classes = scores.size(-1)
+        bbox_preds = torch.cat([
+            bbox_pred.permute(0, 2, 3, 1).reshape(num_imgs, -1, 4)
+            for bbox_pred in bbox_preds
+        ],
+                               dim=1)
+        priors = torch.cat(mlvl_priors)
+        bboxes = self.bbox_coder.decode(
+            priors.expand(num_imgs, -1, -1),
+            bbox_preds,
+            max_shape=[img_meta['img_shape'] for img_meta in img_metas])
+
+        # Sort the scores of every image by (level, descending score) with a
+        # single sort. Scores are in [0, 1], so ``2 * level + 1 - score`` in
+        # float64 orders them exactly, and invalid scores go to the end of
+        # their level.
+        scores = scores.reshape(num_imgs, -1)
+        valid_mask = scores > cfg.score_thr
+        level_sizes = [len(p) * num_classes for p in mlvl_priors]
+        level_ids = torch.cat([
+            torch.full((size, ), i, dtype=torch.long, device=device)
+            for i, size in enumerate(level_sizes)
+        ])
+        sort_keys = torch.where(valid_mask,
+                                1 - scores.double(),
+                                scores.new_tensor(1.5, dtype=torch.double))
+        sort_keys = sort_keys + 2 * level_ids.double()
+        sort_inds = sort_keys.argsort(dim=1)
+
+        # Same as ``filter_scores_and_topk``, keep the first
+        # ``min(nms_pre, num_valid)`` scores of each level.
+        num_valid = valid_mask.new_zeros(
+            (num_imgs, len(mlvl_priors)), dtype=torch.long).scatter_add_(
+                1, level_ids.expand(num_imgs, -1), valid_mask.long())
+        if nms_pre < 0:
+            num_topk = (num_valid + nms_pre).clamp(min=0)
+        else:
+            num_topk = num_valid.clamp(max=nms_pre)
+        level_starts = torch.tensor([0] + level_sizes[:-1],
+                                    device=device).cumsum(0)
+        sorted_level_ids = level_ids[sort_inds]
+        ranks = torch.arange(sort_inds.size(1), device=device) - \
+            level_starts[sorted_level_ids]
+        keep_mask = ranks < num_topk.gather(1, sorted_level_ids)
+
+        img_inds, keep_inds = keep_mask.nonzero(as_tuple=True)
+        keep_inds = sort_inds[img_inds, keep_inds]
+        prior_inds = keep_inds // num_classes
+        labels = keep_inds % num_classes
+        scores = scores[img_inds, keep_inds]
+        bboxes = bboxes[img_inds, prior_inds]
+        if rescale:
+            scale_factors = torch.stack([
+                bboxes.new_tensor(img_meta['scale_factor']).view(-1)
+                for img_meta in img_metas
+            ])
+            bboxes = bboxes / scale_factors[img_inds]
+        if score_factors is not None:
+            score_factors = torch.cat([
+                score_factor.permute(0, 2, 3, 1).reshape(num_imgs, -1)
+                for score_factor in score_factors
+            ],
+                                      dim=1).sigmoid()
+            scores = scores * score_factors[img_inds, prior_inds]
+
+        if bboxes.numel() == 0:
+            det_bboxes = torch.cat([bboxes, scores[:, None]], -1)
+            return [(det_bboxes, labels) for _ in range(num_imgs)]
+
+        nms_cfg = dict(cfg.nms, split_thr=bboxes.size(0) + 1)
+        det_bboxes, keep_idxs = batched_nms(bboxes, scores,
+                                            img_inds * num_classes + labels,
+                                            nms_cfg)
+        det_labels = labels[keep_idxs]
+        det_img_inds = img_inds[keep_idxs]
+        # group the detections by image, keeping the score order
+        num_total = len(det_img_inds)
+        order = (det_img_inds * num_total +
+                 torch.arange(num_total, device=device)).argsort()
+        num_dets = det_img_inds.bincount(minlength=num_imgs).tolist()
+        result_list = []
+        for det_bbox, det_label in zip(det_bboxes[order].split(num_dets),
+                                       det_labels[order].split(num_dets)):
+            result_list.append(
+                (det_bbox[:cfg.max_per_img], det_label[:cfg.max_per_img]))
+        return result_list
+
     def _get_bboxes_single(self,
                            cls_score_list,
                            bbox_pred_list,
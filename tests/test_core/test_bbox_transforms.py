@@ -0,0 +1,86 @@
+# Copyright (c) windzu. All rights reserved.
+import numpy as np
+import pytest
+
+from mmdet_ext.core import build_label_map, result2arrays
+
+
+def _bbox_result():
+    """Per class bboxes of shape (n, 5) as returned by ``bbox2result``."""
+    return [
+        np.array([[0, 0, 10, 10, 0.9], [5, 5, 20, 20, 0.2]],
+                 dtype=np.float32),
+        np.zeros((0, 5), dtype=np.float32),
+        np.array([[1, 2, 3, 4, 0.6]], dtype=np.float32),
+        np.array([[4, 3, 8, 9, 0.7], [2, 2, 6, 6, 0.4]], dtype=np.float32),
+    ]
+
+
+def test_build_label_map():
+    src_classes = ('person', 'car', 'dog', 'motorcycle')
+    dst_classes = ('car', 'pedestrian', 'motor')
+    label_map = build_label_map(src_classes, dst_classes)
+    assert label_map.dtype == np.int64
+    assert label_map.tolist() == [-1, 0, -1, -1]
+
+    name_map = {'person': 'pedestrian', 'motorcycle': 'motor', 'dog': 'cat'}
+    label_map = build_label_map(src_classes, dst_classes, name_map)
+    assert label_map.tolist() == [1, 0, -1, 2]
+
+
+@pytest.mark.parametrize('result', [
+    [],
+    [np.zeros((0, 5), dtype=np.float32)] * 3,
+    ([np.zeros((0, 5), dtype=np.float32)] * 3, [[], [], []]),
+])
+def test_result2arrays_empty(result):
+    bboxes, scores, labels = result2arrays(result, score_thr=0.3)
+    assert bboxes.shape == (0, 4)
+    assert scores.shape == (0, )
+    assert labels.shape == (0, )
+    assert labels.dtype == np.int64
+
+
+@pytest.mark.parametrize('with_mask', [False, True])
+def test_result2arrays(with_mask):
+    result = _bbox_result()
+    if with_mask:
+        result = (result, [[] for _ in result])
+    bboxes, scores, labels = result2arrays(result)
+    assert bboxes.shape == (5, 4)
+    np.testing.assert_array_equal(labels, [0, 0, 2, 3, 3])
+    np.testing.assert_allclose(scores, [0.9, 0.2, 0.6, 0.7, 0.4])
+    np.testing.assert_array_equal(bboxes[2], [1, 2, 3, 4])
+
+    # the score filter keeps bboxes, scores and labels aligned
+    bboxes, scores, labels = result2arrays(result, score_thr=0.5)
+    np.testing.assert_array_equal(labels, [0, 2, 3])
+    np.testing.assert_allclose(scores, [0.9, 0.6, 0.7])
+    np.testing.assert_array_equal(bboxes,
+                                  [[0, 0, 10, 10], [1, 2, 3, 4], [4, 3, 8, 9]])
+
+    # a score equal to the threshold is dropped
+    _, scores, _ = result2arrays(result, score_thr=np.float32(0.6))
+    np.testing.assert_allclose(scores, [0.9, 0.7])
+
+
+def test_result2arrays_label_map():
+    label_map = np.array([2, 0, -1, 1])
+    bboxes, scores, labels = result2arrays(
+        _bbox_result(), label_map=label_map)
+    # class 2 is dropped, the others are renumbered
+    np.testing.assert_array_equal(labels, [2, 2, 1, 1])
+    np.testing.assert_allclose(scores, [0.9, 0.2, 0.7, 0.4])
+    np.testing.assert_array_equal(bboxes[2], [4, 3, 8, 9])
+
+    bboxes, scores, labels = result2arrays(
+        _bbox_result(), score_thr=0.5, label_map=label_map)
+    np.testing.assert_array_equal(labels, [2, 1])
+    np.testing.assert_allclose(scores, [0.9, 0.7])
+    np.testing.assert_array_equal(bboxes, [[0, 0, 10, 10], [4, 3, 8, 9]])
+
+    # every class dropped
+    bboxes, scores, labels = result2arrays(
+        _bbox_result(), label_map=np.full(4, -1))
+    assert bboxes.shape == (0, 4)
+    assert scores.shape == labels.shape == (0, )
@@ -0,0 +1,97 @@
+# Copyright (c) windzu. All rights reserved.
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+
+from mmdet_ext.core import LowResSegMap, seg_logits_to_labels
+
+
+def _logits(num_classes=3, shape=(8, 12)):
+    torch.manual_seed(0)
+    # float64 so that ties between the two implementations are unlikely
+    return torch.randn(num_classes, *shape, dtype=torch.float64)
+
+
+def _interpolate_labels(logits, size):
+    seg_logits = F.interpolate(
+        logits[None], size=size, mode='bilinear', align_corners=False)
+    return seg_logits_to_labels(seg_logits)[0].numpy()
+
+
+def test_seg_logits_to_labels():
+    logits = _logits()
+    labels = seg_logits_to_labels(logits[None])
+    assert labels.dtype == torch.uint8
+    assert torch.equal(labels[0].long(), logits.argmax(dim=0))
+
+    binary = seg_logits_to_labels(logits[None, :1])
+    assert torch.equal(binary[0].bool(), logits[0] > 0)
+
+
+@pytest.mark.parametrize('ori_shape', [(32, 48), (50, 70), (64, 96),
+                                       (20, 30)])
+def test_upsample_logits(ori_shape):
+    logits = _logits()
+    seg_map = LowResSegMap(logits, (32, 48), (32, 48), ori_shape)
+    assert seg_map.is_logits
+    assert seg_map.native_shape == (8, 12)
+    assert seg_map.stride == (4, 4)
+    # one step bilinear sampling with align_corners=False
+    expected = _interpolate_labels(logits, ori_shape)
+    upsampled = seg_map.upsample()
+    assert upsampled.dtype == np.uint8
+    np.testing.assert_array_equal(upsampled, expected)
+
+    # a smaller output frame, e.g. the downsampled message
+    np.testing.assert_array_equal(
+        seg_map.upsample(shape=(13, 18)), _interpolate_labels(logits,
+                                                              (13, 18)))
+
+
+def test_upsample_roi():
+    logits = _logits()
+    seg_map = LowResSegMap(logits, (32, 48), (32, 48), (50, 70))
+    full = seg_map.upsample()
+    for roi in [(0, 0, 70, 50), (10, 5, 40, 33), (-5, -5, 3, 4),
+                (60, 45, 100, 100)]:
+        x1, y1 = max(roi[0], 0), max(roi[1], 0)
+        np.testing.assert_array_equal(
+            seg_map.upsample(roi=roi), full[y1:roi[3], x1:roi[2]])
+    # empty region
+    assert seg_map.upsample(roi=(20, 20, 10, 30)).shape == (10, 0)
+
+
+def test_padded_input():
+    logits = _logits()
+    # the network input is padded from (30, 41) to (32, 48)
+    seg_map = LowResSegMap(logits, (32, 48), (30, 41), (60, 82))
+    labels = seg_map.labels()
+    # the padding is cropped at the native stride
+    assert labels.shape == (8, 11)
+    np.testing.assert_array_equal(labels,
+                                  logits.argmax(dim=0)[:8, :11].numpy())
+
+    assert seg_map.upsample().shape == (60, 82)
+
+    # padded from (28, 40), the image covers (7, 10) pixels of the map and
+    # the output pixel centers fall on the centers of the native pixels
+    seg_map = LowResSegMap(logits, (32, 48), (28, 40), (7, 10))
+    np.testing.assert_array_equal(seg_map.upsample(), seg_map.labels())
+    np.testing.assert_array_equal(seg_map.upsample(),
+                                  _interpolate_labels(logits[:, :7, :10],
+                                                      (7, 10)))
+
+
+def test_label_map():
+    rng = np.random.default_rng(0)
+    label_map = rng.integers(0, 4, size=(8, 12)).astype(np.uint8)
+    seg_map = LowResSegMap(label_map, (32, 48), (32, 48), (64, 96))
+    assert not seg_map.is_logits
+    np.testing.assert_array_equal(seg_map.labels(), label_map)
+    # nearest neighbour sampling at the pixel centers
+    np.testing.assert_array_equal(seg_map.upsample(),
+                                  label_map.repeat(8, 0).repeat(8, 1))
+    np.testing.assert_array_equal(
+        seg_map.upsample(shape=(16, 24), roi=(4, 2, 20, 10)),
+        label_map.repeat(2, 0).repeat(2, 1)[2:10, 4:20])
@@ -0,0 +1,61 @@
+# Copyright (c) windzu. All rights reserved.
+import os
+
+import numpy as np
+import pytest
+
+
+def _annos(class_names, seed):
+    rng = np.random.default_rng(seed)
+    num_boxes = len(class_names)
+    return {
+        'class_names': np.array(class_names, dtype=str),
+        'track_ids': np.array([f'{seed}_{i}' for i in range(num_boxes)],
+                              dtype=str),
+        'bbox2d': rng.integers(0, 100, (num_boxes, 4)).astype(np.int32),
+        'bbox3d': rng.uniform(-10, 10, (num_boxes, 7)).astype(np.float32),
+        'box_type_3d': 'LiDAR',
+        'truncated': rng.integers(0, 3, num_boxes).astype(np.int32),
+        'occluded': rng.integers(0, 3, num_boxes).astype(np.int32),
+        'num_points_in_gt': rng.integers(0, 500, num_boxes).astype(np.int32),
+    }
+
+
+@pytest.fixture
+def usd_data(tmp_path):
+    """生成一个小的USD数据集, 返回 (data_root, data_infos).
+
+    包含没有框的帧、不在类别列表中的类别, 以及点云文件不存在的帧
+    (scene_b 的 000002.bin).
+    """
+    data_root = str(tmp_path / 'usd')
+    frames = [
+        ('scene_a', '000000', ['car', 'pedestrian', 'car']),
+        ('scene_a', '000001', []),
+        ('scene_b', '000000', ['truck', 'car']),
+        ('scene_b', '000001', []),
+        ('scene_b', '000002', ['pedestrian']),
+    ]
+    data_infos = []
+    for i, (scene_name, seq, class_names) in enumerate(frames):
+        num_points = 10 * (i + 1)
+        pts_dir = os.path.join(data_root, scene_name, 'LIDAR')
+        os.makedirs(pts_dir, exist_ok=True)
+        if seq != '000002':
+            points = np.arange(num_points * 4, dtype=np.float32) + i
+            points.tofile(os.path.join(pts_dir, f'{seq}.bin'))
+        data_infos.append({
+            'scene_name': scene_name,
+            'seq': seq,
+            'images': None,
+            'point_clouds': {
+                'LIDAR': {
+                    'frame_id': 'LIDAR',
+                    'file_name': f'{seq}.bin',
+                    'shape': np.array([num_points, 4], dtype=np.int32),
+                    'annos': _annos(class_names, i),
+                }
+            },
+            'calib': None,
+        })
+    return data_root, data_infos
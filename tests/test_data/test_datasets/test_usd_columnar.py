@@ -0,0 +1,74 @@
+# Copyright (c) windzu. All rights reserved.
+from os import path as osp
+
+import numpy as np
+import pytest
+
+from mmdet3d_ext.datasets import USDColumnarAnnotations
+from mmdet3d_ext.datasets.usd_columnar import is_columnar_annotations
+
+
+def _assert_annos_equal(annos, expected):
+    for name in USDColumnarAnnotations.BOX_FIELDS:
+        value = np.asarray(expected[name])
+        assert annos[name].shape == value.shape, name
+        np.testing.assert_array_equal(annos[name], value, err_msg=name)
+    assert annos['box_type_3d'] == expected['box_type_3d']
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_round_trip(usd_data, tmp_path, mmap):
+    _, data_infos = usd_data
+    out_dir = str(tmp_path / 'usd_infos_train')
+    USDColumnarAnnotations.from_infos(data_infos).dump(out_dir)
+    assert is_columnar_annotations(out_dir)
+
+    annotations = USDColumnarAnnotations.load(out_dir, mmap=mmap)
+    assert isinstance(annotations.bbox3d, np.memmap) == mmap
+    assert len(annotations) == len(data_infos)
+    assert annotations.box_offsets.tolist() == [0, 3, 3, 5, 5, 6]
+    for i, raw_info in enumerate(data_infos):
+        info = annotations[i]
+        assert info['scene_name'] == raw_info['scene_name']
+        assert info['seq'] == raw_info['seq']
+        pts_info = info['point_clouds']['LIDAR']
+        raw_pts_info = raw_info['point_clouds']['LIDAR']
+        assert pts_info['file_name'] == raw_pts_info['file_name']
+        np.testing.assert_array_equal(pts_info['shape'],
+                                      raw_pts_info['shape'])
+        _assert_annos_equal(pts_info['annos'], raw_pts_info['annos'])
+    # 负数索引与越界
+    assert annotations[-1]['seq'] == data_infos[-1]['seq']
+    with pytest.raises(IndexError):
+        annotations[len(data_infos)]
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_all_frames_empty(usd_data, tmp_path, mmap):
+    _, data_infos = usd_data
+    data_infos = [
+        info for info in data_infos
+        if not len(info['point_clouds']['LIDAR']['annos']['class_names'])
+    ]
+    out_dir = str(tmp_path / 'usd_infos_val')
+    USDColumnarAnnotations.from_infos(data_infos).dump(out_dir)
+    annotations = USDColumnarAnnotations.load(out_dir, mmap=mmap)
+    assert annotations.box_offsets.tolist() == [0, 0, 0]
+    assert annotations.bbox2d.shape == (0, 4)
+    # 保留标注中bbox3d的列数
+    assert annotations.bbox3d.shape == (0, 7)
+    assert annotations.bbox3d.dtype == np.float32
+    for i in range(len(data_infos)):
+        annos = annotations.get_annos(i)
+        for name in USDColumnarAnnotations.BOX_FIELDS:
+            assert len(annos[name]) == 0, name
+
+
+def test_dump_overwrites(usd_data, tmp_path):
+    _, data_infos = usd_data
+    out_dir = str(tmp_path / 'usd_infos_train')
+    USDColumnarAnnotations.from_infos(data_infos).dump(out_dir)
+    USDColumnarAnnotations.from_infos(data_infos[:2]).dump(out_dir)
+    annotations = USDColumnarAnnotations.load(out_dir)
+    assert len(annotations) == 2
+    assert osp.exists(osp.join(out_dir, 'meta.json'))
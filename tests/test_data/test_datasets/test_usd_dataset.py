@@ -0,0 +1,180 @@
+# Copyright (c) windzu. All rights reserved.
+import os
+from os import path as osp
+
+import mmcv
+import numpy as np
+import pytest
+from mmdet3d.core.bbox import get_box_type
+
+from mmdet3d_ext.datasets import USDColumnarAnnotations, USDDataset
+from mmdet3d_ext.datasets.usd_index import USDSampleIndex
+
+CLASSES = ('car', 'pedestrian')
+
+
+def _legacy_data_info(dataset, raw_info):
+    """重构前 ``get_data_info`` 由 data_infos 逐帧计算的结果."""
+    pts_info = raw_info['point_clouds']['LIDAR']
+    pts_filename = osp.join(dataset.data_root, raw_info['scene_name'],
+                            'LIDAR', pts_info['file_name'])
+    if not osp.exists(pts_filename):
+        return None
+    annos = pts_info['annos']
+    gt_labels_3d = np.array([
+        dataset.CLASSES.index(cat) if cat in dataset.CLASSES else -1
+        for cat in annos['class_names']
+    ])
+    ori_box_type_3d, _ = get_box_type(annos['box_type_3d'])
+    gt_bboxes_3d = ori_box_type_3d(
+        annos['bbox3d'],
+        box_dim=annos['bbox3d'].shape[-1],
+        origin=(0.5, 0.5, 0.5)).convert_to(dataset.box_mode_3d)
+    return {
+        'seq': raw_info['seq'],
+        'pts_filename': pts_filename,
+        'ann_info': {
+            'gt_bboxes_3d': gt_bboxes_3d,
+            'gt_labels_3d': gt_labels_3d,
+        },
+    }
+
+
+def _assert_ann_info_equal(ann_info, expected):
+    np.testing.assert_allclose(
+        np.asarray(ann_info['gt_bboxes_3d'].tensor),
+        np.asarray(expected['gt_bboxes_3d'].tensor).reshape(-1, 7),
+        rtol=0,
+        atol=1e-6)
+    np.testing.assert_array_equal(ann_info['gt_labels_3d'],
+                                  expected['gt_labels_3d'].reshape(-1))
+
+
+def _dump_infos(usd_data):
+    data_root, data_infos = usd_data
+    ann_file = osp.join(data_root, 'usd_infos_train.pkl')
+    mmcv.dump(data_infos, ann_file)
+    return data_root, data_infos, ann_file
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+def test_get_data_info_matches_legacy(usd_data, columnar):
+    data_root, data_infos, ann_file = _dump_infos(usd_data)
+    if columnar:
+        ann_file = osp.join(data_root, 'usd_infos_train')
+        USDColumnarAnnotations.from_infos(data_infos).dump(ann_file)
+    dataset = USDDataset(
+        data_root, ann_file, classes=CLASSES, test_mode=True)
+    assert len(dataset) == len(data_infos)
+
+    for i, raw_info in enumerate(data_infos):
+        result = dataset.get_data_info(i)
+        expected = _legacy_data_info(dataset, raw_info)
+        if expected is None:
+            assert result is None
+            continue
+        assert result['seq'] == expected['seq']
+        assert result['pts_filename'] == expected['pts_filename']
+        _assert_ann_info_equal(result['ann_info'], expected['ann_info'])
+        # 不在类别列表中的 truck 为-1
+        if 'truck' in raw_info['point_clouds']['LIDAR']['annos'][
+                'class_names']:
+            assert -1 in result['ann_info']['gt_labels_3d']
+
+    # pipeline 修改返回的框不影响索引
+    result = dataset.get_data_info(0)
+    result['ann_info']['gt_bboxes_3d'].tensor[:] = 0
+    result['ann_info']['gt_labels_3d'][:] = 0
+    _assert_ann_info_equal(
+        dataset.get_data_info(0)['ann_info'],
+        _legacy_data_info(dataset, data_infos[0])['ann_info'])
+
+
+def test_evaluate_inputs_match_legacy(usd_data, monkeypatch):
+    data_root, data_infos, ann_file = _dump_infos(usd_data)
+    # 点云文件都存在时旧的 evaluate 才能运行
+    pts_filename = osp.join(data_root, 'scene_b', 'LIDAR', '000002.bin')
+    np.zeros(4, dtype=np.float32).tofile(pts_filename)
+    dataset = USDDataset(
+        data_root, ann_file, classes=CLASSES, test_mode=True)
+
+    class _Stop(Exception):
+        pass
+
+    captured = []
+
+    def format_gt_annos(gt_annos):
+        captured.extend(gt_annos)
+        raise _Stop
+
+    monkeypatch.setattr(dataset, 'format_dt_annos', lambda results: results)
+    monkeypatch.setattr(dataset, 'format_gt_annos', format_gt_annos)
+    with pytest.raises(_Stop):
+        dataset.evaluate([dict() for _ in range(len(dataset))])
+
+    assert len(captured) == len(data_infos)
+    for gt_annos, raw_info in zip(captured, data_infos):
+        expected = _legacy_data_info(dataset, raw_info)['ann_info']
+        np.testing.assert_allclose(
+            gt_annos['gt_bboxes_3d'],
+            np.asarray(expected['gt_bboxes_3d'].tensor).reshape(-1, 7),
+            rtol=0,
+            atol=1e-6)
+        np.testing.assert_array_equal(gt_annos['gt_labels_3d'],
+                                      expected['gt_labels_3d'].reshape(-1))
+
+
+def test_cache_index(usd_data, monkeypatch):
+    data_root, data_infos, ann_file = _dump_infos(usd_data)
+    index_file = osp.join(data_root, 'usd_infos_train_index.npz')
+    built = []
+    build = USDSampleIndex.build
+
+    def counting_build(*args, **kwargs):
+        built.append(args[2])
+        return build(*args, **kwargs)
+
+    monkeypatch.setattr(USDSampleIndex, 'build', counting_build)
+
+    dataset = USDDataset(
+        data_root, ann_file, classes=CLASSES, test_mode=True,
+        cache_index=True)
+    assert osp.exists(index_file)
+    assert len(built) == 1
+
+    # 索引有效时直接加载, 不读取 ann_file
+    cached = USDDataset(
+        data_root, ann_file, classes=CLASSES, test_mode=True,
+        cache_index=True)
+    assert len(built) == 1
+    assert cached._data_infos is None
+    for name in USDSampleIndex.FIELDS:
+        np.testing.assert_array_equal(
+            getattr(cached.index, name), getattr(dataset.index, name))
+
+    # 类别变化时重新构建
+    classes = ('pedestrian', 'car', 'truck')
+    rebuilt = USDDataset(
+        data_root, ann_file, classes=classes, test_mode=True,
+        cache_index=True)
+    assert len(built) == 2
+    assert built[-1] == classes
+    boxes, labels = rebuilt.index.get_boxes(2)
+    assert labels.tolist() == [2, 1]
+
+    # ann_file 变化时重新构建
+    data_infos[0]['point_clouds']['LIDAR']['annos']['class_names'][:] = \
+        'pedestrian'
+    mmcv.dump(data_infos, ann_file)
+    stat = os.stat(ann_file)
+    os.utime(ann_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    rebuilt = USDDataset(
+        data_root, ann_file, classes=classes, test_mode=True,
+        cache_index=True)
+    assert len(built) == 3
+    assert rebuilt.index.get_boxes(0)[1].tolist() == [0, 0, 0]
+    # 之后再次加载保存的新索引
+    USDDataset(
+        data_root, ann_file, classes=classes, test_mode=True,
+        cache_index=True)
+    assert len(built) == 3
@@ -0,0 +1,130 @@
+# Copyright (c) windzu. All rights reserved.
+import os
+import pickle
+from os import path as osp
+
+import mmcv
+import numpy as np
+import pytest
+
+from mmdet3d_ext.datasets import LoadPointsFromShard, USDDataset
+from mmdet3d_ext.datasets.usd_shards import (ShardedFiles, ShardReader,
+                                             ShardWriter)
+from tools.data_converter.usd_converter import pack_usd_files
+
+
+def _write_shards(out_dir, files, **kwargs):
+    writer = ShardWriter(out_dir, **kwargs)
+    for key, data, shape in files:
+        writer.add(key, data, shape)
+    writer.close()
+    return ShardedFiles(out_dir)
+
+
+def test_round_trip(tmp_path):
+    out_dir = str(tmp_path / 'shards')
+    files = [
+        ('b/000001.bin', b'\1' * 100, (25, )),
+        ('a/000000.bin', b'\2' * 5000, (1250, )),
+        ('c/000002.bin', b'\3' * 20000, (1000, 5)),
+        ('c/000003.bin', b'', ()),
+        ('a/000004.bin', b'\4' * 3000, (2, 3, 500)),
+    ]
+    shards = _write_shards(out_dir, files, shard_size=10000, align=4096)
+    assert len(shards) == len(files)
+
+    # 超过shard_size时开始新的shard, 单个超过shard_size的文件独占一个shard
+    assert [osp.basename(f) for f in shards.shard_files] == \
+        ['shard_00000.bin', 'shard_00001.bin', 'shard_00002.bin']
+    rows = shards.lookup([key for key, _, _ in files])
+    locations = [shards.location(row) for row in rows]
+    assert [(osp.basename(f), offset) for f, offset, _ in locations] == [
+        ('shard_00000.bin', 0),
+        ('shard_00000.bin', 4096),
+        ('shard_00001.bin', 0),
+        ('shard_00002.bin', 0),
+        ('shard_00002.bin', 0),
+    ]
+    for (key, data, shape), row in zip(files, rows):
+        shard_file, offset, length = shards.location(row)
+        # 每个文件的起始位置都对齐
+        assert offset % 4096 == 0
+        assert length == len(data)
+        assert shards.read(row) == data
+        assert shards.shape(row) == shape
+    # 对齐的空隙填0
+    with open(shards.shard_files[0], 'rb') as f:
+        assert f.read(4096)[100:] == b'\0' * (4096 - 100)
+    assert os.path.getsize(shards.shard_files[2]) == 3000
+
+    # 不存在的key为-1, 包括排在所有key前后的
+    assert shards.lookup(['0', 'b/000000.bin', 'z']).tolist() == [-1, -1, -1]
+    assert shards.lookup([]).tolist() == []
+    shards.close()
+
+
+def test_empty_and_duplicated_keys(tmp_path):
+    shards = _write_shards(str(tmp_path / 'empty'), [])
+    assert len(shards) == 0
+    assert shards.lookup(['a']).tolist() == [-1]
+
+    out_dir = str(tmp_path / 'duplicated')
+    with pytest.raises(AssertionError, match='duplicated keys'):
+        _write_shards(out_dir, [('a', b'1', ()), ('b', b'2', ()),
+                                ('a', b'3', ())])
+    # 没有写入 meta.json, 不会被当作完整的shard读取
+    assert not osp.exists(osp.join(out_dir, 'meta.json'))
+    with pytest.raises(FileNotFoundError):
+        ShardedFiles(out_dir)
+
+
+def test_shard_reader_pickle(tmp_path):
+    shards = _write_shards(
+        str(tmp_path / 'shards'), [('a', b'abc', ()), ('b', b'defg', ())])
+    reader = ShardReader()
+    assert reader.read(*shards.location(1)) == b'defg'
+    assert len(reader._fds) == 1
+
+    # 序列化时不保存打开的fd, 反序列化后重新打开
+    restored = pickle.loads(pickle.dumps(reader))
+    assert restored._fds == {}
+    assert restored.read(*shards.location(0)) == b'abc'
+    reader.close()
+    restored.close()
+    assert restored._fds == {}
+
+
+@pytest.mark.parametrize('use_mmap', [False, True])
+def test_pack_usd_files(usd_data, use_mmap):
+    data_root, data_infos = usd_data
+    ann_file = osp.join(data_root, 'usd_infos_train.pkl')
+    mmcv.dump(data_infos, ann_file)
+    out_dir = pack_usd_files(data_root, ann_file, shard_size=1000)
+    assert out_dir == osp.join(data_root, 'usd_shards_train')
+
+    shards = ShardedFiles(out_dir)
+    # scene_b/LIDAR/000002.bin 不存在, 打包时跳过
+    assert len(shards) == len(data_infos) - 1
+    assert shards.shape(shards.lookup(['scene_a/LIDAR/000001.bin'])[0]) == \
+        (20, 4)
+
+    dataset = USDDataset(
+        data_root,
+        ann_file,
+        classes=('car', 'pedestrian'),
+        test_mode=True,
+        points_shards=out_dir)
+    loader = LoadPointsFromShard(
+        coord_type='LIDAR', load_dim=4, use_dim=[0, 1, 3], use_mmap=use_mmap)
+    for i, info in enumerate(data_infos):
+        results = dataset.get_data_info(i)
+        if info['seq'] == '000002':
+            assert results is None
+            continue
+        expected = np.fromfile(
+            results['pts_filename'], dtype=np.float32).reshape(-1, 4)
+        # shard中读取的点云与原文件相同
+        os.remove(results['pts_filename'])
+        points = loader(results)['points']
+        np.testing.assert_array_equal(
+            np.asarray(points.tensor), expected[:, [0, 1, 3]])
@@ -0,0 +1,241 @@
+# Copyright (c) windzu. All rights reserved.
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from mmdet3d_ext.datasets import LoadPointsFromPointCloud2
+from mmdet3d_ext.datasets.pipelines.loading import (
+    POINT_FIELD_DTYPES, pointcloud2_to_structured, voxel_keys)
+
+DATATYPES = {np.dtype(v): k for k, v in POINT_FIELD_DTYPES.items()}
+
+
+def _pointcloud2(columns,
+                 height=1,
+                 point_step=None,
+                 row_padding=0,
+                 is_bigendian=False):
+    """构建 PointCloud2 的替身, 与 tools/ros_utils/compact.py 相同.
+
+    Args:
+        columns (list[tuple]): 每个field的 (name, dtype, values), values 为
+            (N, ) 或 (N, count)
+        height (int): 行数
+        point_step (int, optional): 每个点的字节数, 默认为各field的总长度
+        row_padding (int): 每行末尾填充的字节数
+        is_bigendian (bool): 是否为大端
+    """
+    byte_order = '>' if is_bigendian else '<'
+    names, formats, offsets, fields = [], [], [], []
+    offset = 0
+    for name, dtype, values in columns:
+        dtype = np.dtype(dtype)
+        values = np.asarray(values)
+        count = values.shape[1] if values.ndim == 2 else 1
+        names.append(name)
+        formats.append((dtype.newbyteorder(byte_order), (count, ))
+                       if count > 1 else dtype.newbyteorder(byte_order))
+        offsets.append(offset)
+        fields.append(
+            SimpleNamespace(
+                name=name,
+                offset=offset,
+                datatype=DATATYPES[dtype],
+                count=count))
+        offset += dtype.itemsize * count
+    point_step = point_step or offset
+    num_points = len(columns[0][2])
+    data = np.zeros(
+        num_points,
+        dtype=np.dtype(
+            dict(
+                names=names,
+                formats=formats,
+                offsets=offsets,
+                itemsize=point_step)))
+    # 填充的字节为非0, 读到填充时结果一定不对
+    data.view(np.uint8)[:] = 0xff
+    for name, _, values in columns:
+        data[name] = values
+    width = num_points // height
+    rows = data.view(np.uint8).reshape(height, width * point_step)
+    padding = np.full((height, row_padding), 0xff, dtype=np.uint8)
+    return SimpleNamespace(
+        header=SimpleNamespace(
+            stamp=SimpleNamespace(to_sec=lambda: 0.0), frame_id='lidar'),
+        height=height,
+        width=width,
+        fields=fields,
+        is_bigendian=is_bigendian,
+        point_step=point_step,
+        row_step=width * point_step + row_padding,
+        data=np.hstack([rows, padding]).tobytes())
+
+
+def _xyzi_msg(points):
+    return _pointcloud2([(name, np.float32, points[:, i])
+                         for i, name in enumerate('xyz')] +
+                        [('intensity', np.float32, points[:, 3])])
+
+
+def _load(msg, **kwargs):
+    transform = LoadPointsFromPointCloud2(
+        coord_type='LIDAR', load_dim=4, use_dim=[0, 1, 2, 3], **kwargs)
+    results = transform(dict(pc=msg))
+    return np.asarray(results['points'].tensor), \
+        results['num_discarded_points']
+
+
+@pytest.mark.parametrize('is_bigendian', [False, True])
+def test_pointcloud2_to_structured(is_bigendian):
+    rng = np.random.default_rng(0)
+    num_points = 12
+    x, y, z = rng.uniform(-50, 50, (3, num_points))
+    intensity = rng.uniform(0, 255, num_points)
+    ring = rng.integers(0, 64, num_points)
+    rgb = rng.uniform(0, 1, (num_points, 3))
+    # field的顺序与offset都与 FIELD_NAMES 不同, 包括 count>1 的field
+    msg = _pointcloud2([
+        ('intensity', np.float32, intensity),
+        ('rgb', np.float32, rgb),
+        ('ring', np.uint16, ring),
+        ('x', np.float64, x),
+        ('y', np.float32, y),
+        ('z', np.float32, z),
+    ],
+                       height=3,
+                       point_step=48,
+                       row_padding=20,
+                       is_bigendian=is_bigendian)
+    assert [field.offset for field in msg.fields] == [0, 4, 16, 18, 26, 30]
+    # 不支持的datatype被跳过
+    msg.fields.append(
+        SimpleNamespace(name='unknown', offset=34, datatype=0, count=1))
+
+    pc_data = pointcloud2_to_structured(msg)
+    assert pc_data.shape == (num_points, )
+    assert pc_data.dtype.names == ('intensity', 'rgb', 'ring', 'x', 'y', 'z')
+    np.testing.assert_array_equal(pc_data['x'], x)
+    np.testing.assert_array_equal(pc_data['y'], y.astype(np.float32))
+    np.testing.assert_array_equal(pc_data['ring'], ring)
+    # count>1 的field只取第一个元素
+    np.testing.assert_array_equal(pc_data['rgb'], rgb[:, 0].astype(np.float32))
+    # 行末有填充时只能拷贝, 否则与msg.data共享内存
+    assert not np.shares_memory(pc_data,
+                                np.frombuffer(msg.data, dtype=np.uint8))
+
+    transform = LoadPointsFromPointCloud2(
+        coord_type='LIDAR', load_dim=6, use_dim=[0, 1, 2, 3, 4, 5])
+    points = np.asarray(transform(dict(pc=msg))['points'].tensor)
+    expected = np.stack([x, y, z, intensity, ring,
+                         np.zeros(num_points)], axis=1).astype(np.float32)
+    np.testing.assert_array_equal(points, expected)
+
+
+def test_pointcloud2_shares_memory():
+    points = np.random.default_rng(0).uniform(-50, 50, (12, 4))
+    msg = _xyzi_msg(points)
+    msg.height, msg.width, msg.row_step = 3, 4, 4 * msg.point_step
+    pc_data = pointcloud2_to_structured(msg)
+    # 没有填充时不拷贝任何点
+    assert np.shares_memory(pc_data, np.frombuffer(msg.data, dtype=np.uint8))
+    np.testing.assert_array_equal(pc_data['x'],
+                                  points[:, 0].astype(np.float32))
+
+
+def test_missing_fields():
+    points = np.random.default_rng(0).uniform(-50, 50, (10, 3))
+    msg = _pointcloud2([(name, np.float32, points[:, i])
+                        for i, name in enumerate('xyz')])
+    transform = LoadPointsFromPointCloud2(
+        coord_type='LIDAR', load_dim=5, use_dim=[0, 1, 2, 3, 4])
+    loaded = np.asarray(transform(dict(pc=msg))['points'].tensor)
+    # msg中没有的 intensity 与 ring 填充为0
+    np.testing.assert_array_equal(loaded[:, :3], points.astype(np.float32))
+    np.testing.assert_array_equal(loaded[:, 3:], 0)
+
+
+def _first_of_voxel(points, voxel_size):
+    """按行比较去重的参考实现, 每个voxel保留第一个点."""
+    coords = np.floor(points[:, :3] / np.asarray(voxel_size)).astype(np.int64)
+    _, first = np.unique(coords, axis=0, return_index=True)
+    return points[np.sort(first)]
+
+
+def test_no_filter():
+    points = np.random.default_rng(0).uniform(-50, 50, (100, 4))
+    points[3, 0] = np.nan
+    loaded, num_discarded = _load(_xyzi_msg(points))
+    np.testing.assert_array_equal(loaded, points.astype(np.float32))
+    assert num_discarded == dict(nan=0, range=0, downsample=0)
+
+
+def test_num_discarded_points():
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-60, 60, (2000, 4)).astype(np.float32)
+    # 重复的点落在同一个voxel中
+    points[1000:1500] = points[:500] + 0.01
+    points[[1, 5, 7], 0] = np.nan
+    points[9, 2] = np.inf
+    # 边界上的点被丢弃
+    points[11, :3] = [-50, 0, 0]
+    point_cloud_range = [-50, -50, -5, 50, 50, 3]
+    voxel_size = [0.5, 0.5, 8]
+
+    finite = np.isfinite(points[:, :3]).all(axis=1)
+    r = point_cloud_range
+    in_range = finite & (points[:, 0] > r[0]) & (points[:, 1] > r[1]) & \
+        (points[:, 2] > r[2]) & (points[:, 0] < r[3]) & \
+        (points[:, 1] < r[4]) & (points[:, 2] < r[5])
+    expected = _first_of_voxel(points[in_range], voxel_size)
+
+    loaded, num_discarded = _load(
+        _xyzi_msg(points),
+        point_cloud_range=point_cloud_range,
+        filter_nan=True,
+        voxel_size=voxel_size)
+    np.testing.assert_array_equal(loaded, expected)
+    assert num_discarded == dict(
+        nan=4,
+        range=int(finite.sum() - in_range.sum()),
+        downsample=int(in_range.sum()) - len(expected))
+    assert sum(num_discarded.values()) + len(loaded) == len(points)
+
+
+def test_voxel_drops_nan():
+    points = np.zeros((6, 4), dtype=np.float32)
+    points[:, 0] = [0.1, np.nan, 0.2, 1.5, -np.inf, 1.6]
+    # filter_nan=False 时NaN也不会参与voxel的计算
+    loaded, num_discarded = _load(
+        _xyzi_msg(points), filter_nan=False, voxel_size=[1, 1, 1])
+    np.testing.assert_array_equal(loaded[:, 0], points[[0, 3], 0])
+    assert num_discarded == dict(nan=2, range=0, downsample=2)
+
+
+def test_max_points():
+    points = np.random.default_rng(0).uniform(-50, 50, (1000, 4))
+    msg = _xyzi_msg(points)
+    loaded, num_discarded = _load(msg, max_points=100, seed=0)
+    assert len(loaded) == 100
+    assert num_discarded == dict(nan=0, range=0, downsample=900)
+    # 保留的点维持原来的顺序
+    rows = [np.flatnonzero((points.astype(np.float32) == p).all(axis=1))[0]
+            for p in loaded]
+    assert rows == sorted(rows)
+    # 相同的seed结果相同
+    np.testing.assert_array_equal(
+        _load(msg, max_points=100, seed=0)[0], loaded)
+
+
+@pytest.mark.parametrize('scale', [1, 1 << 30])
+def test_voxel_keys(scale):
+    coords = np.random.default_rng(0).integers(-5, 5, (1000, 3)) * scale
+    keys = voxel_keys(coords)
+    assert keys.dtype == np.int64
+    # key相同当且仅当voxel坐标相同
+    _, expected = np.unique(coords, axis=0, return_inverse=True)
+    _, inverse = np.unique(keys, return_inverse=True)
+    same = inverse[:, None] == inverse[None, :]
+    expected = expected.reshape(-1)
+    np.testing.assert_array_equal(same, expected[:, None] == expected[None, :])
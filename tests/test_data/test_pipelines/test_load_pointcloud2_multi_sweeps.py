@@ -0,0 +1,141 @@
+# Copyright (c) windzu. All rights reserved.
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from mmdet3d.core.points import LiDARPoints
+
+from mmdet3d_ext.datasets import LoadPointsFromPointCloud2MultiSweeps
+
+
+def _results(points, stamp, pose=None):
+    results = dict(
+        points=LiDARPoints(points, points_dim=points.shape[1]),
+        pc=SimpleNamespace(
+            header=SimpleNamespace(stamp=SimpleNamespace(
+                to_sec=lambda: stamp))))
+    if pose is not None:
+        results['pose'] = pose
+    return results
+
+
+def _frame(value, num_points=4):
+    points = np.zeros((num_points, 5), dtype=np.float32)
+    points[:, 0] = np.arange(num_points) + 10
+    points[:, 1] = value
+    points[:, 3] = value * 10
+    return points
+
+
+def _pose(yaw, translation):
+    pose = np.eye(4)
+    pose[:2, :2] = [[np.cos(yaw), -np.sin(yaw)], [np.sin(yaw), np.cos(yaw)]]
+    pose[:3, 3] = translation
+    return pose
+
+
+def test_time_dim_validation():
+    with pytest.raises(AssertionError):
+        # 覆盖 intensity
+        LoadPointsFromPointCloud2MultiSweeps(load_dim=5, time_dim=3)
+    with pytest.raises(AssertionError):
+        # 没有空闲的维度写入时间差
+        LoadPointsFromPointCloud2MultiSweeps(
+            load_dim=4, use_dim=[0, 1, 2, 3], time_dim=4)
+    transform = LoadPointsFromPointCloud2MultiSweeps(load_dim=5)
+    with pytest.raises(AssertionError):
+        transform(_results(np.zeros((4, 4), dtype=np.float32), 0.0))
+
+
+def test_sweeps():
+    transform = LoadPointsFromPointCloud2MultiSweeps(
+        sweeps_num=2, use_dim=[0, 1, 2, 3, 4])
+    points = transform(_results(_frame(0), 0.0))['points']
+    np.testing.assert_array_equal(np.asarray(points.tensor), _frame(0))
+
+    for i in range(1, 4):
+        points = np.asarray(
+            transform(_results(_frame(i), i * 0.1))['points'].tensor)
+        # 当前帧在前, 之后是从新到旧的历史帧, 最多 sweeps_num 帧
+        sweeps = list(range(i, max(i - 3, -1), -1))
+        assert len(points) == 4 * len(sweeps)
+        np.testing.assert_array_equal(points[:, 1], np.repeat(sweeps, 4))
+        np.testing.assert_array_equal(points[:, 3],
+                                      np.repeat(sweeps, 4) * 10)
+        np.testing.assert_allclose(
+            points[:, 4], (i - np.repeat(sweeps, 4)) * 0.1, atol=1e-6)
+
+    # use_dim 选择最后保留的维度
+    transform = LoadPointsFromPointCloud2MultiSweeps(sweeps_num=2)
+    transform(_results(_frame(0), 0.0))
+    points = np.asarray(transform(_results(_frame(1), 0.1))['points'].tensor)
+    assert points.shape == (8, 4)
+    np.testing.assert_allclose(points[4:, 3], 0.1, atol=1e-6)
+
+
+def test_pose_compensation():
+    # 相同的位姿时历史帧的坐标不变
+    transform = LoadPointsFromPointCloud2MultiSweeps(
+        sweeps_num=1, use_dim=[0, 1, 2, 3, 4])
+    pose = _pose(0.3, [5, -2, 1])
+    transform(_results(_frame(0), 0.0, pose))
+    points = np.asarray(
+        transform(_results(_frame(1), 0.1, pose))['points'].tensor)
+    np.testing.assert_allclose(points[4:, :4], _frame(0)[:, :4], atol=1e-5)
+
+    # 当前帧相对历史帧绕z轴旋转90度并平移
+    transform.reset()
+    transform(_results(_frame(0), 0.0, _pose(0, [0, 0, 0])))
+    points = np.asarray(
+        transform(_results(_frame(1), 0.1,
+                           _pose(np.pi / 2, [1, 2, 0.5])))['points'].tensor)
+    sweep = _frame(0)
+    # 当前lidar坐标系下: p' = R^T (p - t), R为旋转90度
+    expected = np.stack(
+        [sweep[:, 1] - 2, -(sweep[:, 0] - 1), sweep[:, 2] - 0.5], axis=1)
+    np.testing.assert_allclose(points[4:, :3], expected, atol=1e-5)
+    # 当前帧与其他维度不受影响
+    np.testing.assert_array_equal(points[:4, :4], _frame(1)[:, :4])
+    np.testing.assert_array_equal(points[4:, 3], sweep[:, 3])
+
+    # 缺少位姿时不做补偿
+    transform.reset()
+    transform(_results(_frame(0), 0.0))
+    points = np.asarray(
+        transform(_results(_frame(1), 0.1, pose))['points'].tensor)
+    np.testing.assert_array_equal(points[4:, :4], _frame(0)[:, :4])
+
+
+def test_timestamp_rewind():
+    transform = LoadPointsFromPointCloud2MultiSweeps(
+        sweeps_num=3, use_dim=[0, 1, 2, 3, 4])
+    for i in range(3):
+        transform(_results(_frame(i), 10 + i * 0.1))
+    assert len(transform.sweeps) == 3
+    # bag重新播放, 时间戳回退时丢弃历史帧
+    points = np.asarray(transform(_results(_frame(5), 10.0))['points'].tensor)
+    np.testing.assert_array_equal(points, _frame(5))
+    assert len(transform.sweeps) == 1
+    # 相同的时间戳不视为回退
+    points = np.asarray(transform(_results(_frame(6), 10.0))['points'].tensor)
+    assert len(points) == 8
+
+
+def test_pad_empty_sweeps():
+    transform = LoadPointsFromPointCloud2MultiSweeps(
+        sweeps_num=3,
+        use_dim=[0, 1, 2, 3, 4],
+        pad_empty_sweeps=True,
+        remove_close=True)
+    frame = _frame(0.5)
+    frame[0, :2] = [0.2, 0.3]
+    points = np.asarray(transform(_results(frame, 0.0))['points'].tensor)
+    # 没有历史帧时重复当前帧, 重复的帧同样去除近处的点
+    assert len(points) == 4 + 3 * 3
+    np.testing.assert_array_equal(points[:4], frame)
+    np.testing.assert_array_equal(
+        points[4:], np.tile(frame[1:], (3, 1)))
+    # 之后使用真实的历史帧
+    points = np.asarray(
+        transform(_results(_frame(1), 0.1))['points'].tensor)
+    assert len(points) == 4 + 3
@@ -0,0 +1,83 @@
+# Copyright (c) windzu. All rights reserved.
+import numpy as np
+import pytest
+
+from mmdet3d_ext.datasets import LoadPointsFromFileExtension
+from mmdet3d_ext.datasets.pipelines.loading import gather_point_dims
+
+
+def _baseline_load_points(pts_filename, load_dim, use_dim):
+    """修改前的实现: 补0到 len(use_dim) 维之后索引 use_dim."""
+    points = np.fromfile(pts_filename, dtype=np.float32)
+    points = points.reshape(-1, load_dim)
+    if load_dim < len(use_dim):
+        dim_diff = len(use_dim) - load_dim
+        points = np.concatenate(
+            [points, np.zeros((points.shape[0], dim_diff))], axis=1)
+    return points[:, use_dim]
+
+
+@pytest.fixture
+def pts_file(tmp_path):
+
+    def make(load_dim, num_points=50):
+        rng = np.random.default_rng(load_dim)
+        filename = str(tmp_path / f'{load_dim}.bin')
+        rng.random((num_points, load_dim), dtype=np.float32).tofile(filename)
+        return filename
+
+    return make
+
+
+@pytest.mark.parametrize('use_mmap', [False, True])
+@pytest.mark.parametrize('load_dim, use_dim', [
+    (4, [0, 1, 2, 3]),
+    (5, 4),
+    (5, [0, 1, 2, 4]),
+    (4, [3, 0, 1]),
+    (4, [0, 1, 2, 3, 4]),
+    (3, [0, 1, 2, 3, 4]),
+    (3, [0, 1, 3, 2]),
+    (6, [5, 5, 0]),
+])
+def test_matches_baseline(pts_file, use_mmap, load_dim, use_dim):
+    filename = pts_file(load_dim)
+    loader = LoadPointsFromFileExtension(
+        coord_type='LIDAR',
+        load_dim=load_dim,
+        use_dim=use_dim,
+        use_mmap=use_mmap)
+    points = loader._load_points(filename)
+    if isinstance(use_dim, int):
+        use_dim = list(range(use_dim))
+    expected = _baseline_load_points(filename, load_dim, use_dim)
+    assert points.dtype == np.float32
+    assert points.shape == (50, len(use_dim))
+    np.testing.assert_array_equal(points, expected)
+
+    results = loader(dict(pts_filename=filename))
+    np.testing.assert_array_equal(
+        np.asarray(results['points'].tensor), expected)
+
+
+@pytest.mark.parametrize('load_dim, use_dim', [
+    (4, [0, 1, 2, 4]),
+    (4, [4, 0]),
+    (3, [0, 1, 2, 5, 3]),
+])
+def test_use_dim_out_of_range(pts_file, load_dim, use_dim):
+    # 修改前的实现在索引时报错
+    with pytest.raises(IndexError):
+        _baseline_load_points(pts_file(load_dim), load_dim, use_dim)
+    with pytest.raises(AssertionError):
+        LoadPointsFromFileExtension(
+            coord_type='LIDAR', load_dim=load_dim, use_dim=use_dim)
+
+
+def test_gather_point_dims_out():
+    points = np.arange(12, dtype=np.float32).reshape(3, 4)
+    out = np.full((3, 4), -1, dtype=np.float32)
+    result = gather_point_dims(points, [2, 3, 4, 0], out=out)
+    assert result is out
+    np.testing.assert_array_equal(
+        out, [[2, 3, 0, 0], [6, 7, 0, 4], [10, 11, 0, 8]])
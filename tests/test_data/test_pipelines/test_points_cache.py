@@ -0,0 +1,203 @@
+# Copyright (c) windzu. All rights reserved.
+import os
+import os.path as osp
+import subprocess
+
+import numpy as np
+import pytest
+
+from mmdet3d_ext.datasets.pipelines import (LRUPointsCache, PointsCache,
+                                            SharedPointsCache,
+                                            build_points_cache)
+
+
+def _points(value, num=100):
+    return np.full(num, value, dtype=np.float32)
+
+
+def test_points_cache_is_abstract():
+    with pytest.raises(TypeError):
+        PointsCache(1024)
+
+
+def test_lru_eviction_order():
+    # 每个数组400字节, 最多缓存3个
+    cache = LRUPointsCache(max_bytes=1200)
+    for key in 'abc':
+        cache.put(key, _points(ord(key)))
+    assert cache.nbytes == 1200
+    # 访问a之后b是最久未使用的
+    assert cache.get('a')[0] == ord('a')
+    cache.put('d', _points(ord('d')))
+    assert cache.get('b') is None
+    for key in 'acd':
+        assert cache.get(key)[0] == ord(key)
+    assert cache.nbytes == 1200
+    assert cache.evictions == 1
+
+    # 覆盖已有的key不重复计算字节数
+    cache.put('a', _points(1.0))
+    assert cache.nbytes == 1200
+    assert cache.get('a')[0] == 1.0
+
+
+def test_lru_byte_budget():
+    cache = LRUPointsCache(max_bytes=1000)
+    small = cache.put('small', _points(0, 50))
+    # 超过上限的数组不缓存, 原样返回
+    big = _points(1, 1000)
+    assert cache.put('big', big) is big
+    assert cache.get('big') is None
+    assert cache.get('small') is small
+    for i in range(10):
+        cache.put(i, _points(i, 100))
+        assert cache.nbytes <= cache.max_bytes
+    # 最后只剩下两个400字节的数组, small与其余8个被淘汰
+    assert cache.nbytes == 800
+    assert cache.get('small') is None
+    assert cache.evictions == 9
+
+
+def test_lru_counters_and_readonly():
+    cache = LRUPointsCache(max_bytes=1 << 20)
+    calls = []
+
+    def load():
+        calls.append(1)
+        return _points(3.0)
+
+    first = cache.load('x', load)
+    second = cache.load('x', load)
+    assert len(calls) == 1
+    assert first is second
+    assert not first.flags.writeable
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['hit_rate'] == 0.5
+    assert stats['nbytes'] == 400
+
+
+def test_lru_copies_memmap(tmp_path):
+    filename = str(tmp_path / 'points.bin')
+    _points(5.0).tofile(filename)
+    cache = LRUPointsCache(max_bytes=1 << 20)
+    points = cache.put('x', np.memmap(filename, dtype=np.float32, mode='r'))
+    assert not isinstance(points, np.memmap)
+    np.testing.assert_array_equal(points, _points(5.0))
+
+
+def test_shared_cache_hit_and_miss(tmp_path):
+    filename = str(tmp_path / 'points.bin')
+    _points(1.0).tofile(filename)
+    cache = SharedPointsCache(1 << 20, cache_dir=str(tmp_path / 'cache'))
+
+    def load():
+        return np.fromfile(filename, dtype=np.float32)
+
+    np.testing.assert_array_equal(cache.load(filename, load), _points(1.0))
+    points = cache.load(filename, load)
+    np.testing.assert_array_equal(points, _points(1.0))
+    assert not points.flags.writeable
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+    # 另一个实例(例如另一个worker)共享同一个目录
+    other = SharedPointsCache(1 << 20, cache_dir=str(tmp_path / 'cache'))
+    np.testing.assert_array_equal(other.get(filename), _points(1.0))
+    # 不存在的文件不缓存
+    missing = str(tmp_path / 'missing.bin')
+    assert cache.load(missing, lambda: _points(2.0))[0] == 2.0
+    assert cache.get(missing) is None
+
+
+def test_shared_cache_invalidation(tmp_path, monkeypatch):
+    cache = SharedPointsCache(1 << 20, cache_dir=str(tmp_path / 'cache'))
+    filename = str(tmp_path / 'points.bin')
+    _points(1.0).tofile(filename)
+    cache.put(filename, np.fromfile(filename, dtype=np.float32))
+    assert cache.get(filename)[0] == 1.0
+
+    # 大小不变, 内容与mtime变化
+    _points(2.0).tofile(filename)
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert cache.get(filename) is None
+    cache.put(filename, np.fromfile(filename, dtype=np.float32))
+    assert cache.get(filename)[0] == 2.0
+
+    # 两个数据集中相同的相对路径不会互相命中
+    for name, value in [('a', 3.0), ('b', 4.0)]:
+        os.makedirs(tmp_path / name / 'data')
+        _points(value).tofile(str(tmp_path / name / 'data' / 'points.bin'))
+    monkeypatch.chdir(tmp_path / 'a')
+    cache.put('data/points.bin', _points(3.0))
+    assert cache.get('data/points.bin')[0] == 3.0
+    monkeypatch.chdir(tmp_path / 'b')
+    assert cache.get('data/points.bin') is None
+
+    # shard中的帧由 (shard文件, offset) 区分
+    cache.put((filename, 0), _points(5.0))
+    assert cache.get((filename, 4096)) is None
+    assert cache.get((filename, 0))[0] == 5.0
+
+
+def test_shared_cache_byte_budget(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    # 每个文件为400字节的数据与128字节的.npy头
+    cache = SharedPointsCache(2000, cache_dir=cache_dir)
+    filenames = []
+    for i in range(10):
+        filename = str(tmp_path / f'{i}.bin')
+        _points(i).tofile(filename)
+        filenames.append(filename)
+        stat = os.stat(filename)
+        cache.put(filename, _points(i))
+        # 用mtime区分写入的先后
+        path = cache._path(filename)
+        os.utime(path, ns=(stat.st_atime_ns, i * 10**9))
+    cache._evict()
+    assert cache.nbytes <= 2000
+    # 最近写入的文件被保留
+    assert cache.get(filenames[-1])[0] == 9
+    assert cache.get(filenames[0]) is None
+    assert cache.evictions > 0
+
+
+def test_shared_cache_tmp_files(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    os.makedirs(cache_dir)
+    # 已经退出的进程留下的临时文件
+    process = subprocess.Popen(['true'])
+    process.wait()
+    orphan = osp.join(cache_dir, f'0.npy.{process.pid}.tmp')
+    live = osp.join(cache_dir, f'1.npy.{os.getpid()}.tmp')
+    for path in (orphan, live):
+        with open(path, 'wb') as f:
+            f.write(b'\0' * 1000)
+
+    cache = SharedPointsCache(500, cache_dir=cache_dir)
+    assert not osp.exists(orphan)
+    # 写入中的临时文件计入占用, 并且可以被淘汰
+    assert cache.nbytes == 1000
+    cache._evict()
+    assert not osp.exists(live)
+    assert cache.nbytes == 0
+
+
+def test_build_points_cache(tmp_path):
+    assert build_points_cache(None) is None
+    cfg = dict(max_bytes=1024, name='test_build_points_cache')
+    cache = build_points_cache(cfg)
+    assert isinstance(cache, LRUPointsCache)
+    # 同名的配置返回同一个实例, 配置本身不被修改
+    assert build_points_cache(cfg) is cache
+    assert cfg == dict(max_bytes=1024, name='test_build_points_cache')
+    shared = build_points_cache(
+        dict(
+            max_bytes=1024,
+            scope='shared',
+            cache_dir=str(tmp_path),
+            name='test_build_points_cache_shared'))
+    assert isinstance(shared, SharedPointsCache)
+    with pytest.raises(ValueError):
+        build_points_cache(dict(max_bytes=1024, scope='node', name='x'))
@@ -0,0 +1,157 @@
+# Copyright (c) windzu. All rights reserved.
+import mmcv
+import pytest
+import torch
+from mmcv.runner import BaseModule
+from mmdet.core import build_bbox_coder, build_prior_generator
+from mmdet.core.utils import select_single_mlvl
+
+from mmdet_ext.models.multi_heads import BaseMultiHead
+
+
+class DummyMultiHead(BaseMultiHead):
+    """Minimal head to exercise the post-processing of ``BaseMultiHead``."""
+
+    def __init__(self, num_classes, test_cfg):
+        BaseModule.__init__(self)
+        self.num_classes = num_classes
+        self.cls_out_channels = num_classes
+        self.use_sigmoid_cls = True
+        self.test_cfg = test_cfg
+        self.prior_generator = build_prior_generator(
+            dict(
+                type='AnchorGenerator',
+                scales=[4],
+                ratios=[0.5, 1.0, 2.0],
+                strides=[8, 16]))
+        self.bbox_coder = build_bbox_coder(
+            dict(
+                type='DeltaXYWHBBoxCoder',
+                target_means=[0., 0., 0., 0.],
+                target_stds=[1.0, 1.0, 1.0, 1.0]))
+
+    def loss(self, **kwargs):
+        pass
+
+
+def _per_image_results(head, cls_scores, bbox_preds, score_factors,
+                       img_metas, cfg, rescale):
+    featmap_sizes = [cls_score.shape[-2:] for cls_score in cls_scores]
+    mlvl_priors = head.prior_generator.grid_priors(featmap_sizes)
+    results = []
+    for img_id, img_meta in enumerate(img_metas):
+        if score_factors is None:
+            score_factor_list = [None for _ in cls_scores]
+        else:
+            score_factor_list = select_single_mlvl(score_factors, img_id)
+        results.append(
+            head._get_bboxes_single(
+                select_single_mlvl(cls_scores, img_id),
+                select_single_mlvl(bbox_preds, img_id), score_factor_list,
+                mlvl_priors, img_meta, cfg, rescale))
+    return results
+
+
+def _canonical(det_bboxes, det_labels):
+    """Sort the detections by (score, label), the order of tied scores is
+    unspecified."""
+    order = det_labels.argsort(stable=True)
+    order = order[det_bboxes[order, 4].argsort(stable=True)]
+    return torch.cat([det_bboxes, det_labels[:, None].float()], dim=1)[order]
+
+
+def _random_inputs(num_imgs, num_classes, featmap_sizes, with_score_factors):
+    num_priors = 3
+    cls_scores, bbox_preds, score_factors = [], [], []
+    for h, w in featmap_sizes:
+        cls_score = torch.randn(num_imgs, num_priors, num_classes, h, w)
+        # class 1 ties with class 0, class 2 is below every other class so
+        # that the last valid score of a level (dropped by nms_pre=-1) is
+        # unique
+        cls_score[:, :, 1] = cls_score[:, :, 0]
+        cls_score[:, :, 2] = cls_score[:, :, 2].clamp(-3, 3) - 10
+        bbox_pred = torch.randn(num_imgs, num_priors * 4, h, w) * 0.5
+        score_factor = torch.randn(num_imgs, num_priors, h, w)
+        # the second image is a copy of the first one, boxes of different
+        # images with the same scores must not suppress each other
+        cls_score[1] = cls_score[0]
+        bbox_pred[1] = bbox_pred[0]
+        score_factor[1] = score_factor[0]
+        cls_scores.append(cls_score.reshape(num_imgs, -1, h, w))
+        bbox_preds.append(bbox_pred)
+        score_factors.append(score_factor)
+    if not with_score_factors:
+        score_factors = None
+    return cls_scores, bbox_preds, score_factors
+
+
+@pytest.mark.parametrize('nms_pre', [-1, 30, 1000])
+@pytest.mark.parametrize('rescale', [True, False])
+@pytest.mark.parametrize('with_score_factors', [True, False])
+def test_get_bboxes_batched(nms_pre, rescale, with_score_factors):
+    torch.manual_seed(0)
+    num_imgs, num_classes = 3, 3
+    featmap_sizes = [(8, 8), (4, 4)]
+    cfg = mmcv.Config(
+        dict(
+            nms_pre=nms_pre,
+            score_thr=0.0,
+            nms=dict(type='nms', iou_threshold=0.5),
+            max_per_img=1000))
+    head = DummyMultiHead(num_classes, cfg)
+    img_metas = [
+        dict(
+            img_shape=(64, 64, 3),
+            scale_factor=[s, s * 1.5, s, s * 1.5]) for s in (1.0, 0.5, 2.0)
+    ]
+    cls_scores, bbox_preds, score_factors = _random_inputs(
+        num_imgs, num_classes, featmap_sizes, with_score_factors)
+
+    expected = _per_image_results(head, cls_scores, bbox_preds,
+                                  score_factors, img_metas, cfg, rescale)
+    results = head.get_bboxes(
+        cls_scores,
+        bbox_preds,
+        score_factors=score_factors,
+        img_metas=img_metas,
+        rescale=rescale)
+
+    assert len(results) == num_imgs
+    for (det_bboxes, det_labels), (exp_bboxes, exp_labels) in zip(
+            results, expected):
+        assert len(det_bboxes) > 0
+        assert torch.equal(det_bboxes[:, 4], exp_bboxes[:, 4])
+        assert torch.allclose(
+            _canonical(det_bboxes, det_labels),
+            _canonical(exp_bboxes, exp_labels),
+            rtol=0,
+            atol=1e-5)
+
+
+@pytest.mark.parametrize('nms', [
+    dict(type='nms', iou_threshold=0.5, class_agnostic=True),
+    dict(type='nms', iou_threshold=0.5, max_num=5)
+])
+def test_get_bboxes_per_image_nms(nms):
+    torch.manual_seed(0)
+    num_imgs, num_classes = 3, 3
+    cfg = mmcv.Config(
+        dict(nms_pre=-1, score_thr=0.0, nms=nms, max_per_img=1000))
+    head = DummyMultiHead(num_classes, cfg)
+    img_metas = [
+        dict(img_shape=(64, 64, 3), scale_factor=[1.0, 1.0, 1.0, 1.0])
+        for _ in range(num_imgs)
+    ]
+    cls_scores, bbox_preds, _ = _random_inputs(num_imgs, num_classes,
+                                               [(8, 8), (4, 4)], False)
+
+    expected = _per_image_results(head, cls_scores, bbox_preds, None,
+                                  img_metas, cfg, False)
+    results = head.get_bboxes(cls_scores, bbox_preds, img_metas=img_metas)
+
+    # the images are never mixed, the copied image gets the same detections
+    for (det_bboxes, det_labels), (exp_bboxes, exp_labels) in zip(
+            results, expected):
+        assert torch.equal(det_bboxes, exp_bboxes)
+        assert torch.equal(det_labels, exp_labels)
+    assert torch.equal(results[0][0], results[1][0])
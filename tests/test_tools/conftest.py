@@ -0,0 +1,9 @@
+# Copyright (c) windzu. All rights reserved.
+import os.path as osp
+import sys
+
+# tools/ 下的脚本以 ``from ros_utils import ...`` 的方式导入, 与直接运行脚本时
+# 的 sys.path 保持一致
+TOOLS_DIR = osp.join(osp.dirname(osp.dirname(osp.dirname(__file__))), 'tools')
+if TOOLS_DIR not in sys.path:
+    sys.path.insert(0, TOOLS_DIR)
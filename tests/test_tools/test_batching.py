@@ -0,0 +1,106 @@
+# Copyright (c) windzu. All rights reserved.
+import threading
+import time
+
+from ros_utils.batching import MicroBatcher
+
+
+class _Recorder:
+
+    def __init__(self, block=False):
+        self.batches = []
+        self.times = []
+        self.event = threading.Event()
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def __call__(self, batch):
+        self.batches.append(batch)
+        self.times.append(time.perf_counter())
+        self.event.set()
+        self.release.wait()
+        if any(item == 'fail' for _, item in batch):
+            raise ValueError('process failed')
+
+
+def test_flush_on_size():
+    recorder = _Recorder()
+    # 窗口很长, 所有topic到达后立即处理
+    batcher = MicroBatcher(['a', 'b', 'c'], recorder, window=60)
+    batcher.start()
+    batcher.put('c', 1)
+    batcher.put('a', 2)
+    batcher.put('b', 3)
+    assert recorder.event.wait(5)
+    # 按照topic的顺序组成batch
+    assert recorder.batches == [[('a', 2), ('b', 3), ('c', 1)]]
+    start = time.perf_counter()
+    batcher.stop()
+    assert time.perf_counter() - start < 5
+
+
+def test_flush_on_timeout():
+    recorder = _Recorder()
+    batcher = MicroBatcher(['a', 'b'], recorder, window=0.1)
+    batcher.start()
+    start = time.perf_counter()
+    batcher.put('b', 1)
+    # 同一个topic只保留最新的一帧
+    batcher.put('b', 2)
+    assert recorder.event.wait(5)
+    # 'a' 没有到达, 窗口结束后处理已经到达的topic
+    assert recorder.batches == [[('b', 2)]]
+    assert recorder.times[0] - start >= 0.1
+    assert batcher.dropped == dict(a=0, b=1)
+
+    # 处理失败不影响之后的batch
+    recorder.event.clear()
+    batcher.put('a', 'fail')
+    batcher.put('b', 3)
+    assert recorder.event.wait(5)
+    recorder.event.clear()
+    batcher.put('a', 4)
+    batcher.put('b', 5)
+    assert recorder.event.wait(5)
+    assert recorder.batches[1:] == [[('a', 'fail'), ('b', 3)],
+                                    [('a', 4), ('b', 5)]]
+    batcher.stop()
+
+
+def test_stop_with_pending():
+    recorder = _Recorder(block=True)
+    batcher = MicroBatcher(['a', 'b'], recorder, window=60)
+    batcher.start()
+    batcher.put('a', 1)
+    batcher.put('b', 2)
+    assert recorder.event.wait(5)
+    # 处理第一个batch时到达的帧在stop时被丢弃
+    batcher.put('a', 3)
+    stopper = threading.Thread(target=batcher.stop)
+    stopper.start()
+    time.sleep(0.05)
+    # stop 等待处理中的batch结束
+    assert stopper.is_alive()
+    recorder.release.set()
+    stopper.join(5)
+    assert not stopper.is_alive()
+    assert recorder.batches == [[('a', 1), ('b', 2)]]
+    assert batcher._pending == {}
+
+    # stop 之后放入的帧被忽略
+    batcher.put('a', 4)
+    assert batcher._pending == {}
+
+
+def test_stop_while_waiting():
+    recorder = _Recorder()
+    batcher = MicroBatcher(['a', 'b'], recorder, window=60)
+    batcher.start()
+    batcher.put('a', 1)
+    time.sleep(0.05)
+    # 等待窗口结束时stop, 不会等待整个窗口, 也不处理未完成的batch
+    start = time.perf_counter()
+    batcher.stop()
+    assert time.perf_counter() - start < 5
+    assert recorder.batches == []
@@ -0,0 +1,108 @@
+# Copyright (c) windzu. All rights reserved.
+import itertools
+import math
+
+import cv2
+import numpy as np
+import pytest
+from ros_utils.image import ReducedImageDecoder, get_reduce_factor
+
+
+def _rescale_size(img_shape, img_scale):
+    """与 mmcv.rescale_size 相同, 返回保持长宽比 Resize 后的 (h, w)."""
+    h, w = img_shape
+    scale = min(max(img_scale) / max(h, w), min(img_scale) / min(h, w))
+    return int(h * scale + 0.5), int(w * scale + 0.5)
+
+
+def _jpeg(shape, rects):
+    img = np.zeros((*shape, 3), dtype=np.uint8)
+    for x1, y1, x2, y2 in rects:
+        img[y1:y2, x1:x2] = 255
+    return cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 95])[1]
+
+
+def _bright_bbox(img):
+    ys, xs = np.nonzero(img.max(axis=2) > 127)
+    return [xs.min(), ys.min(), xs.max() + 1, ys.max() + 1]
+
+
+@pytest.mark.parametrize(
+    'img_shape, img_scale',
+    list(
+        itertools.product([(480, 640), (1080, 1920), (1201, 1919),
+                           (720, 1280), (2048, 2448), (375, 1242)],
+                          [(1333, 800), (640, 640), (320, 320), (1216, 384),
+                           (960, 540), (100, 60), (4000, 3000)])))
+def test_get_reduce_factor(img_shape, img_scale):
+    h, w = img_shape
+    factor = get_reduce_factor(img_shape, img_scale, keep_ratio=True)
+    assert factor in (1, 2, 4, 8)
+    reduced_shape = (math.ceil(h / factor), math.ceil(w / factor))
+    # 缩小后的图像不小于原图 Resize 后的尺寸, Resize 后的尺寸基本不变
+    new_h, new_w = _rescale_size(img_shape, img_scale)
+    if factor > 1:
+        assert reduced_shape[0] >= new_h and reduced_shape[1] >= new_w
+    assert _rescale_size(reduced_shape, img_scale) == pytest.approx(
+        (new_h, new_w), abs=1)
+
+    factor = get_reduce_factor(img_shape, img_scale, keep_ratio=False)
+    # 不保持长宽比时, 宽和高都不小于 Resize 的目标尺寸
+    if factor > 1:
+        assert math.ceil(w / factor) >= img_scale[0]
+        assert math.ceil(h / factor) >= img_scale[1]
+    # 选择满足条件的最大倍数
+    if factor < 8:
+        assert w / (factor * 2) < img_scale[0] or \
+            h / (factor * 2) < img_scale[1]
+
+
+@pytest.mark.parametrize('shape', [(480, 640), (483, 645)])
+def test_reduced_image_decoder(shape):
+    rects = [(100, 60, 300, 220), (400, 300, 600, 440)]
+    buf = _jpeg(shape, rects).tobytes()
+    decoder = ReducedImageDecoder((320, 240))
+
+    # 第一帧以原始分辨率解码
+    img = decoder.decode(buf)
+    assert img.shape == (*shape, 3)
+    assert decoder.ori_shape == shape
+    assert decoder.factor == 2
+
+    # 之后的帧以缩小后的分辨率解码, 并且不小于 Resize 后的尺寸
+    img = decoder.decode(buf)
+    assert img.shape[:2] == (math.ceil(shape[0] / 2), math.ceil(shape[1] / 2))
+    assert min(img.shape[:2]) >= 240 and max(img.shape[:2]) >= 320
+
+    # 在缩小的图像上得到的bbox转换回原图坐标
+    bboxes = []
+    for x1, y1, x2, y2 in rects:
+        crop = np.zeros_like(img)
+        crop[y1 // 2:y2 // 2, x1 // 2:x2 // 2] = \
+            img[y1 // 2:y2 // 2, x1 // 2:x2 // 2]
+        bboxes.append(_bright_bbox(crop) + [0.9])
+    bbox_result = [np.array(bboxes, dtype=np.float32), np.zeros((0, 5))]
+    result = decoder.rescale_det2d_result((bbox_result, [[], []]),
+                                          img.shape)
+    np.testing.assert_allclose(
+        result[0][0][:, :4], rects, atol=decoder.factor * 1.01)
+    # 分数不变
+    np.testing.assert_allclose(result[0][0][:, 4], 0.9)
+
+    # 图像尺寸变化时重新以原始分辨率解码
+    img = decoder.decode(_jpeg((960, 1280), rects).tobytes())
+    assert img.shape[:2] == (960, 1280)
+    assert decoder.factor == 4
+    img = decoder.decode(_jpeg((960, 1280), rects).tobytes())
+    assert img.shape[:2] == (240, 320)
+
+
+def test_rescale_full_resolution():
+    decoder = ReducedImageDecoder((1333, 800))
+    img = decoder.decode(_jpeg((480, 640), []).tobytes())
+    # 图像小于 Resize 的尺寸时不缩小
+    assert decoder.factor == 1
+    assert decoder.decode(_jpeg((480, 640), []).tobytes()).shape == img.shape
+    bbox_result = [np.array([[1, 2, 3, 4, 0.5]], dtype=np.float32)]
+    result = decoder.rescale_det2d_result(bbox_result, img.shape)
+    np.testing.assert_array_equal(result[0], [[1, 2, 3, 4, 0.5]])
@@ -0,0 +1,113 @@
+# Copyright (c) windzu. All rights reserved.
+import urllib.request
+
+import numpy as np
+import pytest
+from ros_utils import metrics as metrics_module
+from ros_utils.metrics import LatencyMetrics, NullMetrics
+
+
+class _Clock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_null_metrics():
+    metrics = NullMetrics()
+    assert not metrics.enabled
+    with metrics.timer('infer') as timer:
+        pass
+    assert timer is metrics.timer('decode')
+    assert metrics.record('infer', 1.0) is None
+    assert metrics.count('dropped', 3) is None
+    assert metrics.frame_done() is None
+    assert metrics.start() is None
+    assert metrics.close() is None
+    # 不记录任何状态
+    assert vars(metrics) == {}
+
+
+def test_summary(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(metrics_module.time, 'perf_counter', clock)
+    metrics = LatencyMetrics(window=100)
+    values = np.arange(1, 201) / 1000
+    for value in values:
+        metrics.record('infer', value)
+    with metrics.timer('decode'):
+        clock.now += 0.25
+    metrics.count('dropped', 3)
+    metrics.count('dropped', 5)
+    for _ in range(30):
+        metrics.frame_done()
+    clock.now += 1.75
+
+    summary = metrics.summary()
+    # 2秒内完成30帧
+    assert summary['fps'] == pytest.approx(15)
+    assert summary['frames'] == 30
+    infer = summary['stages']['infer']
+    # 总数与总和包含所有样本, 分位数只使用最近 window 个样本
+    assert infer['count'] == 200
+    assert infer['sum'] == pytest.approx(values.sum())
+    expected = np.quantile(values[-100:], [0.5, 0.95, 0.99])
+    assert list(infer['quantiles']) == [0.5, 0.95, 0.99]
+    np.testing.assert_allclose(list(infer['quantiles'].values()), expected)
+    assert infer['quantiles'][0.5] == pytest.approx(0.1505)
+    assert summary['stages']['decode']['count'] == 1
+    assert summary['stages']['decode']['quantiles'][0.99] == pytest.approx(
+        0.25)
+    assert summary['counters'] == dict(dropped=dict(total=8, count=2))
+
+    # fps 只统计上一次输出之后的帧
+    for _ in range(5):
+        metrics.frame_done()
+    clock.now += 0.5
+    summary = metrics.summary()
+    assert summary['fps'] == pytest.approx(10)
+    assert summary['frames'] == 35
+
+
+def test_initial_exposition(tmp_path):
+    prom_file = tmp_path / 'metrics.prom'
+    metrics = LatencyMetrics(
+        interval=60, prom_file=str(prom_file), http_port=0, prefix='test')
+    metrics.record('infer', 0.1)
+    metrics.start()
+    try:
+        # 第一次定期输出之前采集到计数为0的指标
+        port = metrics._server.server_address[1]
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}') as resp:
+            body = resp.read().decode()
+        assert resp.status == 200
+        assert '# TYPE test_stage_latency_seconds summary' in body
+        assert 'test_fps 0.000' in body
+        assert 'stage="infer"' not in body
+        assert prom_file.read_text() == body
+    finally:
+        metrics.close()
+
+
+def test_close_reports(tmp_path, capsys):
+    prom_file = tmp_path / 'metrics.prom'
+    log_file = tmp_path / 'metrics.log'
+    metrics = LatencyMetrics(
+        interval=60, log_file=str(log_file), prom_file=str(prom_file))
+    metrics.start()
+    metrics.record('infer', 0.1)
+    metrics.frame_done()
+    # 运行时间短于 interval, close 时输出最后一次统计结果
+    metrics.close()
+    text = prom_file.read_text()
+    assert 'rosrun_stage_latency_seconds_count{stage="infer"} 1' in text
+    assert 'frames: 1' in log_file.read_text()
+    assert 'frames: 1' in capsys.readouterr().out
+    assert not (tmp_path / 'metrics.prom.tmp').exists()
+
+    # 重复 close 不再输出
+    metrics.close()
+    assert capsys.readouterr().out == ''
@@ -0,0 +1,139 @@
+# Copyright (c) windzu. All rights reserved.
+import threading
+import time
+
+import pytest
+from ros_utils.pipeline import LatestSlot, StagedPipeline
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            pytest.fail('timed out')
+        time.sleep(0.001)
+
+
+def test_latest_slot():
+    slot = LatestSlot()
+    assert slot.empty()
+    assert not slot.put(1)
+    # 未被取走的旧数据被覆盖
+    assert slot.put(2)
+    assert slot.put(3)
+    assert slot.dropped == 2
+    assert slot.get() == 3
+    assert slot.empty()
+
+    # get 阻塞直到有数据
+    results = []
+    thread = threading.Thread(target=lambda: results.append(slot.get()))
+    thread.start()
+    time.sleep(0.05)
+    assert results == []
+    slot.put(4)
+    thread.join(5)
+    assert results == [4]
+
+    # close 唤醒等待的 get, 并丢弃尚未取走的数据
+    thread = threading.Thread(target=lambda: results.append(slot.get()))
+    thread.start()
+    time.sleep(0.05)
+    assert not slot.close()
+    thread.join(5)
+    assert results == [4, None]
+
+    slot = LatestSlot()
+    slot.put(1)
+    assert slot.close()
+    assert slot.get() is None
+    # 关闭后放入的数据直接丢弃, 不计入 dropped
+    assert slot.put(2)
+    assert slot.get() is None
+    assert slot.dropped == 0
+
+
+class _Stages:
+    """两个阶段, 第二个阶段处理每一帧前等待 ``release``."""
+
+    def __init__(self):
+        self.release = threading.Semaphore(0)
+        self.started = []
+        self.outputs = []
+
+    def decode(self, item):
+        if item == 'skip':
+            return None
+        if item == 'fail':
+            raise ValueError('decode failed')
+        return item
+
+    def infer(self, item):
+        self.started.append(item)
+        self.release.acquire()
+        self.outputs.append(item)
+
+
+def test_staged_pipeline():
+    stages = _Stages()
+    pipeline = StagedPipeline([('decode', stages.decode),
+                               ('infer', stages.infer)])
+    pipeline.start()
+
+    pipeline.put(0)
+    _wait_until(lambda: stages.started == [0])
+    # infer 处理第0帧时, 等待的帧只保留最新的一帧
+    for i in range(1, 4):
+        pipeline.put(i)
+        # 第i帧在infer的入口等待, 并且已经完成了对旧帧的覆盖
+        _wait_until(lambda: pipeline.slots[0].empty() and
+                    not pipeline.slots[1].empty() and pipeline.in_flight == 2)
+    assert pipeline.dropped_frames == dict(decode=0, infer=2)
+    assert pipeline.in_flight == 2
+    assert not pipeline.idle
+
+    stages.release.release()
+    _wait_until(lambda: stages.started == [0, 3])
+    stages.release.release()
+    _wait_until(lambda: pipeline.idle)
+    assert stages.outputs == [0, 3]
+    assert pipeline.processed == [4, 2]
+
+    # 返回None与抛出异常的帧不再向后传递, 也不影响之后的帧
+    pipeline.put('skip')
+    pipeline.put('fail')
+    _wait_until(lambda: pipeline.idle)
+    pipeline.put(4)
+    _wait_until(lambda: stages.started[-1] == 4)
+    stages.release.release()
+    _wait_until(lambda: pipeline.idle)
+    assert stages.outputs == [0, 3, 4]
+    pipeline.stop()
+    assert pipeline.idle
+
+
+def test_staged_pipeline_stop():
+    stages = _Stages()
+    pipeline = StagedPipeline([('decode', stages.decode),
+                               ('infer', stages.infer)])
+    pipeline.start()
+    pipeline.put(0)
+    _wait_until(lambda: stages.started == [0])
+    pipeline.put(1)
+    _wait_until(lambda: not pipeline.slots[1].empty())
+    assert pipeline.in_flight == 2
+
+    # stop 等待处理中的第0帧, 丢弃等待中的第1帧
+    stopper = threading.Thread(target=pipeline.stop)
+    stopper.start()
+    _wait_until(lambda: pipeline.in_flight == 1)
+    stages.release.release()
+    stopper.join(5)
+    assert not stopper.is_alive()
+    assert stages.outputs == [0]
+    assert pipeline.in_flight == 0
+    assert pipeline.idle
+
+    # stop 之后送入的帧直接丢弃
+    pipeline.put(2)
+    assert pipeline.idle
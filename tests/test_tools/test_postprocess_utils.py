@@ -0,0 +1,190 @@
+# Copyright (c) windzu. All rights reserved.
+import math
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from ros_utils.postprocess_utils import (det3d_objects, det3d_result_arrays,
+                                         label_map_runs, label_polygons,
+                                         seg_label_stats, yaw_to_quaternion)
+
+
+class _Tensor:
+
+    def __init__(self, array):
+        self.array = np.asarray(array)
+
+    def numpy(self):
+        return self.array
+
+
+def _det3d_inputs():
+    bboxes = np.array([
+        [1, 2, -1.5, 4, 2, 1.6, 0],
+        [5, 6, -1, 0.8, 0.6, 1.8, math.pi / 2],
+        [-3, 0, -1.8, 4.5, 2, 1.4, math.pi],
+        [0, -7, -2, 10, 3, 3, -math.pi / 2],
+    ],
+                      dtype=np.float32)
+    scores = np.array([0.9, 0.2, 0.6, 0.7], dtype=np.float32)
+    labels = np.array([0, 1, 0, 2])
+    return bboxes, scores, labels
+
+
+def test_yaw_to_quaternion():
+    s = math.sqrt(0.5)
+    quats = yaw_to_quaternion(
+        np.array([0, math.pi / 2, math.pi, -math.pi / 2, 2 * math.pi]))
+    np.testing.assert_allclose(
+        quats, [[0, 0, 0, 1], [0, 0, s, s], [0, 0, 1, 0], [0, 0, -s, s],
+                [0, 0, 0, -1]],
+        atol=1e-12)
+    assert yaw_to_quaternion(np.zeros(0)).shape == (0, 4)
+
+
+def test_det3d_result_arrays():
+    bboxes, scores, labels = _det3d_inputs()
+    result = dict(
+        boxes_3d=SimpleNamespace(tensor=_Tensor(bboxes)),
+        scores_3d=_Tensor(scores),
+        labels_3d=_Tensor(labels))
+    for item in (result, dict(pts_bbox=result), (bboxes, scores, labels)):
+        arrays = det3d_result_arrays(item)
+        for array, expected in zip(arrays, (bboxes, scores, labels)):
+            np.testing.assert_array_equal(array, expected)
+
+
+def _legacy_objects(bboxes, scores, labels, score_thr):
+    """逐个框计算的参考实现, 分数与类别和框一起过滤."""
+    objects = []
+    for bbox, score, label in zip(bboxes, scores, labels):
+        if score_thr > 0 and not score > score_thr:
+            continue
+        x, y, z, dx, dy, dz, yaw = bbox[:7].tolist()
+        objects.append(([x, y, z + dz / 2], [dx, dy, dz],
+                        [0, 0, math.sin(yaw / 2),
+                         math.cos(yaw / 2)], float(score), int(label)))
+    return objects
+
+
+@pytest.mark.parametrize('score_thr', [0, 0.5, 0.95])
+def test_det3d_objects(score_thr):
+    bboxes, scores, labels = _det3d_inputs()
+    objects = det3d_objects(bboxes, scores, labels, score_thr=score_thr)
+    expected = _legacy_objects(bboxes, scores, labels, score_thr)
+    assert len(objects['scores']) == len(expected)
+    for i, (position, dimension, quat, score, label) in enumerate(expected):
+        np.testing.assert_allclose(objects['positions'][i], position,
+                                   rtol=1e-6)
+        np.testing.assert_allclose(objects['dimensions'][i], dimension)
+        np.testing.assert_allclose(
+            objects['quaternions'][i], quat, atol=1e-7)
+        assert objects['scores'][i] == pytest.approx(score)
+        assert objects['labels'][i] == label
+    # 输入不被修改
+    np.testing.assert_array_equal(bboxes, _det3d_inputs()[0])
+
+
+def test_det3d_objects_filtered_subset():
+    bboxes, scores, labels = _det3d_inputs()
+    objects = det3d_objects(bboxes, scores, labels, score_thr=0.5)
+    # 分数大于0.5的第0、2、3个框, 类别与分数和框保持对齐
+    assert objects['labels'].tolist() == [0, 0, 2]
+    np.testing.assert_allclose(objects['scores'], [0.9, 0.6, 0.7])
+    # 底面中心转换为几何中心
+    np.testing.assert_allclose(
+        objects['positions'],
+        [[1, 2, -0.7], [-3, 0, -1.1], [0, -7, -0.5]],
+        rtol=1e-6)
+    s = math.sqrt(0.5)
+    np.testing.assert_allclose(
+        objects['quaternions'], [[0, 0, 0, 1], [0, 0, 1, 0], [0, 0, -s, s]],
+        atol=1e-7)
+
+
+def _decode_runs(labels, rows, starts, lengths, shape):
+    """将按行的游程解码回 label map."""
+    seg = np.full(shape, -1, dtype=np.int64)
+    for label, row, start, length in zip(labels, rows, starts, lengths):
+        seg[row, start:start + length] = label
+    return seg
+
+
+@pytest.mark.parametrize('shape', [(1, 1), (1, 7), (6, 1), (13, 17)])
+def test_label_map_runs(shape):
+    rng = np.random.default_rng(0)
+    # 取值较少时游程较长, 同时包含跨行相同的情况
+    seg = rng.integers(0, 3, size=shape).astype(np.uint8)
+    labels, rows, starts, lengths = label_map_runs(seg)
+    # 游程不跨行, 并且相邻游程的类别不同
+    assert np.all(starts + lengths <= shape[1])
+    same_row = rows[1:] == rows[:-1]
+    assert np.all(labels[1:][same_row] != labels[:-1][same_row])
+    np.testing.assert_array_equal(
+        _decode_runs(labels, rows, starts, lengths, shape), seg)
+
+
+def test_label_map_runs_uniform():
+    seg = np.full((3, 5), 2, dtype=np.uint8)
+    labels, rows, starts, lengths = label_map_runs(seg)
+    assert labels.tolist() == [2, 2, 2]
+    assert rows.tolist() == [0, 1, 2]
+    assert starts.tolist() == [0, 0, 0]
+    assert lengths.tolist() == [5, 5, 5]
+
+
+def test_seg_label_stats():
+    seg = np.zeros((8, 10), dtype=np.uint8)
+    seg[2:5, 3:7] = 1
+    seg[6:8, 0:2] = 1
+    seg[0, 9] = 255
+    scores, bboxes = seg_label_stats(seg, 3)
+    np.testing.assert_allclose(scores, [(80 - 12 - 4 - 1) / 80, 16 / 80, 0])
+    assert bboxes[1].tolist() == [0, 2, 7, 8]
+    assert bboxes[0].tolist() == [0, 0, 10, 8]
+
+    # 降采样后的bbox转换回原图坐标, 并截断到原图范围内
+    scores, bboxes = seg_label_stats(seg, 3, downsample=4, ori_shape=(30, 38))
+    np.testing.assert_allclose(scores[1], 16 / 80)
+    assert bboxes[1].tolist() == [0, 8, 28, 30]
+    assert bboxes[0].tolist() == [0, 0, 38, 30]
+
+
+def test_seg_label_stats_downsampled_label_map():
+    ori = np.zeros((37, 50), dtype=np.uint8)
+    ori[9:21, 12:30] = 2
+    downsample = 4
+    seg = ori[::downsample, ::downsample]
+    scores, bboxes = seg_label_stats(seg, 3, downsample, ori.shape)
+    # 最近邻降采样, bbox在原图上的误差不超过降采样倍数
+    x1, y1, x2, y2 = bboxes[2].tolist()
+    assert abs(x1 - 12) < downsample and abs(x2 - 30) < downsample
+    assert abs(y1 - 9) < downsample and abs(y2 - 21) < downsample
+    assert scores[2] == pytest.approx((seg == 2).mean())
+
+
+def test_label_polygons():
+    seg = np.zeros((20, 30), dtype=np.uint8)
+    seg[2:8, 4:14] = 1
+    seg[12:18, 20:26] = 1
+    # 少于3个点的轮廓被忽略
+    seg[0, 29] = 1
+    downsample = 2
+    polygons = sorted(
+        label_polygons(seg, 1, downsample), key=lambda item: item[1])
+    assert len(polygons) == 2
+    for (polygon, bbox, score), (x1, y1, x2, y2) in zip(
+            polygons, [(4, 2, 14, 8), (20, 12, 26, 18)]):
+        # 多边形与bbox转换为原图坐标
+        assert bbox == (x1 * downsample, y1 * downsample,
+                        (x2 - x1) * downsample, (y2 - y1) * downsample)
+        assert sorted(map(tuple, polygon.tolist())) == sorted([
+            (x1 * downsample, y1 * downsample),
+            ((x2 - 1) * downsample, y1 * downsample),
+            ((x2 - 1) * downsample, (y2 - 1) * downsample),
+            (x1 * downsample, (y2 - 1) * downsample),
+        ])
+        # 面积为轮廓顶点围成的面积占降采样后图像的比例
+        assert score == pytest.approx(
+            (x2 - x1 - 1) * (y2 - y1 - 1) / seg.size)
+    assert label_polygons(seg, 2) == []
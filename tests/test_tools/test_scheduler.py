@@ -0,0 +1,132 @@
+# Copyright (c) windzu. All rights reserved.
+from types import SimpleNamespace
+
+import pytest
+from mmcv import ConfigDict
+from ros_utils.scheduler import (FrameScheduler, restore_nms_pre,
+                                 scale_test_pipeline, set_nms_pre)
+
+
+def _run(scheduler, latency, num_frames, period=0.1, start=0.0):
+    """以 ``period`` 的周期输入 ``num_frames`` 帧, 处理的帧耗时 ``latency``.
+
+    Returns:
+        tuple[list[bool], float]: 每一帧是否被处理, 以及结束的时间
+    """
+    processed = []
+    now = start
+    for _ in range(num_frames):
+        now += period
+        process = scheduler.should_process()
+        processed.append(process)
+        if process:
+            scheduler.record(latency, finish_time=now + latency)
+    return processed, now
+
+
+def test_effective_rate():
+    scheduler = FrameScheduler(budget=0.1)
+    assert scheduler.effective_rate == 0.0
+    scheduler.record(0.05, finish_time=1.0)
+    assert scheduler.effective_rate == 0.0
+    scheduler.record(0.05, finish_time=1.1)
+    assert scheduler.effective_rate == pytest.approx(10)
+    # 帧间隔的指数滑动平均: 0.9 * 0.1 + 0.1 * 0.3
+    scheduler.record(0.05, finish_time=1.4)
+    assert scheduler.effective_rate == pytest.approx(1 / 0.12)
+    for i in range(200):
+        scheduler.record(0.05, finish_time=1.4 + (i + 1) * 0.2)
+    assert scheduler.effective_rate == pytest.approx(5, rel=1e-6)
+
+
+def test_skip():
+    scheduler = FrameScheduler(budget=0.1, window=5, min_samples=5)
+    # 耗时在预算内时处理每一帧
+    processed, _ = _run(scheduler, 0.08, 20)
+    assert all(processed)
+    assert scheduler.skip == 1
+    assert scheduler.effective_rate == pytest.approx(10)
+
+    # 耗时为预算的2.5倍, 积累5帧之后每3帧处理一帧
+    scheduler = FrameScheduler(budget=0.1, window=5, min_samples=5)
+    processed, now = _run(scheduler, 0.25, 150)
+    assert all(processed[:5])
+    assert scheduler.skip == 3
+    assert processed[5:35] == [True, False, False] * 10
+    assert scheduler.skipped == 145 // 3 * 2
+    # 实际的处理帧率为输入的1/3
+    assert scheduler.effective_rate == pytest.approx(10 / 3, rel=0.01)
+
+    # 耗时恢复后逐步减小skip, 需要低于 (skip - 1) * budget * recover_ratio
+    _, now = _run(scheduler, 0.15, 30, start=now)
+    assert scheduler.skip == 3
+    _, now = _run(scheduler, 0.13, 30, start=now)
+    assert scheduler.skip == 2
+    _, now = _run(scheduler, 0.05, 30, start=now)
+    assert scheduler.skip == 1
+    assert not scheduler.fallback
+
+
+def test_fallback():
+    scheduler = FrameScheduler(
+        budget=0.1, window=5, min_samples=5, has_fallback=True)
+    # 超出预算时先切换到fallback配置, 而不是跳帧
+    _, now = _run(scheduler, 0.15, 5)
+    assert scheduler.fallback
+    assert scheduler.skip == 1
+    # 统计窗口被清空, fallback依然不够时再跳帧
+    _, now = _run(scheduler, 0.15, 4, start=now)
+    assert scheduler.skip == 1
+    _, now = _run(scheduler, 0.15, 1, start=now)
+    assert scheduler.skip == 2
+
+    # 先恢复skip, 再退出fallback
+    _, now = _run(scheduler, 0.05, 10, start=now)
+    assert scheduler.skip == 1
+    assert scheduler.fallback
+    # 滞回: 平均耗时在 budget * recover_ratio 与 budget 之间时保持fallback
+    _, now = _run(scheduler, 0.08, 20, start=now)
+    assert scheduler.fallback
+    _, now = _run(scheduler, 0.06, 5, start=now)
+    assert not scheduler.fallback
+
+
+def test_scale_test_pipeline():
+    pipeline = [
+        ConfigDict(type='LoadImageFromFile'),
+        ConfigDict(
+            type='MultiScaleFlipAug',
+            img_scale=(1333, 800),
+            transforms=[ConfigDict(type='Resize', keep_ratio=True)]),
+        ConfigDict(type='Resize', img_scale=[(1000, 600), (500, 300)]),
+    ]
+    scaled = scale_test_pipeline(pipeline, 0.5)
+    assert scaled[1].img_scale == (666, 400)
+    assert scaled[2].img_scale == [(500, 300), (250, 150)]
+    # 原来的pipeline不变
+    assert pipeline[1].img_scale == (1333, 800)
+    assert pipeline[2].img_scale == [(1000, 600), (500, 300)]
+
+
+def test_set_nms_pre():
+    shared = dict(nms_pre=1000, score_thr=0.05)
+    # 两个head共用一个test_cfg, 以及嵌套的rpn/rcnn配置
+    heads = [
+        SimpleNamespace(test_cfg=shared),
+        SimpleNamespace(test_cfg=shared),
+        SimpleNamespace(
+            test_cfg=dict(rpn=dict(nms_pre=2000), rcnn=dict(score_thr=0.5))),
+        SimpleNamespace(),
+        SimpleNamespace(test_cfg=None),
+    ]
+    model = SimpleNamespace(modules=lambda: heads)
+
+    changed = set_nms_pre(model, 100)
+    assert len(changed) == 2
+    assert shared['nms_pre'] == 100
+    assert heads[2].test_cfg['rpn']['nms_pre'] == 100
+    assert 'nms_pre' not in heads[2].test_cfg['rcnn']
+
+    restore_nms_pre(changed)
+    assert shared == dict(nms_pre=1000, score_thr=0.05)
+    assert heads[2].test_cfg['rpn']['nms_pre'] == 2000
@@ -0,0 +1,131 @@
+# Copyright (c) windzu. All rights reserved.
+import multiprocessing as mp
+import os
+import os.path as osp
+import stat
+import threading
+import time
+
+import numpy as np
+import pytest
+from ros_utils.shm import ModelClient, ModelServer, SharedRing
+
+AUTHKEY = b'test-authkey'
+
+
+def _handler(arrays, extra, state):
+    """输出输入的2倍, 以及该client已经处理的帧数."""
+    if extra == 'fail':
+        raise ValueError('handler failed')
+    state['frames'] = state.get('frames', 0) + 1
+    return [arrays[0] * 2, np.array([state['frames']], dtype=np.int64)]
+
+
+def _serve(address):
+    server = ModelServer(
+        address, _handler, info=dict(task_type='test'), authkey=AUTHKEY)
+    server.serve_forever()
+
+
+@pytest.fixture
+def server_address(tmp_path):
+    address = str(tmp_path / 'server.sock')
+    process = mp.get_context('fork').Process(
+        target=_serve, args=(address, ), daemon=True)
+    process.start()
+    for _ in range(500):
+        if osp.exists(address):
+            break
+        time.sleep(0.01)
+    else:
+        process.terminate()
+        pytest.fail('model server did not start')
+    yield address
+    process.terminate()
+    process.join()
+
+
+def test_shared_ring():
+    ring = SharedRing(2, 4096)
+    arrays = [
+        np.arange(10, dtype=np.float32),
+        np.ones((3, 4), dtype=np.uint8),
+        np.zeros(0, dtype=np.int64)
+    ]
+    meta = ring.write(1, arrays)
+    # 每个数组的起始位置按64字节对齐
+    assert [offset for _, _, offset in meta] == [0, 64, 128]
+    for array, read in zip(arrays, ring.read(1, meta, copy=True)):
+        assert read.dtype == array.dtype
+        np.testing.assert_array_equal(read, array)
+    with pytest.raises(ValueError):
+        ring.write(0, [np.zeros(4097, dtype=np.uint8)])
+    ring.close()
+
+
+def test_round_trip(server_address):
+    assert stat.S_IMODE(os.stat(server_address).st_mode) == 0o600
+
+    client_a = ModelClient(server_address, slot_bytes=2**20, authkey=AUTHKEY)
+    client_b = ModelClient(server_address, slot_bytes=2**20, authkey=AUTHKEY)
+    assert client_a.info == dict(task_type='test')
+
+    points = np.random.rand(1000, 4).astype(np.float32)
+    for frame in range(1, 4):
+        doubled, frames = client_a.infer([points])
+        np.testing.assert_array_equal(doubled, points * 2)
+        assert frames.tolist() == [frame]
+    # 每个client的state相互独立
+    _, frames = client_b.infer([points])
+    assert frames.tolist() == [1]
+
+    # handler的异常在infer中变为RuntimeError, 连接依然可用
+    with pytest.raises(RuntimeError, match='handler failed'):
+        client_a.infer([points], extra='fail')
+    _, frames = client_a.infer([points])
+    assert frames.tolist() == [4]
+
+    # 多个线程同时提交, 最多 num_slots 个请求同时在服务端排队
+    results = {}
+
+    def infer(i):
+        results[i] = client_b.infer([np.full(8, i, dtype=np.int32)])[0]
+
+    threads = [threading.Thread(target=infer, args=(i, )) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for i in range(8):
+        np.testing.assert_array_equal(results[i], np.full(8, 2 * i))
+
+    client_a.close()
+    # close 之后不会再等待服务端
+    with pytest.raises(RuntimeError, match='connection closed'):
+        client_a.infer([points])
+    # 一个client断开不影响其他client
+    _, frames = client_b.infer([points])
+    assert frames.tolist() == [10]
+    client_b.close()
+
+
+def test_reconnect_resets_state(server_address):
+    client = ModelClient(server_address, slot_bytes=2**20, authkey=AUTHKEY)
+    client.infer([np.zeros(4)])
+    client.infer([np.zeros(4)])
+    client.close()
+    # 断开后服务端丢弃该client的state
+    client = ModelClient(server_address, slot_bytes=2**20, authkey=AUTHKEY)
+    _, frames = client.infer([np.zeros(4)])
+    assert frames.tolist() == [1]
+    client.close()
+
+
+def test_authkey(server_address):
+    with pytest.raises(mp.AuthenticationError):
+        ModelClient(server_address, slot_bytes=2**20, authkey=b'wrong')
+    # 认证失败的连接不影响之后的client
+    client = ModelClient(server_address, slot_bytes=2**20, authkey=AUTHKEY)
+    _, frames = client.infer([np.zeros(4)])
+    assert frames.tolist() == [1]
+    client.close()
@@ -8,6 +8,8 @@ import numpy as np
 from mmdet.apis import inference_detector, init_detector
 from rich.progress import track
 
+from mmdet_ext.core import build_label_map, result2arrays
+
 COCO_TO_BDD100K = {
     'person': 'pedestrian',
     'rider': 'rider',
@@ -20,6 +22,7 @@ COCO_TO_BDD100K = {
     'traffic light': 'traffic light',
     'traffic sign': 'traffic sign',
 }
+BDD100K_CATEGORIES = list(dict.fromkeys(COCO_TO_BDD100K.values()))
 
 
 class AutoAnnotation:
@@ -36,6 +39,9 @@ class AutoAnnotation:
         self.model = init_detector(
             self.config, self.checkpoint, device=self.device)
         self.class_names = self.model.CLASSES
+        # 模型类别到bdd100k类别的映射, 不需要的类别为-1
+        self.label_map = build_label_map(self.class_names, BDD100K_CATEGORIES,
+                                         COCO_TO_BDD100K)
 
     def run(self):
 
@@ -51,12 +57,11 @@ class AutoAnnotation:
                 img = cv2.imdecode(img, -1)
 
                 result = inference_detector(self.model, img)
-                (bboxes, labels,
-                 label_names) = self.format_result_to_standard_format(
-                     result, self.class_names, self.score_thr)
+                (bboxes, scores,
+                 labels) = self.format_result_to_standard_format(
+                     result, self.score_thr, self.label_map)
 
-                labels = self.format_result_to_scalabel_format(
-                    bboxes, labels, label_names)
+                labels = self.format_result_to_scalabel_format(bboxes, labels)
 
                 frame['labels'] = labels
 
@@ -78,13 +83,12 @@ class AutoAnnotation:
             result(dict): 检测结果
         """
         # 1. format the result to the standard format
-        (bboxes, labels, label_names) = self.format_result_to_standard_format(
-            result, self.class_names, self.score_thr)
+        (bboxes, scores, labels) = self.format_result_to_standard_format(
+            result, self.score_thr, self.label_map)
 
         # 2. filter the result to the required format
         if str(self.type) == 'scalabel':
-            result = self.format_result_to_scalabel_format(
-                bboxes, labels, label_names)
+            result = self.format_result_to_scalabel_format(bboxes, labels)
             if result:
                 result['name'] = file
                 result['url'] = file
@@ -146,90 +150,50 @@ class AutoAnnotation:
             return frames
 
     @staticmethod
-    def format_result_to_standard_format(result, class_names, score_thr=0.3):
+    def format_result_to_standard_format(result, score_thr=0.3,
+                                         label_map=None):
         """将mmdet的检测结果转换成通用格式
         Args:
-            result (Tensor or tuple): 检测结果
-            class_names (list(str)): 类别名称列表
+            result (list(np.ndarray) or tuple): 检测结果
             score_thr (float): 分数阈值
+            label_map (np.ndarray, optional): 每个类别映射后的类别id,
+                -1表示丢弃该类别, 见 build_label_map
 
         Returns:
-            list(dict): 通用格式的检测结果
-
+            tuple(np.ndarray): bboxes (n, 4), scores (n, ), labels (n, )
         """
-
-        if isinstance(result, tuple):
-            bbox_result, segm_result = result
-            if isinstance(segm_result, tuple):
-                segm_result = segm_result[0]  # ms rcnn
-        else:
-            bbox_result, segm_result = result, None
-
-        bboxes = np.vstack(bbox_result)
-        labels = [
-            np.full(bbox.shape[0], i, dtype=np.int32)
-            for i, bbox in enumerate(bbox_result)
-        ]
-        labels = np.concatenate(labels)
         # TODO : add support to segmentation masks
+        return result2arrays(result, score_thr, label_map)
 
-        # filter out the results
-        assert bboxes is None or bboxes.ndim == 2, f' bboxes ndim should be 2,\
-             but its ndim is {bboxes.ndim}.'
-
-        assert labels.ndim == 1, f' labels ndim should be 1, \
-            but its ndim is {labels.ndim}.'
-
-        assert (
-            bboxes is None or bboxes.shape[1] == 4 or bboxes.shape[1] == 5
-        ), f' bboxes.shape[1] should be 4 or 5, but its {bboxes.shape[1]}.'
-        assert (bboxes is None or bboxes.shape[0] <= labels.shape[0]
-                ), 'labels.shape[0] should not be less than bboxes.shape[0].'
-
-        if score_thr > 0:
-            assert bboxes is not None and bboxes.shape[1] == 5
-            scores = bboxes[:, -1]
-            inds = scores > score_thr
-            bboxes = bboxes[inds, :]
-            labels = labels[inds]
-            # TODO : add support to filter segmentation masks
-
-        # # debug
-        # print("bboxes: ", bboxes)
-        # print("labels: ", labels)
-
-        # get label name
-        label_names = [class_names[i] for i in labels]
+    @staticmethod
+    def format_result_to_scalabel_format(bboxes,
+                                         labels,
+                                         categories=BDD100K_CATEGORIES):
+        """将通用格式的检测结果转换为scalabel的labels.
 
-        return (bboxes, labels, label_names)
+        Args:
+            bboxes (np.ndarray): (n, 4) 的bbox
+            labels (np.ndarray): 已经映射到 ``categories`` 的类别id
+            categories (list(str)): 类别名称列表
 
-    @staticmethod
-    def format_result_to_scalabel_format(bboxes, labels, label_names):
-
-        scalabel_labels = []
-        # filter out the results which are not in the required format
-        for i, (bbox, label,
-                label_name) in enumerate(zip(bboxes, labels, label_names)):
-            if label_name in COCO_TO_BDD100K:
-                scalabel_labels.append({
-                    'id': i,
-                    'category': COCO_TO_BDD100K[label_name],
-                    'attributes': {},
-                    'manualShape': True,
-                    'box2d': {
-                        'x1': int(bbox[0]),
-                        'y1': int(bbox[1]),
-                        'x2': int(bbox[2]),
-                        'y2': int(bbox[3]),
-                    },
-                    'poly2d': None,
-                    'box3d': None,
-                })
-
-        if len(scalabel_labels) == 0:
-            return []
-        else:
-            return scalabel_labels
+        Returns:
+            list(dict): scalabel格式的labels
+        """
+        return [{
+            'id': i,
+            'category': categories[label],
+            'attributes': {},
+            'manualShape': True,
+            'box2d': {
+                'x1': x1,
+                'y1': y1,
+                'x2': x2,
+                'y2': y2,
+            },
+            'poly2d': None,
+            'box3d': None,
+        } for i, ((x1, y1, x2, y2), label) in enumerate(
+            zip(bboxes.astype(np.int64).tolist(), labels.tolist()))]
 
 
 def parse_args():
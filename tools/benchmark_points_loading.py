@@ -0,0 +1,142 @@
+# Copyright (c) windzu. All rights reserved.
+"""比较 LoadPointsFromFileExtension 读取点云的几种方式的耗时与内存分配.
+
+    - legacy: 修改前的实现, 读为bytes后拼接虚拟维度(提升为float64)再索引 use_dim
+    - read: 读为bytes后将 use_dim 直接写入一块float32内存
+    - mmap: 以mmap的方式映射文件, 只拷贝 use_dim 的维度
+
+耗时为每帧的平均值, 内存为每帧经过 tracemalloc 统计的峰值分配字节数,
+mmap映射的文件页不经过 malloc, 不计入.
+
+示例:
+    python tools/benchmark_points_loading.py --input data/usd/scene_00/LIDAR \
+        --load_dim 4 --use_dim 0 1 2 3 4
+"""
+import glob
+import os
+import os.path as osp
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+import numpy as np
+
+from mmdet3d_ext.datasets import LoadPointsFromFileExtension
+
+
+def legacy_load_points(pts_filename, load_dim, use_dim):
+    """修改前的 LoadPointsFromFileExtension 的读取流程."""
+    with open(pts_filename, 'rb') as f:
+        points = np.frombuffer(f.read(), dtype=np.float32)
+    points = points.reshape(-1, load_dim)
+    if load_dim < len(use_dim):
+        dim_diff = len(use_dim) - load_dim
+        points = np.concatenate(
+            [points, np.zeros((points.shape[0], dim_diff))], axis=1)
+    return points[:, use_dim]
+
+
+def make_frames(out_dir, num_frames, num_points, load_dim):
+    """生成随机点云文件, 用于没有数据集时测试."""
+    filenames = []
+    for i in range(num_frames):
+        filename = osp.join(out_dir, f'{i:06d}.bin')
+        np.random.rand(num_points, load_dim).astype(np.float32).tofile(
+            filename)
+        filenames.append(filename)
+    return filenames
+
+
+def benchmark(load_func, filenames, loops):
+    """返回每帧的平均耗时(ms)与平均峰值分配字节数."""
+    # 预热, 使所有文件都在page cache中, 只比较解码的开销
+    for filename in filenames:
+        load_func(filename)
+
+    start = time.perf_counter()
+    for _ in range(loops):
+        for filename in filenames:
+            load_func(filename)
+    elapsed = time.perf_counter() - start
+    num_loads = loops * len(filenames)
+
+    peaks = []
+    tracemalloc.start()
+    for filename in filenames:
+        tracemalloc.clear_traces()
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        points = load_func(filename)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        del points
+    tracemalloc.stop()
+    return elapsed / num_loads * 1000, float(np.mean(peaks))
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument(
+        '--input',
+        default=None,
+        help='dir of .bin files, random frames are generated if not set')
+    parser.add_argument(
+        '--num_frames',
+        type=int,
+        default=20,
+        help='number of random frames or max number of frames of input')
+    parser.add_argument(
+        '--num_points',
+        type=int,
+        default=120000,
+        help='number of points of each random frame')
+    parser.add_argument(
+        '--load_dim', type=int, default=4, help='dimension of .bin points')
+    parser.add_argument(
+        '--use_dim',
+        type=int,
+        nargs='+',
+        default=[0, 1, 2, 3, 4],
+        help='dimensions to use, those >= load_dim are padded with 0')
+    parser.add_argument(
+        '--loops', type=int, default=5, help='times to load all frames')
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+    tmp_dir = None
+    if args.input is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        filenames = make_frames(tmp_dir.name, args.num_frames,
+                                args.num_points, args.load_dim)
+    else:
+        filenames = sorted(glob.glob(osp.join(args.input,
+                                              '*.bin')))[:args.num_frames]
+    assert len(filenames) > 0, f'no .bin file found in {args.input}'
+    mean_size = np.mean([os.path.getsize(f) for f in filenames])
+    print(f'{len(filenames)} frames, {mean_size / 2**20:.2f} MiB per frame, '
+          f'load_dim={args.load_dim}, use_dim={args.use_dim}')
+
+    loaders = dict(
+        legacy=lambda f: legacy_load_points(f, args.load_dim, args.use_dim))
+    for name, use_mmap in [('read', False), ('mmap', True)]:
+        transform = LoadPointsFromFileExtension(
+            coord_type='LIDAR',
+            load_dim=args.load_dim,
+            use_dim=args.use_dim,
+            use_mmap=use_mmap)
+        loaders[name] = transform._load_points
+
+    print(f'{"mode":<8}{"ms/frame":>12}{"MiB allocated/frame":>24}')
+    for name, load_func in loaders.items():
+        ms, peak = benchmark(load_func, filenames, args.loops)
+        print(f'{name:<8}{ms:>12.3f}{peak / 2**20:>24.2f}')
+
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -203,7 +203,7 @@ def waymo_data_prep(root_path,
     ).create()
 
 
-def usd_data_prep(root_path, info_prefix='usd'):
+def usd_data_prep(root_path, info_prefix='usd', columnar=False):
     """准备lidar数据集
     目标生成三种类型的数据:
     1. usd_infos_xxx.pkl 文件,其内容为符合自定义dataset class的中间格式文件,一般情况下有四个文件,分别为:
@@ -218,9 +218,12 @@ def usd_data_prep(root_path, info_prefix='usd'):
     Args:
         root_path (str): 数据集的根路径.
         info_prefix (str): 生成info文件时候指定的前缀,默认为 usd.
+        columnar (bool): 是否同时生成按列存储的标注目录 usd_infos_xxx_columnar,
+            可以直接作为 USDDataset 的 ann_file.
     """
     # 创建 usd_infos_xxx.pkl 文件
-    usd.create_usd_info_file(data_path=root_path, pkl_prefix=info_prefix)
+    usd.create_usd_info_file(
+        data_path=root_path, pkl_prefix=info_prefix, columnar=columnar)
 
     # # 创建 lidar_dbinfos_train.pkl 文件和 lidar_gt_database 文件夹
     # create_groundtruth_database(
@@ -231,6 +234,41 @@ def usd_data_prep(root_path, info_prefix='usd'):
     # )
 
 
+def usd_columnar_prep(root_path, info_prefix='usd'):
+    """将已经生成的 usd_infos_xxx.pkl 转换为按列存储的标注目录
+    usd_infos_xxx_columnar, 不重新解析原始标注.
+
+    Args:
+        root_path (str): 数据集的根路径.
+        info_prefix (str): 生成info文件时候指定的前缀,默认为 usd.
+    """
+    for split in ['train', 'val', 'test']:
+        pkl_path = osp.join(root_path, f'{info_prefix}_infos_{split}.pkl')
+        if osp.exists(pkl_path):
+            usd.convert_to_columnar(pkl_path)
+
+
+def usd_pack_prep(root_path, info_prefix='usd', shard_size=4,
+                  with_images=False):
+    """将 usd_infos_xxx.pkl 中每个split的点云打包为shard目录 usd_shards_xxx,
+    可以作为 USDDataset 的 points_shards.
+
+    Args:
+        root_path (str): 数据集的根路径.
+        info_prefix (str): 生成info文件时候指定的前缀,默认为 usd.
+        shard_size (int): 每个shard的大小上限, 单位为GiB.
+        with_images (bool): 是否同时打包图像.
+    """
+    for split in ['train', 'val', 'test']:
+        pkl_path = osp.join(root_path, f'{info_prefix}_infos_{split}.pkl')
+        if osp.exists(pkl_path):
+            usd.pack_usd_files(
+                root_path,
+                pkl_path,
+                shard_size=shard_size << 30,
+                with_images=with_images)
+
+
 parser = argparse.ArgumentParser(description='Data converter arg parser')
 parser.add_argument('dataset', metavar='kitti', help='name of the dataset')
 parser.add_argument(
@@ -261,6 +299,19 @@ parser.add_argument(
     required=False,
     help='name of info pkl')
 parser.add_argument('--extra-tag', type=str, default='kitti')
+parser.add_argument(
+    '--columnar',
+    action='store_true',
+    help='Whether to also save columnar annotations for usd.')
+parser.add_argument(
+    '--shard-size',
+    type=int,
+    default=4,
+    help='max size in GiB of each shard for usd_pack')
+parser.add_argument(
+    '--with-images',
+    action='store_true',
+    help='Whether to also pack images for usd_pack.')
 parser.add_argument(
     '--workers', type=int, default=4, help='number of threads to be used')
 args = parser.parse_args()
@@ -353,4 +404,17 @@ if __name__ == '__main__':
         usd_data_prep(
             root_path=args.root_path,
             info_prefix=args.extra_tag,
+            columnar=args.columnar,
+        )
+    elif args.dataset == 'usd_columnar':
+        usd_columnar_prep(
+            root_path=args.root_path,
+            info_prefix=args.extra_tag,
+        )
+    elif args.dataset == 'usd_pack':
+        usd_pack_prep(
+            root_path=args.root_path,
+            info_prefix=args.extra_tag,
+            shard_size=args.shard_size,
+            with_images=args.with_images,
         )
@@ -1,14 +1,18 @@
 # Copyright (c) windzu. All rights reserved.
+import os
 from pathlib import Path
 
 import mmcv
 import numpy as np
 from mmdet3d.core.bbox import box_np_ops
 
+from mmdet3d_ext.datasets import USDColumnarAnnotations
+from mmdet3d_ext.datasets.usd_shards import ShardWriter
+
 from .usd_data_utils import get_usd_info
 
 
-def create_usd_info_file(data_path, pkl_prefix='lidar'):
+def create_usd_info_file(data_path, pkl_prefix='lidar', columnar=False):
     """解析数据集,创建中间格式 usd_info_xxx.pkl 文件并存储
     数据格式：
     [
@@ -59,6 +63,8 @@ def create_usd_info_file(data_path, pkl_prefix='lidar'):
     Args:
         data_path (str): Path of the data root.
         pkl_prefix (str, optional): Default: 'lidar'.
+        columnar (bool, optional): 是否同时将每个pkl转换为按列存储的标注目录
+            ``{pkl_prefix}_infos_xxx_columnar``. Default: False.
     """
     data_path = Path(data_path)
     train_label_path_list = _read_file(str(data_path / 'train.txt'))
@@ -75,6 +81,8 @@ def create_usd_info_file(data_path, pkl_prefix='lidar'):
     filename = save_path / f'{pkl_prefix}_infos_train.pkl'
     print(f'USD info train file is saved to {filename}')
     mmcv.dump(lidar_infos_train, filename)
+    if columnar:
+        convert_to_columnar(filename, data_infos=lidar_infos_train)
 
     # save val info
     lidar_infos_val = get_usd_info(
@@ -83,6 +91,8 @@ def create_usd_info_file(data_path, pkl_prefix='lidar'):
     filename = save_path / f'{pkl_prefix}_infos_val.pkl'
     print(f'USD info val file is saved to {filename}')
     mmcv.dump(lidar_infos_val, filename)
+    if columnar:
+        convert_to_columnar(filename, data_infos=lidar_infos_val)
 
     # 暂时不知道为什么要保存trainval
     # # save trainval info (train_info + val_info)
@@ -96,6 +106,91 @@ def create_usd_info_file(data_path, pkl_prefix='lidar'):
     filename = save_path / f'{pkl_prefix}_infos_test.pkl'
     print(f'USD info test file is saved to {filename}')
     mmcv.dump(lidar_infos_test, filename)
+    if columnar:
+        convert_to_columnar(filename, data_infos=lidar_infos_test)
+
+
+def convert_to_columnar(pkl_path, out_dir=None, data_infos=None):
+    """将 usd_infos_xxx.pkl 转换为按列存储的标注目录, USDDataset 的 ann_file
+    可以直接指定为该目录.
+
+    Args:
+        pkl_path (str): usd_infos_xxx.pkl 的路径
+        out_dir (str, optional): 保存的目录, 默认为 pkl 同级的
+            ``usd_infos_xxx_columnar``. Default: None.
+        data_infos (list[dict], optional): pkl 的内容, 已经在内存中时不再
+            重复读取. Default: None.
+
+    Returns:
+        str: 保存的目录
+    """
+    pkl_path = str(pkl_path)
+    if out_dir is None:
+        out_dir = os.path.splitext(pkl_path)[0] + '_columnar'
+    if data_infos is None:
+        data_infos = mmcv.load(pkl_path)
+    USDColumnarAnnotations.from_infos(data_infos).dump(out_dir)
+    print(f'USD columnar annotations are saved to {out_dir}')
+    return out_dir
+
+
+def pack_usd_files(data_path,
+                   pkl_path,
+                   out_dir=None,
+                   shard_size=4 << 30,
+                   with_images=False):
+    """将一个split的点云(以及可选的图像)打包为若干个大的shard文件.
+
+    每一帧的点云 ``{scene_name}/LIDAR/{file_name}`` 以该相对路径为key写入
+    shard, 图像 ``{scene_name}/{camera}/{file_name}`` 同理. USDDataset 的
+    ``points_shards`` 指定为 ``out_dir`` 后, 点云由 LoadPointsFromShard 从
+    shard中读取.
+
+    Args:
+        data_path (str): 数据集的根路径
+        pkl_path (str): usd_infos_xxx.pkl 的路径
+        out_dir (str, optional): 保存的目录, 默认为 pkl 同级的
+            ``usd_shards_xxx``. Default: None.
+        shard_size (int, optional): 每个shard的字节数上限. Default: 4 GiB.
+        with_images (bool, optional): 是否同时打包图像. Default: False.
+
+    Returns:
+        str: 保存的目录
+    """
+    pkl_path = str(pkl_path)
+    if out_dir is None:
+        pkl_dir, pkl_name = os.path.split(pkl_path)
+        out_dir = os.path.join(
+            pkl_dir,
+            os.path.splitext(pkl_name)[0].replace('_infos_', '_shards_'))
+    data_infos = mmcv.load(pkl_path)
+
+    writer = ShardWriter(out_dir, shard_size=shard_size)
+    num_missing = 0
+    for info in mmcv.track_iter_progress(data_infos):
+        pts_sensors = info['point_clouds'] or {}
+        sensors = dict(pts_sensors)
+        if with_images:
+            sensors.update(info['images'] or {})
+        for sensor, sensor_info in sensors.items():
+            key = os.path.join(info['scene_name'], sensor,
+                               sensor_info['file_name'])
+            filename = os.path.join(data_path, key)
+            if not os.path.exists(filename):
+                num_missing += 1
+                continue
+            with open(filename, 'rb') as f:
+                data = f.read()
+            shape = tuple(int(x) for x in sensor_info['shape'])
+            if sensor in pts_sensors:
+                # 以文件的实际大小为准
+                load_dim = shape[-1]
+                shape = (len(data) // 4 // load_dim, load_dim)
+            writer.add(key, data, shape)
+    writer.close()
+    print(f'USD shards are saved to {out_dir}, '
+          f'{num_missing} missing files are skipped')
+    return out_dir
 
 
 def _read_file(path):
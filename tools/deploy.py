@@ -53,6 +53,12 @@ def parse_args():
         help='Image directory for quantize model.')
     parser.add_argument(
         '--quant', action='store_true', help='Quantize model to low bit.')
+    parser.add_argument(
+        '--verify',
+        action='store_true',
+        help='compare the outputs of onnxruntime (cpu) with the pytorch '
+        'model, only for models whose onnx_export matches the exported graph, '
+        'e.g. YOLOPV2')
     parser.add_argument(
         '--uri',
         default='192.168.1.1:60000',
@@ -95,6 +101,75 @@ def torch2ir(ir_type: IR):
         raise KeyError(f'Unexpected IR type {ir_type}')
 
 
+def verify_onnx_outputs(model_cfg_path,
+                        deploy_cfg_path,
+                        checkpoint_path,
+                        onnx_path,
+                        img,
+                        device='cpu',
+                        rtol=1e-3,
+                        atol=1e-3,
+                        max_mismatch=0.01):
+    """使用onnxruntime(cpu)运行导出的onnx, 与pytorch模型的 onnx_export 逐个输出比较.
+
+    浮点输出要求 ``|ort - torch| <= atol + rtol * |torch|``, 整数输出(labels,
+    label map等)要求不一致的元素比例不超过 ``max_mismatch``, 否则抛出异常.
+    """
+    import numpy as np
+    import onnxruntime as ort
+    import torch
+    from mmdeploy.apis.utils import build_task_processor
+    from mmdeploy.utils import get_input_shape
+
+    logger = get_root_logger()
+    deploy_cfg, model_cfg = load_config(deploy_cfg_path, model_cfg_path)
+    task_processor = build_task_processor(model_cfg, deploy_cfg, device)
+    model = task_processor.init_pytorch_model(checkpoint_path)
+    data, model_inputs = task_processor.create_input(
+        img, get_input_shape(deploy_cfg))
+    input_img = model_inputs[0] if isinstance(model_inputs,
+                                              (list, tuple)) else model_inputs
+    with torch.no_grad():
+        torch_outputs = model.onnx_export(
+            input_img,
+            data['img_metas'][0],
+            with_nms=model.test_cfg.get('with_nms', True))
+
+    session = ort.InferenceSession(
+        onnx_path, providers=['CPUExecutionProvider'])
+    output_names = get_ir_config(deploy_cfg)['output_names']
+    ort_outputs = session.run(
+        output_names,
+        {session.get_inputs()[0].name: input_img.cpu().numpy()})
+    assert len(torch_outputs) == len(ort_outputs), \
+        f'pytorch gives {len(torch_outputs)} outputs, ' \
+        f'onnxruntime gives {len(ort_outputs)}'
+
+    failed = []
+    for name, torch_output, ort_output in zip(output_names, torch_outputs,
+                                              ort_outputs):
+        torch_output = torch_output.cpu().numpy()
+        if torch_output.shape != ort_output.shape:
+            failed.append(name)
+            logger.error(f'{name}: shape {ort_output.shape} != '
+                         f'{torch_output.shape}')
+            continue
+        if np.issubdtype(torch_output.dtype, np.floating):
+            diff = np.abs(ort_output - torch_output)
+            ok = np.all(diff <= atol + rtol * np.abs(torch_output))
+            logger.info(f'{name}: max abs diff {diff.max(initial=0):.6f}')
+        else:
+            mismatch = np.mean(ort_output != torch_output) \
+                if torch_output.size else 0.0
+            ok = mismatch <= max_mismatch
+            logger.info(f'{name}: mismatch ratio {mismatch:.6f}')
+        if not ok:
+            failed.append(name)
+    if failed:
+        raise RuntimeError(f'onnxruntime outputs {failed} do not match '
+                           'the pytorch model')
+
+
 def main():
     args = parse_args()
     set_start_method('spawn', force=True)
@@ -410,6 +485,24 @@ def main():
     if args.test_img is None:
         args.test_img = args.img
 
+    if args.verify:
+        assert ir_type == IR.ONNX, '--verify only supports onnx'
+        create_process(
+            'verify onnxruntime outputs',
+            target=verify_onnx_outputs,
+            args=(model_cfg_path, deploy_cfg_path, checkpoint_path,
+                  osp.join(args.work_dir, ir_save_file), args.test_img,
+                  args.device),
+            kwargs=dict(),
+            ret_value=ret_value)
+
+    # mmdeploy 的检测模型只能解析 dets、labels、masks, 多任务模型无法可视化
+    output_names = ir_config.get('output_names', [])
+    if {'drivable', 'lane'} & set(output_names):
+        logger.info(f'skip visualization of outputs {output_names}')
+        logger.info('All process success.')
+        return
+
     extra = dict(
         backend=backend,
         output_file=osp.join(args.work_dir, f'output_{backend.value}.jpg'),
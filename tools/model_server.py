@@ -0,0 +1,143 @@
+# Copyright (c) windzu. All rights reserved.
+"""本机推理服务, 多个 rosrun.py 节点共享同一个模型.
+
+模型按照 rosrun.py 相同的方式加载一次, 各节点通过 ``--server`` 连接,
+帧与结果通过共享内存环形缓冲区传递, 见 ros_utils/shm.py.
+"""
+import os
+from argparse import ArgumentParser
+
+import rospy
+from ros_utils.compact import (arrays_to_pointcloud2, pack_det2d_result,
+                               pack_det3d_result, pack_seg2d_result)
+from ros_utils.shm import ModelServer
+from rosrun import ROSInterface
+
+
+def build_handler(ros_interface):
+    """根据任务类型构建推理服务的处理函数, 输出为紧凑的数组."""
+    task_type = ros_interface.task_type
+    if task_type == 'det2d':
+
+        def handler(arrays, extra, state):
+            return pack_det2d_result(ros_interface.inference(arrays[0]))
+    elif task_type == 'seg2d':
+
+        def handler(arrays, extra, state):
+            return pack_seg2d_result(ros_interface.inference(arrays[0]))
+    elif task_type == 'det3d':
+
+        inferencer = ros_interface.inferencer
+
+        def handler(arrays, extra, state):
+            # 位姿由client根据自己订阅的odom查找
+            meta, pose = extra
+            pc = arrays_to_pointcloud2(arrays, meta)
+            # 每个client(lidar)有自己的sweep缓存, 不同lidar的帧不会拼接在一起
+            if 'sweeps' not in state:
+                state['sweeps'] = inferencer.new_sweeps()
+            previous = inferencer.swap_sweeps(state['sweeps'])
+            try:
+                data = inferencer.preprocess(pc, pose)
+            finally:
+                inferencer.swap_sweeps(previous)
+            return pack_det3d_result(ros_interface.inference(data))
+    else:
+        raise ValueError(f'unsupported task type {task_type}')
+    return handler
+
+
+def parse_args():
+    parser = ArgumentParser()
+    # about model
+    parser.add_argument('--config', help='model config file path')
+    parser.add_argument('--checkpoint', help='model checkpoint file')
+    parser.add_argument(
+        '--device', default='cuda:0', help='Device used for inference')
+    parser.add_argument(
+        '--task_type', type=str, help='task type, det2d or seg2d or det3d')
+    parser.add_argument(
+        '--backend',
+        default='pytorch',
+        choices=['pytorch', 'onnxruntime', 'tensorrt', 'sdk'],
+        help='inference backend, see tools/rosrun.py')
+    parser.add_argument(
+        '--deploy_cfg', default=None, help='deploy config of tools/deploy.py')
+    parser.add_argument(
+        '--model_dir', default=None, help='work-dir of tools/deploy.py')
+    parser.add_argument(
+        '--crop_range',
+        action='store_true',
+        help='discard points out of range while decoding, see tools/rosrun.py')
+    parser.add_argument(
+        '--max_points',
+        type=int,
+        default=None,
+        help='randomly keep at most max_points points while decoding')
+    parser.add_argument(
+        '--warmup',
+        type=int,
+        default=0,
+        help='number of synthetic frames run before serving')
+    parser.add_argument(
+        '--warmup_shape',
+        type=int,
+        nargs='+',
+        default=None,
+        help='height and width of images or number of points of point '
+        'clouds, see tools/rosrun.py')
+    # about server
+    parser.add_argument(
+        '--address',
+        default='/tmp/admlops_model_server.sock',
+        help='unix socket the server listens on')
+    parser.add_argument(
+        '--authkey',
+        default=None,
+        help='authkey clients must present, read from the '
+        'ADMLOPS_MODEL_SERVER_AUTHKEY environment variable if not set')
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+    ros_interface = ROSInterface(
+        config=args.config,
+        checkpoint=args.checkpoint,
+        score_thr=0.0,
+        device=args.device,
+        task_type=args.task_type,
+        sub_topic='server',
+        sub_msg_type='pc' if args.task_type == 'det3d' else 'img',
+        crop_range=args.crop_range,
+        max_points=args.max_points,
+        backend=args.backend,
+        deploy_cfg=args.deploy_cfg,
+        model_dir=args.model_dir,
+        warmup=args.warmup,
+        warmup_shape=args.warmup_shape,
+    )
+    server = ModelServer(
+        args.address,
+        build_handler(ros_interface),
+        info=dict(
+            task_type=args.task_type, classes=list(ros_interface.classes)),
+        authkey=args.authkey)
+
+    # 不需要ros master, 使用系统时间作为 rospy.Time.now()
+    rospy.rostime.set_rostime_initialized(True)
+    ros_interface.warmup()
+
+    # 上次异常退出时残留的socket文件
+    if os.path.exists(args.address):
+        os.remove(args.address)
+    print(f'---model server listening on {args.address}---')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+# Copyright (c) windzu. All rights reserved.
+"""在没有ros master的情况下回放录制好的数据, 测试 rosrun.py 推理节点的性能.
+
+数据会经过与 ROSInterface 完全相同的 解码 -> 推理 -> 后处理 流程,
+结果发布到一个不依赖ros master的替身publisher上, 最后输出持续FPS、
+各阶段的耗时分布以及丢弃的帧数.
+"""
+import os
+import os.path as osp
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import rospy
+from ros_utils.metrics import LatencyMetrics
+from ros_utils.msgs import (compressed_image_to_msg, image_to_msg,
+                            points_to_pointcloud2)
+from rosrun import ROSInterface
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+class StandInPublisher:
+    """替代 rospy.Publisher, 只记录发布的次数."""
+
+    def __init__(self):
+        self.count = 0
+
+    def publish(self, msg):
+        self.count += 1
+
+
+def load_frames(input, sub_msg_type, compressed=False, load_dim=4,
+                topic=None):
+    """加载需要回放的所有帧, 并提前转换为ros msg, 避免回放时测到磁盘io.
+
+    Args:
+        input (str): 点云(.bin/.pcd)或图像(.jpg/.png)所在的文件夹, 或 .bag 文件
+        sub_msg_type (str): img or pc
+        compressed (bool): img 是否以 CompressedImage 的形式输入
+        load_dim (int): .bin 点云的维度
+        topic (str, optional): 从 .bag 中读取的topic
+
+    Returns:
+        list: ros msg 列表
+    """
+    if input.endswith('.bag'):
+        import rosbag
+        with rosbag.Bag(input) as bag:
+            topics = None if topic is None else [topic]
+            return [msg for _, msg, _ in bag.read_messages(topics=topics)]
+
+    frames = []
+    for file_name in sorted(os.listdir(input)):
+        path = osp.join(input, file_name)
+        ext = osp.splitext(file_name)[1].lower()
+        if sub_msg_type == 'pc' and ext == '.bin':
+            points = np.fromfile(path, dtype=np.float32)
+            frames.append(points_to_pointcloud2(points.reshape(-1, load_dim)))
+        elif sub_msg_type == 'pc' and ext == '.pcd':
+            from wadda.pypcd import pypcd
+            frames.append(pypcd.PointCloud.from_path(path).to_msg())
+        elif sub_msg_type == 'img' and ext in IMAGE_EXTENSIONS:
+            if compressed:
+                with open(path, 'rb') as f:
+                    frames.append(
+                        compressed_image_to_msg(
+                            f.read(), format=ext.lstrip('.')))
+            else:
+                import cv2
+                frames.append(image_to_msg(cv2.imread(path)))
+    return frames
+
+
+def wait_pipeline_slots(pipeline):
+    # 尽可能快地回放时, 等待流水线各阶段的输入槽都空出来再送入下一帧, 避免无意义的丢帧
+    while not all(slot.empty() for slot in pipeline.slots):
+        time.sleep(0.0005)
+
+
+def replay(ros_interface, frames, rate=0.0, loops=1):
+    """按照给定的频率回放所有帧.
+
+    当处理速度跟不上频率时, 与 queue_size=1 的 rospy.Subscriber 一样,
+    只处理最新的一帧, 中间的帧计为订阅端丢弃.
+
+    Args:
+        ros_interface (ROSInterface): 推理节点
+        frames (list): ros msg 列表
+        rate (float): 回放频率, 0表示尽可能快
+        loops (int): 回放的次数
+
+    Returns:
+        tuple[float, int]: 回放耗时与订阅端丢弃的帧数
+    """
+    total = len(frames) * loops
+    period = 1.0 / rate if rate > 0 else 0.0
+    dropped = 0
+    index = 0
+    start_time = time.perf_counter()
+    while index < total:
+        if period > 0:
+            elapsed = time.perf_counter() - start_time
+            due = int(elapsed / period)
+            if due < index:
+                time.sleep(index * period - elapsed)
+            elif due > index:
+                # 跳过已经过期的帧, 只处理最新的一帧
+                latest = min(due, total - 1)
+                dropped += latest - index
+                index = latest
+        elif ros_interface.pipeline is not None:
+            wait_pipeline_slots(ros_interface.pipeline)
+
+        msg = frames[index % len(frames)]
+        msg.header.stamp = rospy.Time.now()
+        ros_interface._callback(msg)
+        index += 1
+
+    if ros_interface.pipeline is not None:
+        # 等待最后一帧流出流水线
+        while not ros_interface.pipeline.idle:
+            time.sleep(0.0005)
+    return time.perf_counter() - start_time, dropped
+
+
+def parse_args():
+    parser = ArgumentParser()
+    # about model
+    parser.add_argument('--config', help='model config file path')
+    parser.add_argument('--checkpoint', help='model checkpoint file')
+    parser.add_argument(
+        '--score_thr', type=float, default=0.0, help='bbox score threshold')
+    parser.add_argument(
+        '--device', default='cpu', help='Device used for inference')
+    parser.add_argument(
+        '--task_type', type=str, help='task type, det2d or seg2d or det3d')
+    parser.add_argument(
+        '--backend',
+        default='pytorch',
+        choices=['pytorch', 'onnxruntime', 'tensorrt', 'sdk'],
+        help='inference backend, see tools/rosrun.py')
+    parser.add_argument(
+        '--deploy_cfg', default=None, help='deploy config of tools/deploy.py')
+    parser.add_argument(
+        '--model_dir', default=None, help='work-dir of tools/deploy.py')
+    # about replay
+    parser.add_argument(
+        '--input', help='dir of .bin/.pcd/.jpg/.png files or a .bag file')
+    parser.add_argument(
+        '--topic', default=None, help='topic to read from the .bag file')
+    parser.add_argument('--sub_msg_type', type=str, help='msg type, img or pc')
+    parser.add_argument(
+        '--compressed', action='store_true', help='if compressed image')
+    parser.add_argument(
+        '--reduced_decode',
+        action='store_true',
+        help='decode compressed jpeg at reduced scale, see tools/rosrun.py')
+    parser.add_argument(
+        '--load_dim', type=int, default=4, help='dimension of .bin points')
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=0.0,
+        help='replay rate in Hz, 0 means as fast as possible')
+    parser.add_argument(
+        '--loops', type=int, default=1, help='times to replay all frames')
+    parser.add_argument(
+        '--staged',
+        action='store_true',
+        help='run decode, preprocess, inference and publish in separate '
+        'threads, stale frames are dropped')
+    parser.add_argument(
+        '--latency_budget',
+        type=float,
+        default=None,
+        help='latency budget in seconds of a frame, see tools/rosrun.py')
+    parser.add_argument(
+        '--warmup',
+        type=int,
+        default=0,
+        help='number of synthetic frames run before replaying')
+    parser.add_argument(
+        '--warmup_shape',
+        type=int,
+        nargs='+',
+        default=None,
+        help='height and width of images or number of points of point '
+        'clouds, see tools/rosrun.py')
+    parser.add_argument(
+        '--metrics_interval',
+        type=float,
+        default=5.0,
+        help='interval in seconds between two metrics reports')
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+    # 不需要ros master, 使用系统时间作为 rospy.Time.now()
+    rospy.rostime.set_rostime_initialized(True)
+
+    frames = load_frames(args.input, args.sub_msg_type, args.compressed,
+                         args.load_dim, args.topic)
+    assert len(frames) > 0, f'no frame found in {args.input}'
+    print(f'loaded {len(frames)} frames from {args.input}')
+
+    metrics = LatencyMetrics(interval=args.metrics_interval)
+    ros_interface = ROSInterface(
+        config=args.config,
+        checkpoint=args.checkpoint,
+        score_thr=args.score_thr,
+        device=args.device,
+        task_type=args.task_type,
+        sub_topic='replay',
+        sub_msg_type=args.sub_msg_type,
+        compressed=args.compressed,
+        staged=args.staged,
+        metrics=metrics,
+        backend=args.backend,
+        deploy_cfg=args.deploy_cfg,
+        model_dir=args.model_dir,
+        reduced_decode=args.reduced_decode,
+        latency_budget=args.latency_budget,
+        warmup=args.warmup,
+        warmup_shape=args.warmup_shape,
+    )
+    publisher = StandInPublisher()
+    ros_interface.publisher = publisher
+    ros_interface.repub_publisher = StandInPublisher()
+    ros_interface.seg_publishers = {
+        name: StandInPublisher()
+        for name in ros_interface.seg_names
+    }
+
+    ros_interface.warmup()
+    ros_interface.start_workers()
+    elapsed, sub_dropped = replay(ros_interface, frames, args.rate,
+                                  args.loops)
+    ros_interface.stop_workers()
+
+    print('---replay result---')
+    metrics.report()
+    print(f'published: {publisher.count}, elapsed: {elapsed:.2f} s, '
+          f'sustained fps: {publisher.count / elapsed:.2f}')
+    print(f'dropped frames by subscriber: {sub_dropped}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,39 @@
 # Copyright (c) windzu. All rights reserved.
-from .postprocess import (det2d_postprocess, det3d_postprocess,
-                          seg2d_postprocess)
+from .batching import MicroBatcher
+from .metrics import LatencyMetrics, NullMetrics
+from .pipeline import LatestSlot, StagedPipeline
+from .pose import PoseBuffer
+from .postprocess_utils import label_map_runs
+from .scheduler import FrameScheduler
+from .shm import ModelClient, ModelServer, SharedRing
 
 # from .utils import pc_inference_detector
 
 __all__ = [
-    det2d_postprocess,
-    seg2d_postprocess,
-    det3d_postprocess,
+    'LatestSlot',
+    'StagedPipeline',
+    'LatencyMetrics',
+    'NullMetrics',
+    'PoseBuffer',
+    'MicroBatcher',
+    'SharedRing',
+    'ModelServer',
+    'ModelClient',
+    'FrameScheduler',
+    'label_map_runs',
 ]
+
+try:
+    from .postprocess import (det2d_postprocess, det3d_postprocess,
+                              multi2d_postprocess, seg2d_postprocess)
+except ImportError:
+    # postprocess 依赖ros的msg, 其余模块(共享内存、流水线、调度等)只依赖
+    # numpy与标准库, 没有ros的环境(例如单元测试)中依然可以导入
+    pass
+else:
+    __all__ += [
+        'det2d_postprocess',
+        'seg2d_postprocess',
+        'det3d_postprocess',
+        'multi2d_postprocess',
+    ]
@@ -0,0 +1,250 @@
+# Copyright (c) windzu. All rights reserved.
+import copy
+import os
+import os.path as osp
+
+import numpy as np
+import torch
+
+# 各推理后端转换后的模型文件后缀
+BACKEND_FILE_EXTENSIONS = dict(onnxruntime='.onnx', tensorrt='.engine')
+
+
+def find_backend_files(model_dir, backend):
+    """查找 tools/deploy.py 的 work-dir 中的后端模型文件.
+
+    Args:
+        model_dir (str): tools/deploy.py 的 work-dir
+        backend (str): 推理后端, onnxruntime or tensorrt
+
+    Returns:
+        list[str]: 后端模型文件路径
+    """
+    assert backend in BACKEND_FILE_EXTENSIONS, \
+        f'unsupported backend {backend}'
+    ext = BACKEND_FILE_EXTENSIONS[backend]
+    files = [
+        osp.join(model_dir, f) for f in sorted(os.listdir(model_dir))
+        if f.endswith(ext)
+    ]
+    assert len(files) > 0, f'no {ext} file found in {model_dir}'
+    return files
+
+
+def get_classes(model, model_cfg):
+    """获取类别名, 优先使用模型自带的类别名."""
+    classes = getattr(model, 'CLASSES', None)
+    if classes is None:
+        classes = model_cfg.get('class_names', None)
+    if classes is None:
+        from mmdeploy.codebase.mmdet.deploy.object_detection_model import \
+            get_classes_from_config
+        classes = get_classes_from_config(model_cfg)
+    return classes
+
+
+class DeployedModel:
+    """通过mmdeploy加载 tools/deploy.py 转换后的模型, 提供与pytorch模型相同的推理接口.
+
+    Args:
+        model_cfg (str): 模型的配置文件路径
+        deploy_cfg (str): 转换时使用的部署配置文件路径
+        model_dir (str): tools/deploy.py 的 work-dir
+        device (str): 推理使用的设备. Defaults to 'cpu'.
+    """
+
+    def __init__(self, model_cfg, deploy_cfg, model_dir, device='cpu'):
+        from mmdeploy.apis.utils import build_task_processor
+        from mmdeploy.utils import get_backend, get_input_shape, load_config
+
+        deploy_cfg, model_cfg = load_config(deploy_cfg, model_cfg)
+        self.cfg = model_cfg
+        self.device = device
+        self.task_processor = build_task_processor(model_cfg, deploy_cfg,
+                                                   device)
+        backend = get_backend(deploy_cfg).value
+        self.model = self.task_processor.init_backend_model(
+            find_backend_files(model_dir, backend))
+        self.input_shape = get_input_shape(deploy_cfg)
+        self.CLASSES = get_classes(self.model, model_cfg)
+
+    def _run(self, img):
+        model_inputs, _ = self.task_processor.create_input(
+            img, self.input_shape)
+        with torch.no_grad():
+            return self.task_processor.run_inference(self.model, model_inputs)
+
+    def inference_detector(self, imgs):
+        """与 mmdet.apis.inference_detector 的输出格式相同, 支持输入多张图像."""
+        results = self._run(imgs)
+        return results if isinstance(imgs, (list, tuple)) else results[0]
+
+    def inference_segmentor(self, img):
+        """与 mmseg.apis.inference_segmentor 的输出格式相同."""
+        return self._run(img)
+
+    def __call__(self, return_loss=False, rescale=True, **data):
+        """与 mmdet3d 模型的forward接口相同, 供 Detector3DInferencer 调用."""
+        return self.model(
+            return_loss=False,
+            points=data['points'],
+            img_metas=data['img_metas'])
+
+
+class SDKDetector:
+    """使用 mmdeploy SDK 加载 tools/deploy.py --dump-info 输出的模型目录.
+
+    Args:
+        model_cfg (str): 模型的配置文件路径, 用于获取类别名
+        model_dir (str): tools/deploy.py 的 work-dir
+        device (str): 推理使用的设备. Defaults to 'cpu'.
+    """
+
+    def __init__(self, model_cfg, model_dir, device='cpu'):
+        import mmcv
+        from mmdeploy_python import Detector
+
+        device_name, _, device_id = device.partition(':')
+        self.detector = Detector(model_dir, device_name, int(device_id or 0))
+        self.CLASSES = get_classes(None, mmcv.Config.fromfile(model_cfg))
+
+    def inference_detector(self, imgs):
+        """与 mmdet.apis.inference_detector 的输出格式相同, 支持输入多张图像."""
+        is_batch = isinstance(imgs, (list, tuple))
+        results = []
+        for bboxes, labels, _ in self.detector(
+                list(imgs) if is_batch else [imgs]):
+            results.append([
+                bboxes[labels == i].astype(np.float32)
+                for i in range(len(self.CLASSES))
+            ])
+        return results if is_batch else results[0]
+
+
+class ORTMultiTaskDetector:
+    """使用onnxruntime直接运行 tools/deploy.py 导出的YOLOPV2等多任务模型.
+
+    mmdeploy 的检测模型只解析 dets、labels、masks 三个输出, 这里按照输出名
+    解析检测、drivable 与 lane, 输出格式与pytorch模型的 simple_test 相同.
+    label map 按最近邻缩放到原图尺寸, 不再对logits做双线性插值.
+
+    Args:
+        model_cfg (str): 模型的配置文件路径
+        model_dir (str): tools/deploy.py 的 work-dir
+        device (str): 推理使用的设备. Defaults to 'cpu'.
+    """
+
+    SEG_NAMES = ('drivable', 'lane')
+
+    def __init__(self, model_cfg, model_dir, device='cpu'):
+        import mmcv
+        import onnxruntime as ort
+        from mmdet.datasets import replace_ImageToTensor
+        from mmdet.datasets.pipelines import Compose
+
+        self.cfg = mmcv.Config.fromfile(model_cfg)
+        providers = ['CPUExecutionProvider']
+        if device.startswith('cuda'):
+            device_id = int(device.partition(':')[2] or 0)
+            providers.insert(0, ('CUDAExecutionProvider',
+                                 dict(device_id=device_id)))
+        self.session = ort.InferenceSession(
+            find_backend_files(model_dir, 'onnxruntime')[0],
+            providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_names = [
+            output.name for output in self.session.get_outputs()
+        ]
+        # 导出时是否在图中做了NMS, 否则输出为 bboxes 与 scores
+        self.with_nms = 'dets' in self.output_names
+        tasks = [name for name in self.SEG_NAMES if name in self.output_names]
+        if self.with_nms or 'scores' in self.output_names:
+            tasks.append('bbox')
+        self.test_tasks = set(tasks)
+
+        test_cfg = self.cfg.model.test_cfg
+        self.score_thr = test_cfg.score_thr
+        self.nms_cfg = test_cfg.nms
+        self.CLASSES = get_classes(None, self.cfg)
+
+        # 与 mmdet.apis.inference_detector 相同的预处理, 只构建一次
+        pipeline = copy.deepcopy(self.cfg.data.test.pipeline)
+        pipeline[0].type = 'LoadImageFromWebcam'
+        self.pipeline = Compose(replace_ImageToTensor(pipeline))
+
+    def _preprocess(self, imgs):
+        inputs, img_metas = [], []
+        for img in imgs:
+            data = self.pipeline(dict(img=img))
+            img = data['img'][0]
+            inputs.append(getattr(img, 'data', img).numpy())
+            img_metas.append(data['img_metas'][0].data)
+        # 与collate相同, pad到batch中最大的尺寸
+        h = max(img.shape[1] for img in inputs)
+        w = max(img.shape[2] for img in inputs)
+        batch = np.zeros((len(inputs), inputs[0].shape[0], h, w),
+                         dtype=np.float32)
+        for i, img in enumerate(inputs):
+            batch[i, :, :img.shape[1], :img.shape[2]] = img
+        return batch, img_metas
+
+    def _bbox_result(self, outputs, img_id, img_meta):
+        num_classes = len(self.CLASSES)
+        if self.with_nms:
+            dets = outputs['dets'][img_id]
+            labels = outputs['labels'][img_id]
+            keep = labels >= 0
+            bboxes, labels = dets[keep], labels[keep]
+        else:
+            from mmcv.ops import batched_nms
+
+            # 与 YOLOXHead._bboxes_nms 相同
+            scores = outputs['scores'][img_id]
+            labels = scores.argmax(axis=1)
+            scores = scores[np.arange(len(labels)), labels]
+            valid = scores >= self.score_thr
+            bboxes, keep = batched_nms(
+                torch.from_numpy(outputs['bboxes'][img_id][valid]),
+                torch.from_numpy(scores[valid]),
+                torch.from_numpy(labels[valid]), self.nms_cfg)
+            bboxes, labels = bboxes.numpy(), labels[valid][keep.numpy()]
+        bboxes = bboxes.astype(np.float32)
+        bboxes[:, :4] /= np.asarray(img_meta['scale_factor'], np.float32)
+        return [bboxes[labels == i] for i in range(num_classes)]
+
+    @staticmethod
+    def _seg_result(seg, img_meta):
+        import cv2
+
+        h, w = img_meta['img_shape'][:2]
+        ori_h, ori_w = img_meta['ori_shape'][:2]
+        return cv2.resize(
+            np.ascontiguousarray(seg[:h, :w]), (ori_w, ori_h),
+            interpolation=cv2.INTER_NEAREST)
+
+    def inference_detector(self, imgs):
+        """与 mmdet.apis.inference_detector 的输出格式相同, 支持输入多张图像."""
+        is_batch = isinstance(imgs, (list, tuple))
+        batch, img_metas = self._preprocess(imgs if is_batch else [imgs])
+        outputs = dict(
+            zip(self.output_names,
+                self.session.run(None, {self.input_name: batch})))
+
+        results = []
+        for img_id, img_meta in enumerate(img_metas):
+            if 'bbox' in self.test_tasks:
+                bbox_result = self._bbox_result(outputs, img_id, img_meta)
+            else:
+                bbox_result = [
+                    np.zeros((0, 5), dtype=np.float32) for _ in self.CLASSES
+                ]
+            if self.test_tasks == {'bbox'}:
+                results.append(bbox_result)
+                continue
+            segs = [
+                self._seg_result(outputs[name][img_id], img_meta)
+                if name in self.test_tasks else None
+                for name in self.SEG_NAMES
+            ]
+            results.append((bbox_result, *segs))
+        return results if is_batch else results[0]
@@ -0,0 +1,91 @@
+# Copyright (c) windzu. All rights reserved.
+import threading
+import time
+import traceback
+
+
+class MicroBatcher:
+    """将多个topic在一个时间窗口内到达的帧组成一个batch进行处理.
+
+    batch中的第一帧到达后, 最多等待 ``window`` 秒, 如果在此之前所有topic都已经到达,
+    则立即处理. 同一个topic在batch被处理前再次到达时, 只保留最新的一帧.
+    ``stop`` 时等待处理中的batch结束, 尚未组成batch的帧被丢弃.
+
+    Args:
+        keys (list[str]): 所有的topic
+        process (callable): 处理一个batch的函数, 输入为 [(topic, msg), ...]
+        window (float): 最长的等待时间, 单位秒. Defaults to 0.02.
+
+    Attributes:
+        dropped (dict[str, int]): 每个topic被覆盖而未被处理的帧数
+    """
+
+    def __init__(self, keys, process, window=0.02):
+        self.keys = list(keys)
+        self.process = process
+        self.window = window
+        self.dropped = {key: 0 for key in self.keys}
+
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._first_time = None
+        self._closed = False
+        self._thread = None
+
+    def put(self, key, item):
+        with self._cond:
+            if self._closed:
+                return
+            if key in self._pending:
+                self.dropped[key] += 1
+            self._pending[key] = item
+            if self._first_time is None:
+                self._first_time = time.perf_counter()
+            self._cond.notify()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._cond:
+            self._pending = {}
+            self._first_time = None
+
+    def _next_batch(self):
+        """等待下一个batch, 关闭后返回 None."""
+        with self._cond:
+            while len(self._pending) == 0 and not self._closed:
+                self._cond.wait()
+            deadline = self._first_time + self.window \
+                if self._first_time is not None else 0
+            while len(self._pending) < len(self.keys) and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if self._closed:
+                return None
+            # 按照topic的顺序组成batch
+            batch = [(key, self._pending[key]) for key in self.keys
+                     if key in self._pending]
+            self._pending = {}
+            self._first_time = None
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self.process(batch)
+            except Exception:
+                print('batch process failed:')
+                traceback.print_exc()
@@ -0,0 +1,111 @@
+# Copyright (c) windzu. All rights reserved.
+"""推理服务与ros节点之间传递的紧凑数组格式.
+
+服务端将模型的输出打包为少量的numpy数组, client端再解包为各 ``*_postprocess``
+可以直接处理的格式.
+"""
+from types import SimpleNamespace
+
+import numpy as np
+
+from mmdet_ext.core import result2arrays
+
+
+def pack_det2d_result(result):
+    """将mmdet的检测结果打包为 (N, 6) 的数组, 每行为 x1, y1, x2, y2, score, label."""
+    bboxes, scores, labels = result2arrays(result)
+    return [
+        np.hstack([bboxes, scores[:, None], labels[:, None]]).astype(
+            np.float32)
+    ]
+
+
+def unpack_det2d_result(arrays, num_classes):
+    """``pack_det2d_result`` 的逆过程, 返回每个类别一个 (n, 5) 数组的列表."""
+    packed = arrays[0]
+    labels = packed[:, 5].astype(np.int64)
+    return [packed[labels == i, :5] for i in range(num_classes)]
+
+
+def pack_seg2d_result(result):
+    """将mmseg的分割结果打包为 (H, W) 的类别id数组."""
+    seg = np.asarray(result[0])
+    dtype = np.uint8 if seg.max(initial=0) < 256 else np.int32
+    return [seg.astype(dtype)]
+
+
+def unpack_seg2d_result(arrays):
+    return [arrays[0]]
+
+
+def pack_det3d_result(result):
+    """将mmdet3d的检测结果打包为 (N, box_dim + 2) 的数组, 最后两列为 score, label.
+
+    Args:
+        result (tuple): (results, data), ``Detector3DInferencer.forward`` 的输出
+            与pipeline的输出
+    """
+    results, _ = result
+    result = results[0]
+    if 'pts_bbox' in result.keys():
+        result = result['pts_bbox']
+    bboxes = result['boxes_3d'].tensor.numpy()
+    scores = result['scores_3d'].numpy()
+    labels = result['labels_3d'].numpy()
+    return [
+        np.hstack([bboxes, scores[:, None], labels[:, None]]).astype(
+            np.float32)
+    ]
+
+
+def unpack_det3d_result(arrays):
+    """``pack_det3d_result`` 的逆过程, 返回 det3d_postprocess 可以处理的格式."""
+    packed = arrays[0]
+    bboxes = packed[:, :-2]
+    scores = packed[:, -2]
+    labels = packed[:, -1].astype(np.int64)
+    return [(bboxes, scores, labels)], None
+
+
+def pointcloud2_to_arrays(msg):
+    """将PointCloud2拆分为原始数据与少量的元信息, 数据不做解码.
+
+    Returns:
+        tuple[list[np.ndarray], dict]: 原始数据与元信息
+    """
+    meta = dict(
+        stamp=msg.header.stamp.to_sec(),
+        frame_id=msg.header.frame_id,
+        height=msg.height,
+        width=msg.width,
+        fields=[(f.name, f.offset, f.datatype, f.count) for f in msg.fields],
+        is_bigendian=msg.is_bigendian,
+        point_step=msg.point_step,
+        row_step=msg.row_step)
+    return [np.frombuffer(msg.data, dtype=np.uint8)], meta
+
+
+def arrays_to_pointcloud2(arrays, meta):
+    """``pointcloud2_to_arrays`` 的逆过程.
+
+    返回一个与PointCloud2属性相同的对象, 可以直接作为 LoadPointsFromPointCloud2
+    的输入, 不需要ros.
+    """
+    stamp = meta['stamp']
+    header = SimpleNamespace(
+        stamp=SimpleNamespace(to_sec=lambda: stamp),
+        frame_id=meta['frame_id'])
+    fields = [
+        SimpleNamespace(name=name, offset=offset, datatype=datatype,
+                        count=count)
+        for name, offset, datatype, count in meta['fields']
+    ]
+    return SimpleNamespace(
+        header=header,
+        height=meta['height'],
+        width=meta['width'],
+        fields=fields,
+        is_bigendian=meta['is_bigendian'],
+        point_step=meta['point_step'],
+        row_step=meta['row_step'],
+        data=arrays[0])
@@ -0,0 +1,129 @@
+# Copyright (c) windzu. All rights reserved.
+import cv2
+import numpy as np
+
+# jpeg 可以在解码时直接缩小 1/2, 1/4, 1/8
+REDUCED_DECODE_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def get_test_img_scale(cfg):
+    """从test pipeline中获取Resize的目标尺寸.
+
+    Args:
+        cfg (mmcv.Config): 模型的配置
+
+    Returns:
+        tuple[tuple[int, int], bool] | None: img_scale 与 keep_ratio,
+            pipeline 中没有固定尺寸的 Resize 时返回 None
+    """
+    for transform in cfg.data.test.pipeline:
+        if transform.type == 'MultiScaleFlipAug':
+            img_scale = transform.get('img_scale', None)
+            resizes = [
+                t for t in transform.transforms if t.type == 'Resize'
+            ]
+            keep_ratio = resizes[0].get('keep_ratio', True) \
+                if len(resizes) > 0 else True
+        elif transform.type == 'Resize':
+            img_scale = transform.get('img_scale', None)
+            keep_ratio = transform.get('keep_ratio', True)
+        else:
+            continue
+        if img_scale is None:
+            return None
+        if isinstance(img_scale, list):
+            # 多尺度测试时以最大的尺寸为准
+            img_scale = max(img_scale, key=lambda scale: max(scale))
+        return tuple(img_scale), keep_ratio
+    return None
+
+
+def get_reduce_factor(img_shape, img_scale, keep_ratio=True):
+    """计算解码时可以缩小的倍数, 保证缩小后的图像仍然不小于pipeline中Resize后的尺寸.
+
+    Args:
+        img_shape (tuple[int]): 原始图像的 (h, w)
+        img_scale (tuple[int]): Resize 的目标尺寸
+        keep_ratio (bool): Resize 是否保持长宽比
+
+    Returns:
+        int: 1, 2, 4 or 8
+    """
+    h, w = img_shape[:2]
+    if keep_ratio:
+        # 与 mmcv.rescale_size 的计算方式一致
+        max_long_edge, max_short_edge = max(img_scale), min(img_scale)
+        scale = min(max_long_edge / max(h, w), max_short_edge / min(h, w))
+    else:
+        scale = max(img_scale[0] / w, img_scale[1] / h)
+    for factor in sorted(REDUCED_DECODE_FLAGS, reverse=True):
+        if 1 / factor >= scale:
+            return factor
+    return 1
+
+
+class ReducedImageDecoder:
+    """按照模型输入尺寸以缩小的分辨率解码 CompressedImage.
+
+    第一帧以原始分辨率解码, 用于确定原始图像的尺寸与可以缩小的倍数,
+    之后的帧直接以缩小后的分辨率解码. 检测结果需要通过 ``rescale_det2d_result``
+    转换回原始图像的坐标.
+
+    Args:
+        img_scale (tuple[int]): test pipeline 中 Resize 的目标尺寸
+        keep_ratio (bool): Resize 是否保持长宽比. Defaults to True.
+    """
+
+    def __init__(self, img_scale, keep_ratio=True):
+        self.img_scale = img_scale
+        self.keep_ratio = keep_ratio
+        self.ori_shape = None
+        self.factor = 1
+
+    def decode(self, buf):
+        """解码图像.
+
+        Args:
+            buf (bytes): CompressedImage 的 data
+
+        Returns:
+            np.ndarray: bgr图像
+        """
+        buf = np.frombuffer(buf, dtype=np.uint8)
+        if self.factor > 1:
+            img = cv2.imdecode(buf, REDUCED_DECODE_FLAGS[self.factor])
+            h, w = self.ori_shape
+            expected = (-(-h // self.factor), -(-w // self.factor))
+            if img.shape[:2] == expected:
+                return img
+        # 第一帧或图像尺寸发生变化时, 以原始分辨率解码并重新计算缩小倍数
+        img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        self.ori_shape = img.shape[:2]
+        self.factor = get_reduce_factor(self.ori_shape, self.img_scale,
+                                        self.keep_ratio)
+        return img
+
+    def rescale_det2d_result(self, result, img_shape):
+        """将以缩小分辨率检测的2d bbox转换回原始图像的坐标.
+
+        Args:
+            result (list[np.ndarray] | tuple): mmdet 的检测结果
+            img_shape (tuple[int]): 检测时图像的尺寸
+
+        Returns:
+            list[np.ndarray] | tuple: 原始图像坐标下的检测结果
+        """
+        scale_h = self.ori_shape[0] / img_shape[0]
+        scale_w = self.ori_shape[1] / img_shape[1]
+        if scale_h == 1 and scale_w == 1:
+            return result
+        bbox_result = result[0] if isinstance(result, tuple) else result
+        scale = np.array([scale_w, scale_h, scale_w, scale_h],
+                         dtype=np.float32)
+        for bboxes in bbox_result:
+            bboxes[:, :4] *= scale
+        return result
@@ -0,0 +1,282 @@
+# Copyright (c) windzu. All rights reserved.
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class NullMetrics:
+    """关闭统计时使用的空实现, 所有接口均不做任何事情."""
+
+    enabled = False
+
+    def timer(self, stage):
+        return _NULL_TIMER
+
+    def record(self, stage, seconds):
+        pass
+
+    def count(self, name, value):
+        pass
+
+    def frame_done(self):
+        pass
+
+    def start(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _StageTimer:
+    __slots__ = ('metrics', 'stage', 'start_time')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+        self.start_time = None
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.metrics.record(self.stage,
+                            time.perf_counter() - self.start_time)
+        return False
+
+
+class LatencyMetrics:
+    """统计各个阶段的耗时, 并定期输出 p50/p95/p99 以及 FPS.
+
+    每个阶段只保留最近 ``window`` 个样本, 统计结果会打印到stdout,
+    也可以同时追加到日志文件、写入Prometheus文本文件或通过HTTP提供.
+
+    Args:
+        interval (float): 输出统计结果的间隔, 单位秒. Defaults to 5.0.
+        window (int): 每个阶段保留的样本数. Defaults to 1000.
+        log_file (str, optional): 统计结果追加写入的日志文件.
+        prom_file (str, optional): Prometheus文本格式的输出文件.
+        http_port (int, optional): 提供Prometheus文本格式的HTTP端口.
+        http_host (str): HTTP服务监听的地址, 默认只监听本机, 需要从其他
+            机器访问时设置为 '0.0.0.0'. Defaults to '127.0.0.1'.
+        prefix (str): 指标名前缀. Defaults to 'rosrun'.
+    """
+
+    enabled = True
+
+    def __init__(self,
+                 interval=5.0,
+                 window=1000,
+                 log_file=None,
+                 prom_file=None,
+                 http_port=None,
+                 http_host='127.0.0.1',
+                 prefix='rosrun'):
+        self.interval = interval
+        self.window = window
+        self.log_file = log_file
+        self.prom_file = prom_file
+        self.http_port = http_port
+        self.http_host = http_host
+        self.prefix = prefix
+
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._counts = {}
+        self._sums = {}
+        # name -> [累计值, 次数], 例如每帧丢弃的点数
+        self._counters = {}
+        self._frames = 0
+        self._last_frames = 0
+        self._last_time = time.perf_counter()
+        self._fps = 0.0
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._server = None
+        # 第一次定期输出之前的采集也能得到计数为0的指标, 而不是空的结果
+        self._prom_text = self.format_prometheus(self.summary())
+
+    def timer(self, stage):
+        """返回统计 ``stage`` 耗时的上下文管理器."""
+        return _StageTimer(self, stage)
+
+    def record(self, stage, seconds):
+        with self._lock:
+            if stage not in self._samples:
+                self._samples[stage] = deque(maxlen=self.window)
+                self._counts[stage] = 0
+                self._sums[stage] = 0.0
+            self._samples[stage].append(seconds)
+            self._counts[stage] += 1
+            self._sums[stage] += seconds
+
+    def count(self, name, value):
+        """累计每帧的计数 ``value``, 例如解码时丢弃的点数."""
+        with self._lock:
+            counter = self._counters.setdefault(name, [0, 0])
+            counter[0] += value
+            counter[1] += 1
+
+    def frame_done(self):
+        with self._lock:
+            self._frames += 1
+
+    def summary(self):
+        """计算当前的统计结果.
+
+        Returns:
+            dict: 包含 ``fps``, 每个阶段的 ``count``, ``sum`` 与分位数,
+                以及每个计数的 ``total`` 与 ``count``.
+        """
+        now = time.perf_counter()
+        with self._lock:
+            samples = {k: np.asarray(v) for k, v in self._samples.items()}
+            counts = dict(self._counts)
+            sums = dict(self._sums)
+            counters = {
+                name: dict(total=total, count=count)
+                for name, (total, count) in self._counters.items()
+            }
+            frames = self._frames
+            elapsed = now - self._last_time
+            if elapsed > 0:
+                self._fps = (frames - self._last_frames) / elapsed
+            self._last_frames = frames
+            self._last_time = now
+            fps = self._fps
+
+        stages = {}
+        for stage, values in samples.items():
+            if len(values) == 0:
+                continue
+            stages[stage] = dict(
+                count=counts[stage],
+                sum=sums[stage],
+                quantiles=dict(
+                    zip(QUANTILES, np.quantile(values, QUANTILES))))
+        return dict(
+            fps=fps, frames=frames, stages=stages, counters=counters)
+
+    @staticmethod
+    def format_summary(summary):
+        lines = [f"fps: {summary['fps']:.2f}, frames: {summary['frames']}"]
+        for stage, stat in summary['stages'].items():
+            q = stat['quantiles']
+            lines.append(f'  {stage:<12} p50: {q[0.5] * 1000:8.2f} ms '
+                         f'p95: {q[0.95] * 1000:8.2f} ms '
+                         f'p99: {q[0.99] * 1000:8.2f} ms')
+        for name, stat in summary['counters'].items():
+            lines.append(f'  {name:<12} total: {stat["total"]} '
+                         f'per frame: {stat["total"] / stat["count"]:.1f}')
+        return '\n'.join(lines)
+
+    def format_prometheus(self, summary):
+        name = f'{self.prefix}_stage_latency_seconds'
+        lines = [
+            f'# HELP {name} Latency of each stage of the inference node.',
+            f'# TYPE {name} summary',
+        ]
+        for stage, stat in summary['stages'].items():
+            for quantile, value in stat['quantiles'].items():
+                lines.append(f'{name}{{stage="{stage}",quantile="{quantile}"}}'
+                             f' {value:.6f}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {stat["sum"]:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {stat["count"]}')
+        fps_name = f'{self.prefix}_fps'
+        lines += [
+            f'# HELP {fps_name} Frames published per second.',
+            f'# TYPE {fps_name} gauge',
+            f'{fps_name} {summary["fps"]:.3f}',
+        ]
+        for name, stat in summary['counters'].items():
+            counter_name = f'{self.prefix}_{name}_total'
+            lines += [
+                f'# TYPE {counter_name} counter',
+                f'{counter_name} {stat["total"]}',
+            ]
+        return '\n'.join(lines) + '\n'
+
+    def report(self):
+        """输出一次统计结果."""
+        summary = self.summary()
+        text = self.format_summary(summary)
+        print(text)
+        if self.log_file is not None:
+            with open(self.log_file, 'a') as f:
+                f.write(f'[{time.strftime("%Y-%m-%d %H:%M:%S")}] {text}\n')
+        self._prom_text = self.format_prometheus(summary)
+        self._write_prom_file()
+
+    def _write_prom_file(self):
+        if self.prom_file is None:
+            return
+        # 先写临时文件再替换, 避免采集端读到写了一半的文件
+        tmp_file = self.prom_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write(self._prom_text)
+        os.replace(tmp_file, self.prom_file)
+
+    def start(self):
+        """启动定期输出统计结果的线程, 以及可选的HTTP服务."""
+        self._write_prom_file()
+        if self.http_port is not None:
+            self._server = HTTPServer((self.http_host, self.http_port),
+                                      self._make_handler())
+            threading.Thread(
+                target=self._server.serve_forever, daemon=True).start()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """停止定期输出, 并输出最后一次统计结果."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            # 运行时间短于 interval 时也能留下统计结果
+            self.report()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.report()
+
+    def _make_handler(self):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                body = metrics._prom_text.encode()
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,62 @@
+# Copyright (c) windzu. All rights reserved.
+import numpy as np
+from sensor_msgs.msg import CompressedImage, Image, PointCloud2, PointField
+
+# 与 LoadPointsFromPointCloud2.FIELD_NAMES 保持一致
+POINT_FIELD_NAMES = ('x', 'y', 'z', 'intensity', 'ring')
+
+
+def points_to_pointcloud2(points, field_names=None, frame_id='map'):
+    """将 (N, C) 的点云转换为 sensor_msgs/PointCloud2, 所有field均为float32.
+
+    Args:
+        points (np.ndarray): (N, C) 的点云.
+        field_names (list[str], optional): 每一维对应的field名,
+            默认使用 ``POINT_FIELD_NAMES`` 的前C个.
+        frame_id (str, optional): msg的frame_id. Defaults to "map".
+
+    Returns:
+        PointCloud2: 点云msg
+    """
+    points = np.ascontiguousarray(points, dtype=np.float32)
+    if field_names is None:
+        field_names = POINT_FIELD_NAMES[:points.shape[1]]
+    assert len(field_names) == points.shape[1]
+
+    msg = PointCloud2()
+    msg.header.frame_id = frame_id
+    msg.height = 1
+    msg.width = points.shape[0]
+    msg.fields = [
+        PointField(
+            name=name, offset=4 * i, datatype=PointField.FLOAT32, count=1)
+        for i, name in enumerate(field_names)
+    ]
+    msg.is_bigendian = False
+    msg.point_step = 4 * points.shape[1]
+    msg.row_step = msg.point_step * msg.width
+    msg.is_dense = True
+    msg.data = points.tobytes()
+    return msg
+
+
+def image_to_msg(img, frame_id='map'):
+    """将 (H, W, 3) 的bgr图像转换为 sensor_msgs/Image."""
+    img = np.ascontiguousarray(img, dtype=np.uint8)
+    msg = Image()
+    msg.header.frame_id = frame_id
+    msg.height, msg.width = img.shape[:2]
+    msg.encoding = 'bgr8'
+    msg.is_bigendian = False
+    msg.step = img.strides[0]
+    msg.data = img.tobytes()
+    return msg
+
+
+def compressed_image_to_msg(buf, format='jpeg', frame_id='map'):
+    """将已编码的图像数据(例如jpg文件的内容)转换为 sensor_msgs/CompressedImage."""
+    msg = CompressedImage()
+    msg.header.frame_id = frame_id
+    msg.format = format
+    msg.data = bytes(buf)
+    return msg
@@ -0,0 +1,151 @@
+# Copyright (c) windzu. All rights reserved.
+import threading
+import traceback
+
+_EMPTY = object()
+
+
+class LatestSlot:
+    """单槽队列, 新的数据会覆盖尚未被取走的旧数据(latest-frame-wins).
+
+    Attributes:
+        dropped (int): 被覆盖而未被处理的数据个数
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = _EMPTY
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        """放入数据, 如果槽中已有数据则将其丢弃.
+
+        Returns:
+            bool: 是否丢弃了数据, 即覆盖了旧的数据, 或槽已经关闭而丢弃了
+                ``item``
+        """
+        with self._cond:
+            if self._closed:
+                return True
+            dropped = self._item is not _EMPTY
+            if dropped:
+                self.dropped += 1
+            self._item = item
+            self._cond.notify()
+            return dropped
+
+    def empty(self):
+        """bool: 槽中是否没有等待处理的数据."""
+        return self._item is _EMPTY
+
+    def get(self):
+        """阻塞直到有数据, 槽被关闭后返回 None."""
+        with self._cond:
+            while self._item is _EMPTY and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return None
+            item, self._item = self._item, _EMPTY
+            return item
+
+    def close(self):
+        """关闭槽, 丢弃尚未被取走的数据.
+
+        Returns:
+            bool: 是否丢弃了数据
+        """
+        with self._cond:
+            self._closed = True
+            discarded = self._item is not _EMPTY
+            self._item = _EMPTY
+            self._cond.notify_all()
+            return discarded
+
+
+class StagedPipeline:
+    """多阶段流水线, 每个阶段运行在独立的线程中, 阶段之间通过 LatestSlot 连接.
+
+    这样第N+1帧的解码(CPU)可以与第N帧的模型推理并行, 当某个阶段处理不过来时,
+    等待进入该阶段的旧帧会被直接丢弃, 而不会排队导致延迟越来越大.
+
+    Args:
+        stages (list[tuple[str, callable]]): 每个阶段的名字与处理函数,
+            处理函数的输出作为下一阶段的输入, 返回 None 表示该帧不再向后传递.
+    """
+
+    def __init__(self, stages):
+        assert len(stages) > 0, 'stages should not be empty'
+        self.stage_names = [name for name, _ in stages]
+        self.stage_funcs = [func for _, func in stages]
+        self.slots = [LatestSlot() for _ in stages]
+        self.processed = [0 for _ in stages]
+        self._threads = []
+        # 已送入但尚未流出(或被丢弃)的帧数
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        for i, name in enumerate(self.stage_names):
+            thread = threading.Thread(
+                target=self._run_stage, args=(i, ), name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """停止各个阶段, 等待处理中的帧结束, 尚未处理的帧被丢弃."""
+        for slot in self.slots:
+            if slot.close():
+                self._finish()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def put(self, item):
+        """将一帧数据送入第一个阶段."""
+        with self._lock:
+            self._in_flight += 1
+        if self.slots[0].put(item):
+            self._finish()
+
+    @property
+    def in_flight(self):
+        """int: 已送入但尚未流出(或被丢弃)的帧数."""
+        return self._in_flight
+
+    @property
+    def idle(self):
+        """bool: 所有送入的帧是否都已经处理完毕或被丢弃."""
+        return self._in_flight == 0
+
+    def _finish(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    @property
+    def dropped_frames(self):
+        """dict[str, int]: 每个阶段入口处被丢弃的帧数."""
+        return {
+            name: slot.dropped
+            for name, slot in zip(self.stage_names, self.slots)
+        }
+
+    def _run_stage(self, index):
+        func = self.stage_funcs[index]
+        is_last = index == len(self.slots) - 1
+        while True:
+            item = self.slots[index].get()
+            if item is None:
+                return
+            try:
+                output = func(item)
+            except Exception:
+                # 单帧出错不应该让整个阶段的线程退出
+                print(f'stage {self.stage_names[index]} failed:')
+                traceback.print_exc()
+                self._finish()
+                continue
+            self.processed[index] += 1
+            if is_last or output is None or self.slots[index + 1].put(output):
+                # 该帧流出流水线, 或者下一阶段中等待的旧帧被丢弃
+                self._finish()
@@ -0,0 +1,58 @@
+# Copyright (c) windzu. All rights reserved.
+import threading
+from collections import deque
+
+import numpy as np
+
+
+def quaternion_to_matrix(x, y, z, w):
+    """将四元数转换为3x3旋转矩阵."""
+    return np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+        [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+        [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+    ])
+
+
+class PoseBuffer:
+    """缓存最近的位姿, 用于查找与点云时间戳最接近的lidar位姿.
+
+    位姿来自 nav_msgs/Odometry, 需要是lidar(或与lidar固连的坐标系)在固定坐标系下的位姿.
+
+    Args:
+        size (int): 缓存的位姿个数. Defaults to 200.
+        max_time_diff (float): 查找时允许的最大时间差, 单位秒. Defaults to 0.1.
+    """
+
+    def __init__(self, size=200, max_time_diff=0.1):
+        self.max_time_diff = max_time_diff
+        self._poses = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def push(self, timestamp, pose):
+        with self._lock:
+            self._poses.append((timestamp, pose))
+
+    def callback(self, msg):
+        """nav_msgs/Odometry 的回调函数."""
+        p = msg.pose.pose.position
+        q = msg.pose.pose.orientation
+        pose = np.eye(4)
+        pose[:3, :3] = quaternion_to_matrix(q.x, q.y, q.z, q.w)
+        pose[:3, 3] = (p.x, p.y, p.z)
+        self.push(msg.header.stamp.to_sec(), pose)
+
+    def lookup(self, timestamp):
+        """查找与 ``timestamp`` 最接近的位姿.
+
+        Returns:
+            np.ndarray | None: 4x4的位姿, 时间差超过 ``max_time_diff`` 时返回None
+        """
+        with self._lock:
+            poses = list(self._poses)
+        if len(poses) == 0:
+            return None
+        nearest_time, pose = min(poses, key=lambda x: abs(x[0] - timestamp))
+        if abs(nearest_time - timestamp) > self.max_time_diff:
+            return None
+        return pose
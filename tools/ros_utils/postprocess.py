@@ -5,123 +5,204 @@ import numpy as np
 # ros
 import rospy
 from autoware_msgs.msg import DetectedObject, DetectedObjectArray
-from scipy.spatial.transform import Rotation as R
+from geometry_msgs.msg import Point32
+from sensor_msgs.msg import CompressedImage, Image
+
+from mmdet_ext.core import LowResSegMap, result2arrays
+
+from .postprocess_utils import (det3d_objects, det3d_result_arrays,
+                                label_polygons, seg_label_stats)
 
 
 def det2d_postprocess(result, score_thr, CLASSES, frame_id='map'):
     """对 2d det 结果进行后处理, 返回autoware_msgs.msg.DetectedObjectArray.
 
     Args:
-        result (tuple): 2d bbox检测结果
+        result (list[np.ndarray] | tuple): 2d bbox检测结果
         score_thr (float): 分数阈值
-        CLASSES (list[str]): _description_
+        CLASSES (list[str]): 类别名
         frame_id (str, optional): 消息传感器的frame_id. Defaults to "map".
     """
-
-    def filter_det_result(bboxes=None, labels=None, CLASSES=None, score_thr=0):
-        """parse bboxes and class labels (with scores) on an image.
-
-        Args:
-            bboxes (ndarray): Bounding boxes (with scores),
-            shaped (n, 4) or (n, 5).
-            labels (ndarray): Labels of bboxes.
-            CLASSES (list[str]): Names of each classes.
-            score_thr (float): Minimum score of bboxes to be shown. Default: 0.
-
-        Returns:
-            tuple(ndarray,ndarray,list[str]): bboxes, labels, class_names
-                bboxes (ndarray): Bounding boxes (with scores),
-            shaped (n, 4) or (n, 5).
-                labels (ndarray): Labels of bboxes.
-                class_names (list[str]): Names of each classes.
-        """
-        assert (bboxes is None or bboxes.ndim == 2
-                ), f' bboxes ndim should be 2, but its ndim is {bboxes.ndim}.'
-        assert labels.ndim == 1, f' labels ndim should be 1, \
-        but its ndim is {labels.ndim}.'
-
-        assert (
-            bboxes is None or bboxes.shape[1] == 4 or bboxes.shape[1] == 5
-        ), f' bboxes.shape[1] should be 4 or 5, but its {bboxes.shape[1]}.'
-        assert (bboxes is None or bboxes.shape[0] <= labels.shape[0]
-                ), 'labels.shape[0] should not be less than bboxes.shape[0].'
-
-        if score_thr > 0:
-            assert bboxes is not None and bboxes.shape[1] == 5
-            scores = bboxes[:, -1]
-            inds = scores > score_thr
-            bboxes = bboxes[inds, :]
-            labels = labels[inds]
-            class_names = [CLASSES[label] for label in labels.tolist()]
-
-        return (bboxes, labels, class_names)
-
-    if isinstance(result, tuple):
-        bbox_result, segm_result = result
-        if isinstance(segm_result, tuple):
-            segm_result = segm_result[0]  # ms rcnn
-            # NOTE : 暂时不支持分割结果
-    else:
-        bbox_result, segm_result = result, None
-    bboxes = np.vstack(bbox_result)
-    labels = [
-        np.full(bbox.shape[0], i, dtype=np.int32)
-        for i, bbox in enumerate(bbox_result)
-    ]
-    labels = np.concatenate(labels)
-    # draw segmentation masks
     # NOTE : 暂时不支持分割结果
-
-    # filter results
-    (bboxes, labels, class_names) = filter_det_result(
-        bboxes=bboxes,
-        labels=labels,
-        CLASSES=CLASSES,
-        score_thr=score_thr,
-    )
+    bboxes, scores, labels = result2arrays(result, score_thr)
+    x1, y1, x2, y2 = bboxes.astype(np.int64).T.tolist()
+    names = [CLASSES[label] for label in labels.tolist()]
 
     # convert result to DetectedObjectArray
+    stamp = rospy.Time.now()
     detected_objects = DetectedObjectArray()
-    detected_objects.header.stamp = rospy.Time.now()
+    detected_objects.header.stamp = stamp
     detected_objects.header.frame_id = frame_id
-    for i in range(len(bboxes)):
+    for (left, top, right, bottom, score,
+         name) in zip(x1, y1, x2, y2, scores.tolist(), names):
         detected_object = DetectedObject()
-        detected_object.header.stamp = rospy.Time.now()
+        detected_object.header.stamp = stamp
         detected_object.header.frame_id = frame_id
-        detected_object.label = class_names[i]
-        detected_object.score = bboxes[i][4]
-        detected_object.x = int(bboxes[i][0])
-        detected_object.y = int(bboxes[i][1])
-        detected_object.width = int(bboxes[i][2]) - int(bboxes[i][0])
-        detected_object.height = int(bboxes[i][3]) - int(bboxes[i][1])
+        detected_object.label = name
+        detected_object.score = score
+        detected_object.x = left
+        detected_object.y = top
+        detected_object.width = right - left
+        detected_object.height = bottom - top
 
         detected_objects.objects.append(detected_object)
 
     return detected_objects
 
 
-def seg2d_postprocess(result, score_thr, CLASSES, frame_id='map'):
-    """对 2d seg 结果进行后处理, 返回autoware_msgs.msg.DetectedObjectArray.
+def seg2d_postprocess(result,
+                      score_thr,
+                      CLASSES,
+                      frame_id='map',
+                      downsample=4,
+                      seg_format='label_map',
+                      polygon_classes=()):
+    """对 2d seg 结果进行后处理.
+
+    先以最近邻的方式降采样 label map, 再通过按行的游程编码一次性统计每个类别的面积与
+    bbox. ``polygon_classes`` 中的类别(例如可行驶区域)会额外提取轮廓多边形.
 
     Args:
-        result (Tensor): 分割结果,shape为(H, W),每个像素点的数值对应一个类别的id
-        score_thr (_type_): _description_
-        CLASSES (_type_): _description_
-        frame_id (str, optional): _description_. Defaults to "map".
+        result (list[np.ndarray]): 分割结果, result[0] 的shape为(H, W),
+            每个像素点的数值对应一个类别的id
+        score_thr (float): 不使用, 与其他后处理的接口保持一致
+        CLASSES (list[str]): 类别名
+        frame_id (str, optional): 消息传感器的frame_id. Defaults to "map".
+        downsample (int): label map 降采样的倍数. Defaults to 4.
+        seg_format (str): 分割结果的消息格式, ``label_map`` 为mono8的
+            sensor_msgs/Image, ``png`` 为png压缩的 sensor_msgs/CompressedImage,
+            ``none`` 不输出. Defaults to 'label_map'.
+        polygon_classes (Sequence[str]): 需要提取多边形的类别. Defaults to ().
+
+    Returns:
+        tuple: (DetectedObjectArray, Image | CompressedImage | None).
+            每个出现的类别一个DetectedObject, score为其面积占比, x/y/width/height
+            为原图坐标下的bbox; polygon_classes 中的类别每个轮廓一个DetectedObject,
+            多边形保存在 convex_hull 中.
     """
+    seg = np.asarray(result[0])
+    ori_h, ori_w = seg.shape
+    if downsample > 1:
+        seg = seg[::downsample, ::downsample]
 
-    seg = result[0]
-    seg = np.array(seg)
-    seg = seg.astype(np.uint8)
-    seg = cv2.cvtColor(seg, cv2.COLOR_GRAY2BGR)
-    # show result
-    cv2.imshow('seg', seg)
-    cv2.waitKey(1)
+    # 通过游程统计每个类别的面积与bbox
+    scores, bboxes = seg_label_stats(seg, len(CLASSES), downsample,
+                                     (ori_h, ori_w))
+    x1, y1, x2, y2 = bboxes.T
 
-    # TODO : convert result to DetectedObjectArray
+    stamp = rospy.Time.now()
     detected_objects = DetectedObjectArray()
+    detected_objects.header.stamp = stamp
+    detected_objects.header.frame_id = frame_id
+
+    def new_object(label, score, x, y, w, h):
+        detected_object = DetectedObject()
+        detected_object.header.stamp = stamp
+        detected_object.header.frame_id = frame_id
+        detected_object.label = CLASSES[label]
+        detected_object.score = score
+        detected_object.x = x
+        detected_object.y = y
+        detected_object.width = w
+        detected_object.height = h
+        return detected_object
+
+    polygon_labels = {
+        CLASSES.index(name)
+        for name in polygon_classes if name in CLASSES
+    }
+    for label in np.flatnonzero(scores > 0).tolist():
+        if label not in polygon_labels:
+            detected_objects.objects.append(
+                new_object(label, float(scores[label]), int(x1[label]),
+                           int(y1[label]), int(x2[label] - x1[label]),
+                           int(y2[label] - y1[label])))
+            continue
+        for contour, (x, y, w, h), score in label_polygons(
+                seg, label, downsample):
+            detected_object = new_object(label, score, x, y, w, h)
+            polygon = detected_object.convex_hull
+            polygon.header.stamp = stamp
+            polygon.header.frame_id = frame_id
+            polygon.polygon.points = [
+                Point32(x=px, y=py, z=0.0) for px, py in contour.tolist()
+            ]
+            detected_objects.objects.append(detected_object)
+
+    seg_msg = None
+    if seg_format != 'none':
+        seg_msg = label_map_to_msg(seg, seg_format, frame_id, stamp)
+    return detected_objects, seg_msg
+
+
+def label_map_to_msg(seg, seg_format='label_map', frame_id='map', stamp=None):
+    """将 label map 转换为 sensor_msgs/Image 或 png 压缩的 CompressedImage."""
+    # 类别数不超过256时使用8位
+    if seg.max(initial=0) < 256:
+        seg, encoding = seg.astype(np.uint8), 'mono8'
+    else:
+        seg, encoding = seg.astype(np.uint16), 'mono16'
+    if seg_format == 'label_map':
+        msg = Image()
+        msg.height, msg.width = seg.shape
+        msg.encoding = encoding
+        msg.step = seg.strides[0]
+        msg.data = seg.tobytes()
+    elif seg_format == 'png':
+        msg = CompressedImage()
+        msg.format = f'{encoding}; png compressed'
+        msg.data = cv2.imencode('.png', seg)[1].tobytes()
+    else:
+        raise ValueError(f'unsupported seg format {seg_format}')
+    msg.header.stamp = stamp if stamp is not None else rospy.Time.now()
+    msg.header.frame_id = frame_id
+    return msg
 
-    return detected_objects
+
+def multi2d_postprocess(result,
+                        score_thr,
+                        CLASSES,
+                        frame_id='map',
+                        downsample=4,
+                        seg_format='label_map'):
+    """对 YOLOPV2 等多任务模型的结果进行后处理.
+
+    Args:
+        result (list[np.ndarray] | tuple): 只有检测结果时为每个类别的bbox列表,
+            否则为 (bbox_result, drivable_mask, lane_mask), 未启用的任务为None,
+            mask 为 label map 或 LowResSegMap
+        score_thr (float): 检测结果的分数阈值
+        CLASSES (list[str]): 检测的类别名
+        frame_id (str, optional): 消息传感器的frame_id. Defaults to "map".
+        downsample (int): mask 降采样的倍数. Defaults to 4.
+        seg_format (str): mask 的消息格式, 见 seg2d_postprocess.
+            Defaults to 'label_map'.
+
+    Returns:
+        tuple: (DetectedObjectArray, dict[str, Image | CompressedImage]),
+            第二项为 drivable 与 lane 的mask
+    """
+    if not isinstance(result, tuple):
+        return det2d_postprocess(result, score_thr, CLASSES, frame_id), {}
+    bbox_result, drivable, lane = result
+    detected_objects = det2d_postprocess(bbox_result, score_thr, CLASSES,
+                                         frame_id)
+    seg_msgs = {}
+    if seg_format == 'none':
+        return detected_objects, seg_msgs
+    for name, mask in (('drivable', drivable), ('lane', lane)):
+        if mask is None:
+            continue
+        if isinstance(mask, LowResSegMap):
+            # 只在降采样后的尺寸上插值
+            h, w = mask.ori_shape
+            mask = mask.upsample(
+                shape=(-(-h // downsample), -(-w // downsample)))
+        elif downsample > 1:
+            mask = mask[::downsample, ::downsample]
+        seg_msgs[name] = label_map_to_msg(mask, seg_format, frame_id,
+                                          detected_objects.header.stamp)
+    return detected_objects, seg_msgs
 
 
 def det3d_postprocess(result, score_thr, CLASSES, frame_id='map'):
@@ -140,66 +221,44 @@ def det3d_postprocess(result, score_thr, CLASSES, frame_id='map'):
     # 检测的结果包含两个部分：results, data
     results, data = result
     # results是一个list, 每个元素是一个dict, 对应一个输入的检测结果
-    result = results[0]
-
-    if 'pts_bbox' in result.keys():
-        pred_bboxes = result['pts_bbox']['boxes_3d'].tensor.numpy()
-        pred_scores = result['pts_bbox']['scores_3d'].numpy()
-        pred_labels = result['pts_bbox']['labels_3d'].numpy()
-    else:
-        pred_bboxes = result['boxes_3d'].tensor.numpy()
-        pred_scores = result['scores_3d'].numpy()
-        pred_labels = result['labels_3d'].numpy()
-
-    # filter the result
-    if score_thr > 0:
-        inds = pred_scores > score_thr
-        pred_bboxes = pred_bboxes[inds]
+    objects = det3d_objects(
+        *det3d_result_arrays(results[0]), score_thr=score_thr)
+    names = [CLASSES[label] for label in objects['labels'].tolist()]
 
     # create autoware_msgs.msg.DetectedObjectArray
+    stamp = rospy.Time.now()
     detected_object_array = DetectedObjectArray()
     detected_object_array.header.frame_id = frame_id
-    detected_object_array.header.stamp = rospy.Time.now()
+    detected_object_array.header.stamp = stamp
 
-    for i in range(len(pred_bboxes)):
-        pred_bbox = pred_bboxes[i]
-        # 前个数 分别对应xyz lwh yaw
+    for (position, dimension, quat, score,
+         name) in zip(objects['positions'].tolist(),
+                      objects['dimensions'].tolist(),
+                      objects['quaternions'].tolist(),
+                      objects['scores'].tolist(), names):
         detected_object = DetectedObject()
         detected_object.header.frame_id = frame_id
-        detected_object.header.stamp = rospy.Time.now()
+        detected_object.header.stamp = stamp
 
         # 记录socre、label
-        detected_object.score = pred_scores[i]
-        detected_object.label = CLASSES[pred_labels[i]]
+        detected_object.score = score
+        detected_object.label = name
 
         # valid etc
         detected_object.valid = True
         detected_object.pose_reliable = True
 
         # xyz
-        detected_object.pose.position.x = pred_bbox[0]
-        detected_object.pose.position.y = pred_bbox[1]
-        detected_object.pose.position.z = pred_bbox[2]
+        pose = detected_object.pose
+        pose.position.x, pose.position.y, pose.position.z = position
 
         # lwh
-        detected_object.dimensions.x = pred_bbox[3]
-        detected_object.dimensions.y = pred_bbox[4]
-        detected_object.dimensions.z = pred_bbox[5]
-
-        # yaw
-        yaw = pred_bbox[6]
-
-        # 高度修正
-        detected_object.pose.position.z += detected_object.dimensions.z / 2
-
-        # orientation
-        # get quaternion from yaw axis euler angles
-        r = R.from_euler('z', yaw, degrees=False)
-        q = r.as_quat()
-        detected_object.pose.orientation.x = q[0]
-        detected_object.pose.orientation.y = q[1]
-        detected_object.pose.orientation.z = q[2]
-        detected_object.pose.orientation.w = q[3]
+        dims = detected_object.dimensions
+        dims.x, dims.y, dims.z = dimension
+
+        # orientation, 绕z轴旋转yaw的四元数
+        orientation = pose.orientation
+        orientation.x, orientation.y, orientation.z, orientation.w = quat
 
         detected_object_array.objects.append(detected_object)
     return detected_object_array
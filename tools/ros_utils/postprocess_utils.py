@@ -0,0 +1,160 @@
+# Copyright (c) windzu. All rights reserved.
+"""各 ``*_postprocess`` 中只依赖numpy与cv2的部分, 不需要ros即可使用与测试."""
+import cv2
+import numpy as np
+
+
+def det3d_result_arrays(result):
+    """从mmdet3d的检测结果中取出 (bboxes, scores, labels) 的numpy数组.
+
+    Args:
+        result (dict | tuple): 单帧的检测结果, mmdet3d的 ``boxes_3d`` 等字段
+            (可以位于 ``pts_bbox`` 中), 或 tools/model_server.py 返回的
+            (bboxes, scores, labels)
+
+    Returns:
+        tuple[np.ndarray]: (N, 7+) bboxes, (N, ) scores, (N, ) labels
+    """
+    if isinstance(result, tuple):
+        return result
+    if 'pts_bbox' in result.keys():
+        result = result['pts_bbox']
+    return (result['boxes_3d'].tensor.numpy(), result['scores_3d'].numpy(),
+            result['labels_3d'].numpy())
+
+
+def yaw_to_quaternion(yaw):
+    """绕z轴旋转 ``yaw`` 的四元数.
+
+    Args:
+        yaw (np.ndarray): (N, ) yaw角, 单位弧度
+
+    Returns:
+        np.ndarray: (N, 4) 四元数 (x, y, z, w)
+    """
+    half_yaw = np.asarray(yaw) / 2
+    quats = np.zeros((half_yaw.shape[0], 4), dtype=np.float64)
+    quats[:, 2] = np.sin(half_yaw)
+    quats[:, 3] = np.cos(half_yaw)
+    return quats
+
+
+def det3d_objects(bboxes, scores, labels, score_thr=0):
+    """将3d检测框转换为 DetectedObject 需要的数组.
+
+    Args:
+        bboxes (np.ndarray): (N, 7+) 底面中心的 x, y, z, l, w, h, yaw
+        scores (np.ndarray): (N, ) 分数
+        labels (np.ndarray): (N, ) 类别id
+        score_thr (float, optional): 分数阈值, 大于0时只保留分数大于该值的框.
+            Defaults to 0.
+
+    Returns:
+        dict[str, np.ndarray]: 过滤后对齐的 positions (N, 3) 几何中心,
+            dimensions (N, 3), quaternions (N, 4), scores (N, ), labels (N, )
+    """
+    # bboxes、scores、labels 需要保持对齐
+    if score_thr > 0:
+        inds = scores > score_thr
+        bboxes, scores, labels = bboxes[inds], scores[inds], labels[inds]
+    # 高度修正, 将底面中心转换为几何中心
+    positions = bboxes[:, :3].copy()
+    positions[:, 2] += bboxes[:, 5] / 2
+    return dict(
+        positions=positions,
+        dimensions=bboxes[:, 3:6],
+        quaternions=yaw_to_quaternion(bboxes[:, 6]),
+        scores=scores,
+        labels=labels)
+
+
+def label_map_runs(seg):
+    """按行对 label map 做游程编码.
+
+    Args:
+        seg (np.ndarray): (H, W) 的 label map
+
+    Returns:
+        tuple[np.ndarray]: 每个游程的 labels, rows, starts, lengths
+    """
+    height, width = seg.shape
+    # 每行的第一个像素以及与左侧像素不同的位置是一个游程的起点
+    is_start = np.ones(seg.shape, dtype=bool)
+    is_start[:, 1:] = seg[:, 1:] != seg[:, :-1]
+    rows, starts = np.nonzero(is_start)
+    flat_starts = rows * width + starts
+    lengths = np.diff(np.append(flat_starts, height * width))
+    return seg[rows, starts], rows, starts, lengths
+
+
+def seg_label_stats(seg, num_classes, downsample=1, ori_shape=None):
+    """通过游程统计降采样后 label map 中每个类别的面积占比与bbox.
+
+    Args:
+        seg (np.ndarray): (h, w) 降采样后的 label map, 不小于 num_classes
+            的像素(例如255)被忽略
+        num_classes (int): 类别数
+        downsample (int): label map 降采样的倍数. Defaults to 1.
+        ori_shape (tuple[int], optional): 原图的 (H, W), bbox 会被截断到原图
+            范围内. Defaults to ``seg`` 的尺寸乘以 ``downsample``.
+
+    Returns:
+        tuple[np.ndarray]: (num_classes, ) 面积占比, 以及原图坐标下
+            (num_classes, 4) 的 x1, y1, x2, y2, 未出现的类别面积为0
+    """
+    height, width = seg.shape
+    if ori_shape is None:
+        ori_shape = (height * downsample, width * downsample)
+    labels, rows, starts, lengths = label_map_runs(seg)
+    # 忽略不属于任何类别的像素, 例如255
+    valid = labels < num_classes
+    labels, rows, starts, lengths = (labels[valid], rows[valid],
+                                     starts[valid], lengths[valid])
+    areas = np.bincount(labels, weights=lengths, minlength=num_classes)
+    x1 = np.full(num_classes, width)
+    y1 = np.full(num_classes, height)
+    x2 = np.zeros(num_classes, dtype=np.int64)
+    y2 = np.zeros(num_classes, dtype=np.int64)
+    np.minimum.at(x1, labels, starts)
+    np.minimum.at(y1, labels, rows)
+    np.maximum.at(x2, labels, starts + lengths)
+    np.maximum.at(y2, labels, rows + 1)
+    # 转换回原图坐标
+    ori_h, ori_w = ori_shape[:2]
+    bboxes = np.stack([
+        np.minimum(x1 * downsample, ori_w),
+        np.minimum(y1 * downsample, ori_h),
+        np.minimum(x2 * downsample, ori_w),
+        np.minimum(y2 * downsample, ori_h)
+    ],
+                      axis=1)
+    return areas / (height * width), bboxes
+
+
+def label_polygons(seg, label, downsample=1):
+    """提取降采样后 label map 中某个类别每个外轮廓的多边形.
+
+    Args:
+        seg (np.ndarray): (h, w) 降采样后的 label map
+        label (int): 类别id
+        downsample (int): label map 降采样的倍数. Defaults to 1.
+
+    Returns:
+        list[tuple]: 每个轮廓的 (多边形 (K, 2), (x, y, w, h) bbox, 面积占比),
+            多边形与bbox为原图坐标, 少于3个点的轮廓被忽略
+    """
+    height, width = seg.shape
+    mask = (seg == label).astype(np.uint8)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL,
+                                   cv2.CHAIN_APPROX_SIMPLE)
+    polygons = []
+    for contour in contours:
+        contour = cv2.approxPolyDP(contour, 1.0, True).reshape(-1, 2)
+        if len(contour) < 3:
+            continue
+        x, y, w, h = cv2.boundingRect(contour)
+        polygons.append(
+            (contour * downsample,
+             (x * downsample, y * downsample, w * downsample,
+              h * downsample), cv2.contourArea(contour) / (height * width)))
+    return polygons
@@ -0,0 +1,162 @@
+# Copyright (c) windzu. All rights reserved.
+import copy
+import math
+import threading
+import time
+from collections import deque
+
+
+class FrameScheduler:
+    """按照延迟预算确定性地跳帧, 必要时切换到更轻量的fallback配置.
+
+    每帧的处理耗时取最近 ``window`` 帧的平均值, 超过 ``budget`` 时:
+
+    1. 如果有fallback配置且尚未启用, 先切换到fallback配置;
+    2. 否则每 ``skip`` 帧只处理一帧, ``skip = ceil(平均耗时 / budget)``,
+       保证处理速度能跟上输入.
+
+    平均耗时低于 ``budget * recover_ratio`` 时退出fallback配置, 低于
+    ``(skip - 1) * budget * recover_ratio`` 时减小 ``skip``.
+    切换配置或改变 ``skip`` 后会清空统计窗口, 重新积累 ``min_samples`` 帧后再做判断.
+
+    Args:
+        budget (float): 每帧的延迟预算, 单位秒, 一般为传感器的周期
+        window (int): 统计平均耗时的帧数. Defaults to 20.
+        min_samples (int): 做出调整前至少需要的帧数. Defaults to 5.
+        recover_ratio (float): 恢复时的滞回系数. Defaults to 0.7.
+        has_fallback (bool): 是否有可以切换的fallback配置. Defaults to False.
+
+    Attributes:
+        skip (int): 每 ``skip`` 帧处理一帧
+        fallback (bool): 当前是否应该使用fallback配置
+        skipped (int): 被跳过的帧数
+    """
+
+    def __init__(self,
+                 budget,
+                 window=20,
+                 min_samples=5,
+                 recover_ratio=0.7,
+                 has_fallback=False):
+        self.budget = budget
+        self.min_samples = min_samples
+        self.recover_ratio = recover_ratio
+        self.has_fallback = has_fallback
+
+        self.skip = 1
+        self.fallback = False
+        self.skipped = 0
+        self._latencies = deque(maxlen=window)
+        self._index = 0
+        self._last_finish = None
+        self._interval = None
+        self._lock = threading.Lock()
+
+    def should_process(self):
+        """每一帧到达时调用, 返回该帧是否需要处理."""
+        with self._lock:
+            process = self._index % self.skip == 0
+            self._index += 1
+            if not process:
+                self.skipped += 1
+            return process
+
+    def record(self, latency, finish_time=None):
+        """记录一帧的处理耗时, 并根据平均耗时调整 ``skip`` 与 ``fallback``.
+
+        Args:
+            latency (float): 该帧的处理耗时, 单位秒
+            finish_time (float, optional): 处理完成的时间, 默认为当前的
+                ``time.perf_counter()``
+        """
+        finish_time = time.perf_counter() \
+            if finish_time is None else finish_time
+        with self._lock:
+            if self._last_finish is not None:
+                interval = finish_time - self._last_finish
+                # 实际处理的帧间隔的指数滑动平均, 包含了处理期间被
+                # 后到的帧覆盖而没有处理的帧
+                self._interval = interval if self._interval is None \
+                    else 0.9 * self._interval + 0.1 * interval
+            self._last_finish = finish_time
+
+            self._latencies.append(latency)
+            if len(self._latencies) < self.min_samples:
+                return
+            average = sum(self._latencies) / len(self._latencies)
+            low = self.budget * self.recover_ratio
+            if average > self.budget and \
+                    self.has_fallback and not self.fallback:
+                self.fallback = True
+                self._reset()
+            elif math.ceil(average / self.budget) > self.skip:
+                self.skip = math.ceil(average / self.budget)
+                self._reset()
+            elif self.skip > 1 and average < (self.skip - 1) * low:
+                # 平均耗时超过budget时, 只要 skip - 1 帧的时间足够处理一帧,
+                # 同样减小skip
+                self.skip -= 1
+                self._reset()
+            elif self.skip == 1 and self.fallback and average < low:
+                self.fallback = False
+                self._reset()
+
+    def _reset(self):
+        self._latencies.clear()
+        # 改变skip后的下一帧总是会被处理
+        self._index = 0
+
+    @property
+    def effective_rate(self):
+        """float: 实际处理的帧率(Hz), 由相邻两次 ``record`` 的间隔计算,
+        尚未处理两帧时为0."""
+        if not self._interval:
+            return 0.0
+        return 1.0 / self._interval
+
+
+def scale_test_pipeline(pipeline, factor):
+    """将test pipeline中 Resize 的 img_scale 乘以 ``factor``, 返回新的pipeline."""
+    pipeline = copy.deepcopy(pipeline)
+    for transform in pipeline:
+        if transform.type not in ('Resize', 'MultiScaleFlipAug'):
+            continue
+        img_scale = transform.get('img_scale', None)
+        if img_scale is None:
+            continue
+        if isinstance(img_scale, list):
+            transform.img_scale = [
+                tuple(int(s * factor) for s in scale) for scale in img_scale
+            ]
+        else:
+            transform.img_scale = tuple(int(s * factor) for s in img_scale)
+    return pipeline
+
+
+def set_nms_pre(model, nms_pre):
+    """修改模型各个head的test_cfg中的 nms_pre.
+
+    Returns:
+        list[tuple[dict, int]]: 被修改的cfg与原来的值, 用于 ``restore_nms_pre``
+    """
+    changed = []
+    visited = set()
+
+    def _set(cfg):
+        if not isinstance(cfg, dict) or id(cfg) in visited:
+            return
+        visited.add(id(cfg))
+        if 'nms_pre' in cfg:
+            changed.append((cfg, cfg['nms_pre']))
+            cfg['nms_pre'] = nms_pre
+        for value in cfg.values():
+            _set(value)
+
+    for module in model.modules():
+        _set(getattr(module, 'test_cfg', None))
+    return changed
+
+
+def restore_nms_pre(changed):
+    for cfg, nms_pre in reversed(changed):
+        cfg['nms_pre'] = nms_pre
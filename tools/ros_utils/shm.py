@@ -0,0 +1,318 @@
+# Copyright (c) windzu. All rights reserved.
+"""基于共享内存的本机推理服务.
+
+一个进程(``ModelServer``)加载模型, 多个ros节点进程(``ModelClient``)通过共享内存
+将帧交给它推理. 每个client创建一对请求/响应环形缓冲区, 数组只在共享内存中拷贝一次,
+unix socket 上只传递槽的编号以及数组的 dtype/shape 等少量元信息.
+传输层只依赖numpy与标准库, 不需要ros.
+
+unix socket 只允许同一用户连接, 并且可以设置 ``authkey``, 连接时先用它完成
+认证, 未认证的连接发送的数据不会被unpickle.
+"""
+import os
+import queue
+import threading
+import traceback
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+# 槽内每个数组的起始位置按64字节对齐
+ALIGNMENT = 64
+# 未指定authkey时从该环境变量读取
+AUTHKEY_ENV = 'ADMLOPS_MODEL_SERVER_AUTHKEY'
+
+
+def get_authkey(authkey=None):
+    """返回连接认证使用的authkey, 未指定时读取环境变量 ``AUTHKEY_ENV``.
+
+    Args:
+        authkey (str | bytes, optional): authkey. Defaults to None.
+
+    Returns:
+        bytes | None: authkey, 都没有设置时为None
+    """
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_ENV) or None
+    if isinstance(authkey, str):
+        authkey = authkey.encode()
+    return authkey
+
+
+def _align(nbytes):
+    return (nbytes + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class SharedRing:
+    """由 ``num_slots`` 个大小为 ``slot_bytes`` 的槽组成的共享内存环形缓冲区.
+
+    Args:
+        num_slots (int): 槽的个数
+        slot_bytes (int): 每个槽的字节数
+        name (str, optional): 已存在的共享内存的名字, 为None时新建.
+            只有新建共享内存的一方负责释放. Defaults to None.
+    """
+
+    def __init__(self, num_slots, slot_bytes, name=None):
+        self.num_slots = num_slots
+        self.slot_bytes = slot_bytes
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(
+                create=True, size=num_slots * slot_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # 由创建的一方释放, 避免本进程退出时resource_tracker将其删除
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, slot, arrays):
+        """将多个数组写入一个槽.
+
+        Returns:
+            list[tuple]: 每个数组的 (dtype, shape, offset), 用于 ``read``
+        """
+        base = slot * self.slot_bytes
+        offset = 0
+        meta = []
+        for array in arrays:
+            array = np.asarray(array)
+            if offset + array.nbytes > self.slot_bytes:
+                raise ValueError(
+                    f'arrays of {offset + array.nbytes} bytes exceed the '
+                    f'slot size {self.slot_bytes}, increase slot_bytes')
+            dst = np.ndarray(
+                array.shape,
+                dtype=array.dtype,
+                buffer=self.shm.buf,
+                offset=base + offset)
+            dst[...] = array
+            meta.append((array.dtype.str, array.shape, offset))
+            offset += _align(array.nbytes)
+        return meta
+
+    def read(self, slot, meta, copy=False):
+        """读取 ``write`` 写入的数组.
+
+        Args:
+            slot (int): 槽的编号
+            meta (list[tuple]): ``write`` 返回的元信息
+            copy (bool): 是否拷贝出共享内存. 不拷贝时返回的数组是共享内存上的视图,
+                在槽被复用前必须用完. Defaults to False.
+
+        Returns:
+            list[np.ndarray]: 数组
+        """
+        base = slot * self.slot_bytes
+        arrays = []
+        for dtype, shape, offset in meta:
+            array = np.ndarray(
+                shape, dtype=dtype, buffer=self.shm.buf, offset=base + offset)
+            arrays.append(array.copy() if copy else array)
+        return arrays
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class ModelServer:
+    """在一个进程中加载模型, 通过共享内存为多个 ``ModelClient`` 提供推理.
+
+    每个client由一个线程服务, 数据的拷贝可以并行, 模型的调用通过锁串行执行.
+
+    Args:
+        address (str): unix socket 的路径
+        handler (callable): 推理函数, 输入为 (arrays, extra, state), 输出为
+            数组列表. arrays 是共享内存上的视图, 只在调用期间有效; state 是
+            每个client独有的dict, 用于保存多帧输入等状态, client断开后丢弃
+        info (dict, optional): client连接时发送给client的信息, 例如类别名.
+            Defaults to None.
+        authkey (str | bytes, optional): 连接认证的密钥, 见
+            :func:`get_authkey`. Defaults to None.
+    """
+
+    def __init__(self, address, handler, info=None, authkey=None):
+        self.address = address
+        self.handler = handler
+        self.info = info if info is not None else {}
+        self.authkey = get_authkey(authkey)
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def serve_forever(self):
+        # socket文件的权限为0600, 只有同一用户的进程可以连接
+        umask = os.umask(0o177)
+        try:
+            self._listener = Listener(
+                self.address, family='AF_UNIX', authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        while True:
+            try:
+                conn = self._listener.accept()
+            except AuthenticationError:
+                # authkey 不一致的client
+                traceback.print_exc()
+                continue
+            except OSError:
+                # stop() 关闭了listener
+                return
+            threading.Thread(
+                target=self._serve_client, args=(conn, ), daemon=True).start()
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    def _serve_client(self, conn):
+        req_name, resp_name, num_slots, slot_bytes = conn.recv()
+        requests = SharedRing(num_slots, slot_bytes, name=req_name)
+        responses = SharedRing(num_slots, slot_bytes, name=resp_name)
+        conn.send(self.info)
+        # 该client独有的状态, 随连接一起释放
+        state = {}
+        try:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    break
+                if request is None:
+                    # client主动断开
+                    conn.send(None)
+                    break
+                slot, meta, extra = request
+                try:
+                    arrays = requests.read(slot, meta)
+                    with self._lock:
+                        outputs = self.handler(arrays, extra, state)
+                    # 释放共享内存上的视图
+                    del arrays
+                    conn.send((slot, responses.write(slot, outputs), None))
+                except Exception as e:
+                    traceback.print_exc()
+                    conn.send((slot, None, repr(e)))
+        finally:
+            conn.close()
+            requests.close()
+            responses.close()
+
+
+class ModelClient:
+    """连接 ``ModelServer``, 通过共享内存环形缓冲区提交推理请求.
+
+    ``infer`` 是线程安全的, 最多有 ``num_slots`` 个请求同时在服务端排队,
+    流水线模式或多个topic时预处理可以与其他帧的推理重叠.
+
+    Args:
+        address (str): ``ModelServer`` 的 unix socket 路径
+        num_slots (int): 环形缓冲区的槽数. Defaults to 2.
+        slot_bytes (int): 每个槽的字节数, 需要能放下一帧的输入与输出.
+            Defaults to 32MB.
+        authkey (str | bytes, optional): 与服务端相同的认证密钥, 见
+            :func:`get_authkey`. Defaults to None.
+
+    Attributes:
+        info (dict): 服务端发送的信息, 例如类别名
+    """
+
+    def __init__(self,
+                 address,
+                 num_slots=2,
+                 slot_bytes=32 * 2**20,
+                 authkey=None):
+        self.requests = SharedRing(num_slots, slot_bytes)
+        self.responses = SharedRing(num_slots, slot_bytes)
+        try:
+            self.conn = Client(
+                address, family='AF_UNIX', authkey=get_authkey(authkey))
+        except BaseException:
+            self.requests.close()
+            self.responses.close()
+            raise
+        self.conn.send((self.requests.name, self.responses.name, num_slots,
+                        slot_bytes))
+        self.info = self.conn.recv()
+
+        self._free_slots = queue.Queue()
+        for slot in range(num_slots):
+            self._free_slots.put(slot)
+        self._send_lock = threading.Lock()
+        # slot -> [Event, 服务端的回复], 与 _closed 一起由 _waiters_lock 保护
+        self._waiters = {}
+        self._waiters_lock = threading.Lock()
+        self._closed = False
+        self._receiver = threading.Thread(target=self._receive, daemon=True)
+        self._receiver.start()
+
+    def infer(self, arrays, extra=None):
+        """提交一帧并等待结果.
+
+        Args:
+            arrays (list[np.ndarray]): 输入数组
+            extra (optional): 随请求发送的少量可pickle的信息
+
+        Returns:
+            list[np.ndarray]: 服务端输出的数组, 已拷贝出共享内存
+        """
+        slot = self._free_slots.get()
+        try:
+            with self._waiters_lock:
+                # 连接断开后不再有人唤醒新的请求
+                if self._closed:
+                    raise RuntimeError('connection closed')
+                waiter = self._waiters[slot] = [threading.Event(), None]
+            try:
+                meta = self.requests.write(slot, arrays)
+                with self._send_lock:
+                    self.conn.send((slot, meta, extra))
+            except BaseException as e:
+                with self._waiters_lock:
+                    self._waiters.pop(slot, None)
+                if isinstance(e, (EOFError, OSError)):
+                    raise RuntimeError('connection closed') from e
+                raise
+            waiter[0].wait()
+            out_meta, error = waiter[1]
+            if error is not None:
+                raise RuntimeError(f'model server failed: {error}')
+            return self.responses.read(slot, out_meta, copy=True)
+        finally:
+            self._free_slots.put(slot)
+
+    def _receive(self):
+        while True:
+            try:
+                reply = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            if reply is None:
+                break
+            slot, out_meta, error = reply
+            with self._waiters_lock:
+                waiter = self._waiters.pop(slot)
+            waiter[1] = (out_meta, error)
+            waiter[0].set()
+        # 连接断开, 唤醒所有等待中的请求
+        with self._waiters_lock:
+            self._closed = True
+            waiters, self._waiters = list(self._waiters.values()), {}
+        for waiter in waiters:
+            waiter[1] = (None, 'connection closed')
+            waiter[0].set()
+
+    def close(self):
+        with self._send_lock:
+            self.conn.send(None)
+        self._receiver.join()
+        self.conn.close()
+        self.requests.close()
+        self.responses.close()
@@ -1,13 +1,22 @@
 # Copyright (c) windzu. All rights reserved.
 import time
 from argparse import ArgumentParser
+from functools import partial
 
 import cv2
 import numpy as np
 # ros
 import rospy
 from autoware_msgs.msg import DetectedObjectArray
+from nav_msgs.msg import Odometry
+from ros_utils.batching import MicroBatcher
+from ros_utils.metrics import LatencyMetrics, NullMetrics
+from ros_utils.pipeline import StagedPipeline
+from ros_utils.pose import PoseBuffer
+from ros_utils.scheduler import (FrameScheduler, restore_nms_pre,
+                                 scale_test_pipeline, set_nms_pre)
 from sensor_msgs.msg import CompressedImage, Image, PointCloud2
+from std_msgs.msg import Float32
 
 from mmdet3d_ext.datasets import *  # noqa: F401, F403
 from mmdet_ext.datasets import *  # noqa: F401, F403
@@ -27,103 +36,566 @@ class ROSInterface:
         sub_msg_type,
         republish=False,
         compressed=False,
+        staged=False,
+        metrics=None,
+        odom_topic=None,
+        crop_range=False,
+        max_points=None,
+        backend='pytorch',
+        deploy_cfg=None,
+        model_dir=None,
+        reduced_decode=False,
+        batch_window=0.02,
+        server=None,
+        server_authkey=None,
+        latency_budget=None,
+        fallback_scale=None,
+        fallback_nms_pre=None,
+        seg_downsample=4,
+        seg_format='label_map',
+        seg_polygon_classes=(),
+        tasks=None,
+        seg_output=None,
+        warmup=0,
+        warmup_shape=None,
     ):
+        init_time = time.perf_counter()
         # about model
         self.config = config
         self.checkpoint = checkpoint
         self.score_thr = score_thr
         self.device = device
         self.task_type = task_type
+        # pytorch or tools/deploy.py 转换后的模型的推理后端
+        self.backend = backend
+        self.deploy_cfg = deploy_cfg
+        self.model_dir = model_dir
         # about ros
-        self.sub_topic = sub_topic
+        # 可以订阅多个topic, 多个topic时将时间窗口内到达的帧组成batch推理
+        if isinstance(sub_topic, str):
+            sub_topic = [sub_topic]
+        self.sub_topics = list(sub_topic)
+        self.sub_topic = self.sub_topics[0]
+        self.batch_window = batch_window
+        self.batcher = None
         self.sub_msg_type = sub_msg_type
         self.republish = republish
         self.compressed = compressed
+        # 是否启用多线程流水线(decode -> preprocess -> infer -> publish)
+        self.staged = staged
+        self.pipeline = None
+        # 各阶段耗时统计, 默认关闭
+        self.metrics = metrics if metrics is not None else NullMetrics()
+        # 多帧点云的运动补偿所需的位姿, 来自odom_topic
+        self.odom_topic = odom_topic
+        self.pose_buffer = PoseBuffer() if odom_topic is not None else None
 
         # 根据task_type,初始化不同的模型，推理函数，后处理函数
         # -self.model
-        # -self.inference
+        # -self.classes
+        # -self.preprocess : 模型推理前的预处理, 默认不做处理
+        # -self.inference : 只接收输入数据的推理函数
         # -self.postprocess
-        if self.task_type == 'det2d':
-            from mmdet.apis import inference_detector, init_detector
+        self.preprocess = None
+        self.inferencer = None
+        # 连接 tools/model_server.py 时, 模型只在服务进程中加载
+        self.client = None
+        if server is not None:
+            self._init_model_client(server, server_authkey)
+        elif self.backend == 'sdk':
+            from ros_utils.backend import SDKDetector
             from ros_utils.postprocess import det2d_postprocess
 
+            assert self.task_type == 'det2d', \
+                'sdk backend only supports det2d'
+            self.model = SDKDetector(
+                self.config, self.model_dir, device=self.device)
+            self.inference = self.model.inference_detector
+            self.postprocess = det2d_postprocess
+        elif self.backend != 'pytorch':
+            self._init_deployed_model(crop_range, max_points, tasks)
+        elif self.task_type in ('det2d', 'multi2d'):
+            from mmdet.apis import inference_detector, init_detector
+            from ros_utils.postprocess import (det2d_postprocess,
+                                               multi2d_postprocess)
+
             self.model = init_detector(
                 self.config, self.checkpoint, device=self.device)
-            self.inference = inference_detector
-            self.postprocess = det2d_postprocess
+            self.inference = partial(inference_detector, self.model)
+            if self.task_type == 'det2d':
+                self.postprocess = det2d_postprocess
+            else:
+                # YOLOPV2 等多任务模型, 一次前向同时输出检测与分割结果
+                if tasks is not None:
+                    self.model.test_tasks = set(tasks)
+                # 原始stride的mask只在发布的尺寸上插值
+                if seg_output is not None:
+                    self.model.seg_output = seg_output
+                self.postprocess = multi2d_postprocess
         elif self.task_type == 'seg2d':
             from mmseg.apis import inference_segmentor, init_segmentor
             from ros_utils.postprocess import seg2d_postprocess
 
             self.model = init_segmentor(
                 self.config, self.checkpoint, device=self.device)
-            self.inference = inference_segmentor
+            self.inference = partial(inference_segmentor, self.model)
             self.postprocess = seg2d_postprocess
         elif self.task_type == 'det3d':
             from mmdet3d.apis import init_model
             from ros_utils.postprocess import det3d_postprocess
 
-            from mmdet3d_ext.apis import \
-                inference_detector  # 重写了inference_detector
+            from mmdet3d_ext.apis import Detector3DInferencer
 
             self.model = init_model(
                 self.config, self.checkpoint, device=self.device)
-            # 替换LoadPointsFromFile
-            self.model.cfg.data.test.pipeline[
-                0].type = 'LoadPointsFromPointCloud2'
-            self.inference = inference_detector
+            self._replace_det3d_pipeline(self.model.cfg, crop_range,
+                                         max_points)
+            # pipeline、box type等只构建一次
+            self.inferencer = Detector3DInferencer(self.model)
+            # 拆分为预处理与推理两步, 以便流水线模式下并行执行
+            self.preprocess = self._det3d_preprocess
+            self.inference = self._det3d_inference
             self.postprocess = det3d_postprocess
+        if self.client is None:
+            self.classes = self.model.CLASSES
+        # seg2d 输出降采样的 label map, 以及指定类别的多边形
+        # 每个分割结果发布到 <sub_topic>/<name>
+        self.seg_format = seg_format
+        self.seg_names = []
+        self.seg_publishers = {}
+        if self.task_type == 'seg2d':
+            self.postprocess = partial(
+                self.postprocess,
+                downsample=seg_downsample,
+                seg_format=seg_format,
+                polygon_classes=seg_polygon_classes)
+            self.seg_names = ['segmentation']
+        elif self.task_type == 'multi2d':
+            self.postprocess = partial(
+                self.postprocess,
+                downsample=seg_downsample,
+                seg_format=seg_format)
+            self.seg_names = [
+                name for name in ('drivable', 'lane')
+                if name in self.model.test_tasks
+            ]
+        if seg_format == 'none':
+            self.seg_names = []
 
-    def start(self):
-        rospy.init_node('detection', anonymous=True)
+        if self.batched:
+            assert self.task_type == 'det2d', \
+                'multiple sub topics only supports det2d'
+            assert not self.staged, \
+                'multiple sub topics does not support staged mode'
 
-        self.publisher = rospy.Publisher(
-            self.sub_topic + '/detected_objects',
-            DetectedObjectArray,
-            queue_size=1)
+        # 按照模型输入尺寸以缩小的分辨率解码jpeg, 每个topic一个解码器
+        self.image_decoders = {}
+        if reduced_decode:
+            self._init_image_decoders()
+
+        # 按照延迟预算确定性地跳帧, 默认关闭
+        self.scheduler = None
+        self.rate_publisher = None
+        if latency_budget is not None:
+            self._init_scheduler(latency_budget, fallback_scale,
+                                 fallback_nms_pre)
+
+        # 用合成的帧预热, 避免首帧的cuda初始化、pipeline首次调用等开销
+        self.num_warmup = warmup
+        self.warmup_shape = warmup_shape
+        # 从开始加载模型到可以处理第一帧的时间
+        self.ready_time = time.perf_counter() - init_time
+
+    @property
+    def batched(self):
+        """bool: 是否订阅了多个topic并组成batch推理."""
+        return len(self.sub_topics) > 1
+
+    def _init_image_decoders(self):
+        import mmcv
+        from ros_utils.image import ReducedImageDecoder, get_test_img_scale
+
+        assert self.sub_msg_type == 'img' and self.compressed, \
+            'reduced_decode only supports compressed image'
+        assert self.task_type == 'det2d', 'reduced_decode only supports det2d'
+        cfg = getattr(self.model, 'cfg', None)
+        if cfg is None:
+            cfg = mmcv.Config.fromfile(self.config)
+        test_img_scale = get_test_img_scale(cfg)
+        if test_img_scale is None:
+            print('no fixed Resize in test pipeline, reduced_decode disabled')
+            return
+        self.image_decoders = {
+            topic: ReducedImageDecoder(*test_img_scale)
+            for topic in self.sub_topics
+        }
+
+    def _synthetic_msg(self):
+        """生成一帧与实际输入形状一致的随机数据."""
+        from ros_utils.msgs import (compressed_image_to_msg, image_to_msg,
+                                    points_to_pointcloud2)
 
-        # 根据消息类型的不同,确定Subscriber的消息类型
         if self.sub_msg_type == 'img':
+            height, width = self.warmup_shape or (720, 1280)
+            img = np.random.randint(
+                0, 256, size=(height, width, 3), dtype=np.uint8)
             if self.compressed:
-                rospy.Subscriber(
-                    self.sub_topic,
-                    CompressedImage,
-                    self._callback,
-                    queue_size=1,
-                    buff_size=2**24)
-                self.repub_publisher = rospy.Publisher(
-                    self.sub_topic + '/republish',
-                    CompressedImage,
-                    queue_size=1)
+                msg = compressed_image_to_msg(cv2.imencode('.jpg', img)[1])
+            else:
+                msg = image_to_msg(img)
+        elif self.sub_msg_type == 'pc':
+            num_points = self.warmup_shape[0] if self.warmup_shape else 120000
+            cfg = getattr(self.model, 'cfg', None)
+            point_cloud_range = cfg.get('point_cloud_range', None) \
+                if cfg is not None else None
+            if point_cloud_range is None:
+                point_cloud_range = [-50, -50, -3, 50, 50, 1]
+            points = np.zeros((num_points, 5), dtype=np.float32)
+            points[:, :3] = np.random.uniform(
+                point_cloud_range[:3], point_cloud_range[3:],
+                size=(num_points, 3))
+            points[:, 3] = np.random.rand(num_points)
+            msg = points_to_pointcloud2(points)
+        msg.header.stamp = rospy.Time.now()
+        return msg
+
+    def warmup(self):
+        """用合成的帧完整地运行若干次 解码 -> 预处理 -> 推理 -> 后处理, 不发布结果.
+
+        需要在订阅之前调用, 使第一个真实的帧就能满足延迟预算.
+        """
+        if self.num_warmup <= 0:
+            return
+        if self.client is not None and self.task_type == 'det3d':
+            # 合成的点云会进入推理服务的多帧缓存, 推理服务自己预热
+            print('warmup of det3d is done by the model server, skipped')
+            return
+        start_time = time.perf_counter()
+        # 预热的耗时不计入统计
+        metrics, self.metrics = self.metrics, NullMetrics()
+        latencies = []
+        try:
+            for _ in range(self.num_warmup):
+                frame_start = time.perf_counter()
+                msg = self._synthetic_msg()
+                item = self._decode_stage(msg)
+                item = self._preprocess_stage(item)
+                if self.batched:
+                    # 与多个topic组成的batch的形状保持一致
+                    result = self.inference([item[1]] *
+                                            len(self.sub_topics))[0]
+                else:
+                    _, result = self._infer_stage(item)
+                self.postprocess(result, self.score_thr, self.classes,
+                                 msg.header.frame_id)
+                latencies.append(time.perf_counter() - frame_start)
+        finally:
+            self.metrics = metrics
+        if self.inferencer is not None:
+            # 清空多帧点云中合成的sweeps
+            self.inferencer.reset()
+        self.ready_time += time.perf_counter() - start_time
+        print('warmup latency (ms): ' +
+              ', '.join(f'{latency * 1000:.1f}' for latency in latencies))
+        print(f'ready in {self.ready_time:.2f} s')
+
+    def _init_scheduler(self, latency_budget, fallback_scale=None,
+                        fallback_nms_pre=None):
+        assert not self.staged and not self.batched, \
+            'latency_budget does not support staged mode or multiple topics'
+        self.fallback_scale = fallback_scale
+        self.fallback_nms_pre = fallback_nms_pre
+        has_fallback = fallback_scale is not None or \
+            fallback_nms_pre is not None
+        if has_fallback:
+            assert self.backend == 'pytorch' and self.client is None, \
+                'fallback config only supports the pytorch backend'
+        if fallback_scale is not None:
+            # det3d 的 pipeline 只构建一次, 输入也不是图像
+            assert self.task_type in ('det2d', 'seg2d', 'multi2d'), \
+                'fallback_scale only supports det2d, seg2d and multi2d'
+            test_pipeline = self.model.cfg.data.test.pipeline
+            self._test_pipelines = (test_pipeline,
+                                    scale_test_pipeline(
+                                        test_pipeline, fallback_scale))
+        self._nms_pre_changed = []
+        self._fallback_active = False
+        self.scheduler = FrameScheduler(
+            latency_budget, has_fallback=has_fallback)
+
+    def _apply_fallback(self, enabled):
+        """切换到fallback配置或恢复原来的配置."""
+        if self.fallback_scale is not None:
+            # inference_detector/inference_segmentor 每次调用都会从cfg构建pipeline
+            self.model.cfg.data.test.pipeline = \
+                self._test_pipelines[int(enabled)]
+        if self.fallback_nms_pre is not None:
+            if enabled:
+                self._nms_pre_changed = set_nms_pre(self.model,
+                                                    self.fallback_nms_pre)
             else:
-                rospy.Subscriber(
-                    self.sub_topic,
-                    Image,
-                    self._callback,
-                    queue_size=1,
-                    buff_size=2**24)
-                self.repub_publisher = rospy.Publisher(
-                    self.sub_topic + '/republish', Image, queue_size=1)
+                restore_nms_pre(self._nms_pre_changed)
+        self._fallback_active = enabled
+        print(f'fallback config {"enabled" if enabled else "disabled"}')
+
+    def _init_deployed_model(self, crop_range, max_points, tasks=None):
+        """加载 tools/deploy.py 转换后的模型, 推理与后处理接口与pytorch模型保持一致."""
+        from ros_utils.backend import DeployedModel, ORTMultiTaskDetector
+        from ros_utils.postprocess import (det2d_postprocess,
+                                           det3d_postprocess,
+                                           multi2d_postprocess,
+                                           seg2d_postprocess)
+
+        if self.task_type == 'multi2d':
+            # mmdeploy 不能解析检测以外的输出, 直接使用onnxruntime
+            assert self.backend == 'onnxruntime', \
+                'multi2d only supports the onnxruntime backend'
+            self.model = ORTMultiTaskDetector(
+                self.config, self.model_dir, device=self.device)
+            # 导出的图包含的任务是固定的, 这里只能减少输出的任务
+            if tasks is not None:
+                self.model.test_tasks &= set(tasks)
+            self.inference = self.model.inference_detector
+            self.postprocess = multi2d_postprocess
+            return
+        self.model = DeployedModel(
+            self.config, self.deploy_cfg, self.model_dir, device=self.device)
+        if self.task_type == 'det2d':
+            self.inference = self.model.inference_detector
+            self.postprocess = det2d_postprocess
+        elif self.task_type == 'seg2d':
+            self.inference = self.model.inference_segmentor
+            self.postprocess = seg2d_postprocess
+        elif self.task_type == 'det3d':
+            from mmdet3d_ext.apis import Detector3DInferencer
+
+            self._replace_det3d_pipeline(self.model.cfg, crop_range,
+                                         max_points)
+            self.inferencer = Detector3DInferencer(
+                self.model, cfg=self.model.cfg, device=self.device)
+            self.preprocess = self._det3d_preprocess
+            self.inference = self._det3d_inference
+            self.postprocess = det3d_postprocess
+
+    def _init_model_client(self, server, authkey=None):
+        """连接 tools/model_server.py 启动的推理服务, 帧通过共享内存传递."""
+        from ros_utils.postprocess import (det2d_postprocess,
+                                           det3d_postprocess,
+                                           seg2d_postprocess)
+        from ros_utils.shm import ModelClient
+
+        self.model = None
+        self.client = ModelClient(server, authkey=authkey)
+        assert self.client.info['task_type'] == self.task_type, \
+            f'model server runs a {self.client.info["task_type"]} model'
+        self.classes = self.client.info['classes']
+        self.inference = self._server_inference
+        self.postprocess = dict(
+            det2d=det2d_postprocess,
+            seg2d=seg2d_postprocess,
+            det3d=det3d_postprocess)[self.task_type]
+
+    def _server_inference(self, data):
+        from ros_utils.compact import (pointcloud2_to_arrays,
+                                       unpack_det2d_result,
+                                       unpack_det3d_result,
+                                       unpack_seg2d_result)
+
+        if self.task_type == 'det2d':
+            if isinstance(data, list):
+                return [self._server_inference(img) for img in data]
+            return unpack_det2d_result(
+                self.client.infer([data]), len(self.classes))
+        elif self.task_type == 'seg2d':
+            return unpack_seg2d_result(self.client.infer([data]))
+        elif self.task_type == 'det3d':
+            arrays, meta = pointcloud2_to_arrays(data)
+            pose = None
+            if self.pose_buffer is not None:
+                pose = self.pose_buffer.lookup(meta['stamp'])
+            return unpack_det3d_result(
+                self.client.infer(arrays, extra=(meta, pose)))
 
+    @staticmethod
+    def _replace_det3d_pipeline(cfg, crop_range=False, max_points=None):
+        """将test pipeline中从文件加载点云的transform替换为从PointCloud2加载."""
+        # 替换LoadPointsFromFile
+        test_pipeline = cfg.data.test.pipeline
+        test_pipeline[0].type = 'LoadPointsFromPointCloud2'
+        # 在解码时完成范围过滤、NaN过滤与降采样
+        if crop_range:
+            test_pipeline[0].point_cloud_range = cfg.point_cloud_range
+            test_pipeline[0].filter_nan = True
+        if max_points is not None:
+            test_pipeline[0].max_points = max_points
+        # 替换LoadPointsFromMultiSweeps, 使用最近的若干帧点云作为sweeps
+        for transform in test_pipeline:
+            if transform.type == 'LoadPointsFromMultiSweeps':
+                transform.type = 'LoadPointsFromPointCloud2MultiSweeps'
+
+    def _det3d_preprocess(self, pc):
+        pose = None
+        if self.pose_buffer is not None:
+            pose = self.pose_buffer.lookup(pc.header.stamp.to_sec())
+        if not self.metrics.enabled:
+            return self.inferencer.preprocess(pc, pose)
+        stats = {}
+        data = self.inferencer.preprocess(pc, pose, stats)
+        # 解码时 nan/range/downsample 各自丢弃的点数
+        for reason, num in stats.get('num_discarded_points', {}).items():
+            self.metrics.count(f'discarded_{reason}', num)
+        return data
+
+    def _det3d_inference(self, data):
+        # det3d_postprocess 需要同时拿到结果与pipeline的输出
+        return self.inferencer.forward(data), data
+
+    def start(self):
+        rospy.init_node('detection', anonymous=True)
+
+        # 根据消息类型的不同,确定Subscriber的消息类型
+        if self.sub_msg_type == 'img':
+            msg_type = CompressedImage if self.compressed else Image
         elif self.sub_msg_type == 'pc':
-            rospy.Subscriber(
-                self.sub_topic,
-                PointCloud2,
-                self._callback,
-                queue_size=1,
-                buff_size=2**24)
-            self.repub_publisher = rospy.Publisher(
-                self.sub_topic + '/republish', PointCloud2, queue_size=1)
+            msg_type = PointCloud2
         else:
             raise ValueError('msg_type must be img or pointcloud')
 
+        self.publishers = {}
+        self.repub_publishers = {}
+        for topic in self.sub_topics:
+            self.publishers[topic] = rospy.Publisher(
+                topic + '/detected_objects', DetectedObjectArray, queue_size=1)
+            self.repub_publishers[topic] = rospy.Publisher(
+                topic + '/republish', msg_type, queue_size=1)
+        self.publisher = self.publishers[self.sub_topic]
+        self.repub_publisher = self.repub_publishers[self.sub_topic]
+        for name in self.seg_names:
+            self.seg_publishers[name] = rospy.Publisher(
+                self.sub_topic + '/' + name,
+                CompressedImage if self.seg_format == 'png' else Image,
+                queue_size=1)
+        if self.scheduler is not None:
+            # 发布实际的处理帧率, 供下游的跟踪等模块使用
+            self.rate_publisher = rospy.Publisher(
+                self.sub_topic + '/effective_rate', Float32, queue_size=1)
+
+        if self.odom_topic is not None:
+            rospy.Subscriber(
+                self.odom_topic,
+                Odometry,
+                self.pose_buffer.callback,
+                queue_size=100)
+
+        # 先预热并启动统计与流水线, 再订阅消息
+        self.warmup()
+        self.start_workers()
+        rospy.on_shutdown(self.stop_workers)
+
+        for topic in self.sub_topics:
+            callback = partial(self._batch_callback, topic) \
+                if self.batched else self._callback
+            rospy.Subscriber(
+                topic, msg_type, callback, queue_size=1, buff_size=2**24)
+
         rospy.spin()
 
+    def start_workers(self):
+        """启动统计线程以及流水线模式下各阶段的线程, 不依赖ros master."""
+        self.metrics.start()
+        if self.batched:
+            self.batcher = MicroBatcher(
+                self.sub_topics, self._process_batch, window=self.batch_window)
+            self.batcher.start()
+        if self.staged:
+            self.pipeline = StagedPipeline([
+                ('decode', self._decode_stage),
+                ('preprocess', self._preprocess_stage),
+                ('infer', self._infer_stage),
+                ('publish', self._publish_stage),
+            ])
+            self.pipeline.start()
+        elif self.scheduler is not None:
+            # 在工作线程中处理, 回调函数只负责计数与跳帧, 不会被rospy丢弃
+            self.pipeline = StagedPipeline([('process', self._schedule)])
+            self.pipeline.start()
+
+    def stop_workers(self):
+        if self.batcher is not None:
+            self.batcher.stop()
+            print(f'dropped frames per topic: {self.batcher.dropped}')
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            print(f'dropped frames per stage: {self.pipeline.dropped_frames}')
+        if self.scheduler is not None:
+            print(f'skipped frames by scheduler: {self.scheduler.skipped}')
+        if self.client is not None:
+            self.client.close()
+        self.metrics.close()
+
     def _callback(self, msg):
-        # 1. preprocess msg
+        if self.metrics.enabled:
+            self.metrics.record('msg_age',
+                                (rospy.Time.now() - msg.header.stamp).to_sec())
+
+        if self.scheduler is not None and \
+                not self.scheduler.should_process():
+            return
+
+        if self.pipeline is not None:
+            # 只负责将msg送入流水线, 旧的未处理的帧会被丢弃
+            self.pipeline.put(msg)
+            return
+
+        self._process(msg)
+
+    def _process(self, msg):
+        item = self._decode_stage(msg)
+        item = self._preprocess_stage(item)
+        item = self._infer_stage(item)
+        self._publish_stage(item)
+
+    def _schedule(self, msg):
+        """处理一帧, 并将耗时反馈给scheduler."""
+        if self.scheduler.fallback != self._fallback_active:
+            self._apply_fallback(self.scheduler.fallback)
+        start_time = time.perf_counter()
+        self._process(msg)
+        self.scheduler.record(time.perf_counter() - start_time)
+        if self.rate_publisher is not None:
+            self.rate_publisher.publish(
+                Float32(self.scheduler.effective_rate))
+
+    def _batch_callback(self, topic, msg):
+        if self.metrics.enabled:
+            self.metrics.record('msg_age',
+                                (rospy.Time.now() - msg.header.stamp).to_sec())
+        self.batcher.put(topic, msg)
+
+    def _process_batch(self, batch):
+        """将多个topic的帧组成一个batch推理, 并将结果发布到各自的topic."""
+        topics = [topic for topic, _ in batch]
+        msgs = [msg for _, msg in batch]
+        with self.metrics.timer('decode'):
+            imgs = [
+                self._decode(msg, self.image_decoders.get(topic))
+                for topic, msg in batch
+            ]
+        with self.metrics.timer('forward'):
+            results = self.inference(imgs)
+        for topic, msg, img, result in zip(topics, msgs, imgs, results):
+            image_decoder = self.image_decoders.get(topic)
+            if image_decoder is not None:
+                result = image_decoder.rescale_det2d_result(result, img.shape)
+            self._publish(msg, result, self.publishers[topic],
+                          self.repub_publishers[topic])
+
+    def _decode(self, msg, image_decoder=None):
+        """将msg解码为模型的输入数据."""
         if self.sub_msg_type == 'img':
-            if self.compressed:
+            if image_decoder is not None:
+                data = image_decoder.decode(msg.data)
+            elif self.compressed:
                 buf = np.ndarray(
                     shape=(1, len(msg.data)), dtype=np.uint8, buffer=msg.data)
                 data = cv2.imdecode(buf, cv2.IMREAD_ANYCOLOR)
@@ -133,24 +605,64 @@ class ROSInterface:
                                                       -1)
         elif self.sub_msg_type == 'pc':
             data = msg
+        return data
+
+    def _decode_stage(self, msg):
+        """1. preprocess msg, 将msg解码为模型的输入数据."""
+        with self.metrics.timer('decode'):
+            data = self._decode(msg, self.image_decoders.get(self.sub_topic))
+        return msg, data
+
+    def _preprocess_stage(self, item):
+        """2. 模型推理前的预处理, 例如det3d的test pipeline."""
+        msg, data = item
+        if self.preprocess is not None:
+            with self.metrics.timer('pipeline'):
+                data = self.preprocess(data)
+        return msg, data
 
-        # 2. inference
-        start_time = time.time()
-        result = self.inference(self.model, data)
-        end_time = time.time()
-        print(f'inference time: {end_time - start_time}')
+    def _infer_stage(self, item):
+        """3. inference."""
+        msg, data = item
+        with self.metrics.timer('forward'):
+            result = self.inference(data)
+        image_decoder = self.image_decoders.get(self.sub_topic)
+        if image_decoder is not None:
+            # 缩小分辨率解码的图像, 检测结果需要转换回原始图像的坐标
+            result = image_decoder.rescale_det2d_result(result, data.shape)
+        return msg, result
 
-        # 3. postprocess
-        result = self.postprocess(result, self.score_thr, self.model.CLASSES,
-                                  msg.header.frame_id)
+    def _publish_stage(self, item):
+        """4. postprocess and publish result."""
+        msg, result = item
+        self._publish(msg, result, self.publisher, self.repub_publisher)
 
-        # 4. publish result
-        # 4.1 publish result
-        self.publisher.publish(result)
-        # 4.2 republish msg
-        if self.republish:
-            msg.header.stamp = rospy.Time.now()
-            self.repub_publisher.publish(msg)
+    def _publish(self, msg, result, publisher, repub_publisher):
+        with self.metrics.timer('postprocess'):
+            result = self.postprocess(result, self.score_thr, self.classes,
+                                      msg.header.frame_id)
+        seg_msgs = {}
+        if isinstance(result, tuple):
+            # seg2d 与多任务模型同时输出分割结果
+            result, seg_msgs = result
+            if not isinstance(seg_msgs, dict):
+                seg_msgs = dict(segmentation=seg_msgs)
+
+        if self.metrics.enabled:
+            # 从传感器时间戳到结果发布的端到端延迟
+            self.metrics.record('e2e',
+                                (rospy.Time.now() - msg.header.stamp).to_sec())
+        with self.metrics.timer('publish'):
+            # 4.1 publish result
+            publisher.publish(result)
+            for name, seg_msg in seg_msgs.items():
+                if seg_msg is not None and name in self.seg_publishers:
+                    self.seg_publishers[name].publish(seg_msg)
+            # 4.2 republish msg
+            if self.republish:
+                msg.header.stamp = rospy.Time.now()
+                repub_publisher.publish(msg)
+        self.metrics.frame_done()
 
 
 def parse_args():
@@ -163,9 +675,45 @@ def parse_args():
     parser.add_argument(
         '--device', default='cuda:0', help='Device used for inference')
     parser.add_argument(
-        '--task_type', type=str, help='task type, det2d or seg2d or det3d')
+        '--task_type',
+        type=str,
+        help='task type, det2d or seg2d or det3d, or multi2d for multi-task '
+        'detectors like YOLOPV2')
+    parser.add_argument(
+        '--backend',
+        default='pytorch',
+        choices=['pytorch', 'onnxruntime', 'tensorrt', 'sdk'],
+        help='inference backend, the non pytorch backends load the model '
+        'converted by tools/deploy.py from model_dir')
+    parser.add_argument(
+        '--deploy_cfg',
+        default=None,
+        help='deploy config used by tools/deploy.py, needed by the '
+        'onnxruntime and tensorrt backends')
+    parser.add_argument(
+        '--model_dir', default=None, help='work-dir of tools/deploy.py')
+    parser.add_argument(
+        '--server',
+        default=None,
+        help='unix socket of tools/model_server.py, the model is loaded by '
+        'the server process and shared by all nodes')
+    parser.add_argument(
+        '--server_authkey',
+        default=None,
+        help='authkey of tools/model_server.py, read from the '
+        'ADMLOPS_MODEL_SERVER_AUTHKEY environment variable if not set')
     # about ros
-    parser.add_argument('--sub_topic', help="msg's rostopic")
+    parser.add_argument(
+        '--sub_topic',
+        nargs='+',
+        help="msg's rostopic, frames of multiple topics are inferred in a "
+        'batch, only for det2d')
+    parser.add_argument(
+        '--batch_window',
+        type=float,
+        default=0.02,
+        help='max seconds to wait for the frames of other topics after the '
+        'first frame of a batch arrives')
     parser.add_argument('--sub_msg_type', type=str, help='msg type, img or pc')
     parser.add_argument(
         '--republish',
@@ -173,12 +721,133 @@ def parse_args():
         help='if republish the original msg')
     parser.add_argument(
         '--compressed', action='store_true', help='if compressed image')
+    parser.add_argument(
+        '--reduced_decode',
+        action='store_true',
+        help='decode compressed jpeg at 1/2, 1/4 or 1/8 scale when the test '
+        'pipeline resizes it smaller anyway, only for det2d')
+    parser.add_argument(
+        '--staged',
+        action='store_true',
+        help='run decode, preprocess, inference and publish in separate '
+        'threads, stale frames are dropped')
+    parser.add_argument(
+        '--odom_topic',
+        default=None,
+        help='nav_msgs/Odometry topic of the lidar pose, used to compensate '
+        'the ego-motion of multi-sweep point clouds')
+    parser.add_argument(
+        '--crop_range',
+        action='store_true',
+        help='discard NaN points and points out of the point_cloud_range of '
+        'the config while decoding PointCloud2')
+    parser.add_argument(
+        '--max_points',
+        type=int,
+        default=None,
+        help='randomly keep at most max_points points while decoding')
+    # about seg2d output
+    parser.add_argument(
+        '--seg_downsample',
+        type=int,
+        default=4,
+        help='downsample factor of the published seg2d label map')
+    parser.add_argument(
+        '--seg_format',
+        default='label_map',
+        choices=['label_map', 'png', 'none'],
+        help='publish the seg2d label map as a mono8 Image, a png '
+        'CompressedImage or not at all')
+    parser.add_argument(
+        '--seg_polygon_classes',
+        nargs='*',
+        default=[],
+        help='classes whose contours are published as polygons, e.g. the '
+        'drivable area')
+    parser.add_argument(
+        '--tasks',
+        nargs='+',
+        default=None,
+        choices=['bbox', 'drivable', 'lane'],
+        help='tasks of the multi2d model to run, the heads of the other '
+        'tasks are skipped')
+    parser.add_argument(
+        '--seg_output',
+        default=None,
+        choices=['full', 'native_label', 'native_logit'],
+        help='resolution of the multi2d masks, the native ones are kept at '
+        'the stride of the heads and only interpolated to the published size')
+    # about scheduler
+    parser.add_argument(
+        '--latency_budget',
+        type=float,
+        default=None,
+        help='latency budget in seconds of a frame, usually the sensor '
+        'period, frames are skipped deterministically when exceeded')
+    parser.add_argument(
+        '--fallback_scale',
+        type=float,
+        default=None,
+        help='scale the img_scale of the test pipeline by this factor when '
+        'the latency budget is exceeded, only for det2d and seg2d')
+    parser.add_argument(
+        '--fallback_nms_pre',
+        type=int,
+        default=None,
+        help='nms_pre of the heads when the latency budget is exceeded')
+    # about warmup
+    parser.add_argument(
+        '--warmup',
+        type=int,
+        default=0,
+        help='number of synthetic frames run before subscribing')
+    parser.add_argument(
+        '--warmup_shape',
+        type=int,
+        nargs='+',
+        default=None,
+        help='shape of the synthetic frames, height and width of images or '
+        'number of points of point clouds')
+    # about metrics
+    parser.add_argument(
+        '--metrics',
+        action='store_true',
+        help='record per stage latency and report p50/p95/p99 and fps')
+    parser.add_argument(
+        '--metrics_interval',
+        type=float,
+        default=5.0,
+        help='interval in seconds between two metrics reports')
+    parser.add_argument(
+        '--metrics_log', default=None, help='file to append the reports to')
+    parser.add_argument(
+        '--metrics_file',
+        default=None,
+        help='file to write the metrics to in prometheus text format')
+    parser.add_argument(
+        '--metrics_port',
+        type=int,
+        default=None,
+        help='port to serve the metrics in prometheus text format')
+    parser.add_argument(
+        '--metrics_host',
+        default='127.0.0.1',
+        help='address the metrics port binds to, set 0.0.0.0 to expose it '
+        'to other hosts')
     args = parser.parse_args()
     return args
 
 
 def main():
     args = parse_args()
+    metrics = None
+    if args.metrics:
+        metrics = LatencyMetrics(
+            interval=args.metrics_interval,
+            log_file=args.metrics_log,
+            prom_file=args.metrics_file,
+            http_port=args.metrics_port,
+            http_host=args.metrics_host)
     ros_interface = ROSInterface(
         config=args.config,
         checkpoint=args.checkpoint,
@@ -189,8 +858,30 @@ def main():
         sub_msg_type=args.sub_msg_type,
         republish=args.republish,
         compressed=args.compressed,
+        staged=args.staged,
+        metrics=metrics,
+        odom_topic=args.odom_topic,
+        crop_range=args.crop_range,
+        max_points=args.max_points,
+        backend=args.backend,
+        deploy_cfg=args.deploy_cfg,
+        model_dir=args.model_dir,
+        reduced_decode=args.reduced_decode,
+        batch_window=args.batch_window,
+        server=args.server,
+        server_authkey=args.server_authkey,
+        latency_budget=args.latency_budget,
+        fallback_scale=args.fallback_scale,
+        fallback_nms_pre=args.fallback_nms_pre,
+        seg_downsample=args.seg_downsample,
+        seg_format=args.seg_format,
+        seg_polygon_classes=args.seg_polygon_classes,
+        tasks=args.tasks,
+        seg_output=args.seg_output,
+        warmup=args.warmup,
+        warmup_shape=args.warmup_shape,
     )
-    print('---waiting for topic %s msgs---:' % args.sub_topic)
+    print('---waiting for topic %s msgs---:' % ', '.join(args.sub_topic))
     ros_interface.start()
 
 